@@ -1,93 +1,199 @@
-import csv
-import math
-import matplotlib.pyplot as plt
+import argparse
+import glob
 import os
-import shutil
-
-
-def load_data(file_path):
-    ax, ay, az = [], [], []
-    with open(file_path, 'r') as f:
-        reader = csv.reader(f)
-        headers = next(reader)
-        headers = [h.strip().lower() for h in headers]
-
-        # X, Y, Z kolonlarını bul
-        x_idx = next((i for i, h in enumerate(headers) if 'x' in h), None)
-        y_idx = next((i for i, h in enumerate(headers) if 'y' in h), None)
-        z_idx = next((i for i, h in enumerate(headers) if 'z' in h and 'abs' not in h), None)
-
-        if None in (x_idx, y_idx, z_idx):
-            raise ValueError(f"Cannot find X/Y/Z columns in {file_path}. Found: {headers}")
-
-        for row in reader:
-            try:
-                fx = float(row[x_idx])
-                fy = float(row[y_idx])
-                fz = float(row[z_idx])
-                ax.append(fx)
-                ay.append(fy)
-                az.append(fz)
-            except (ValueError, IndexError):
-                continue
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-    # Magnitude (Amplitude)
-    magnitude = [math.sqrt(x**2 + y**2 + z**2) for x, y, z in zip(ax, ay, az)]
-    return ax, ay, az, magnitude
-
-
-def plot_magnitude(name, magnitude):
-    plt.figure(figsize=(10,4))
-    plt.plot(magnitude[:1000], label="Amplitude (√x²+y²+z²)", color='black')
-    plt.title(f"{name.capitalize()} - Acceleration Magnitude")
-    plt.xlabel("Sample Index (Time)")
-    plt.ylabel("Acceleration (m/s²)")
-    plt.legend()
-    plt.grid(True)
-    plt.savefig(f"{name}_plot.png")
-    plt.close()
-
-
-def plot_combined(name, ax, ay, az, magnitude):
-    plt.figure(figsize=(10,5))
-    plt.plot(ax[:1000], label='X-axis', alpha=0.7)
-    plt.plot(ay[:1000], label='Y-axis', alpha=0.7)
-    plt.plot(az[:1000], label='Z-axis', alpha=0.7)
-    plt.plot(magnitude[:1000], label='Amplitude', color='black', linewidth=2)
-    plt.title(f"{name.capitalize()} - X, Y, Z and Total Acceleration")
-    plt.xlabel("Sample Index (Time)")
-    plt.ylabel("Acceleration (m/s²)")
-    plt.legend()
-    plt.grid(True)
-    plt.savefig(f"{name}_combined_plot.png")
-    plt.close()
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
+# Ortak CSV yükleyici ve önbellek (imucommon) bir üst klasörde
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from imucommon.columnar import vectorMagnitude
+from imucommon.reccache import loadColumns
+from imucommon.plotting import renderLinePlot
+from imucommon.resultfiles import OUTPUT_FORMATS, outputPath, writeTable
 
-def compute_stats(data):
-    n = len(data)
-    mean = sum(data)/n
-    var = sum((x - mean)**2 for x in data)/n
-    std = math.sqrt(var)
-    return mean, std, max(data), min(data)
+DEFAULT_ACTIVITIES = ["standing", "sitting", "walking", "running"]
+DEFAULT_FS = 100.0
 
+# Özellik tablosunun kolonları: (isim, CSV formatı, dtype)
+FEATURE_LAYOUT = (("activity", "s", "<U64"), ("window", "d", "<i8"), ("start_s", ".3f", "<f8"),
+                  ("mean", ".6f", "<f8"), ("std", ".6f", "<f8"), ("min", ".6f", "<f8"), ("max", ".6f", "<f8"),
+                  ("energy", ".6f", "<f8"), ("dominant_freq_hz", ".4f", "<f8"), ("zcr", ".6f", "<f8"))
 
-activities = ["standing", "sitting", "walking", "running"]
 
-for act in activities:
-    file_path = f"data/{act}.csv"
-    ax, ay, az, magnitude = load_data(file_path)
+def load_data(file_path, use_cache=True, as_array=False):
+    # Binary önbellek (.imucache) varsa CSV tekrar okunmaz
+    table = loadColumns(file_path, useCache=use_cache)
+    headers = [h.strip().lower() for h in table["headers"]]
 
-    plot_magnitude(act, magnitude)
-    plot_combined(act, ax, ay, az, magnitude)
+    # X, Y, Z kolonlarını bul
+    x_idx = next((i for i, h in enumerate(headers) if 'x' in h), None)
+    y_idx = next((i for i, h in enumerate(headers) if 'y' in h), None)
+    z_idx = next((i for i, h in enumerate(headers) if 'z' in h and 'abs' not in h), None)
 
-    mean, std, maxv, minv = compute_stats(magnitude)
-    print(f"{act}: mean={mean:.2f}, std={std:.2f}, max={maxv:.2f}, min={minv:.2f}")
+    if None in (x_idx, y_idx, z_idx):
+        raise ValueError(f"Cannot find X/Y/Z columns in {file_path}. Found: {headers}")
 
-output_dir = "outputs"
-os.makedirs(output_dir, exist_ok=True)
+    ax, ay, az = (table["columns"][i] for i in (x_idx, y_idx, z_idx))
 
-for file in os.listdir():
-    if file.endswith(".png"):
-        shutil.move(file, os.path.join(output_dir, file))
+    # Magnitude (Amplitude)
+    magnitude = vectorMagnitude(ax, ay, az)
+    if as_array:
+        return ax, ay, az, magnitude
+    return ax.tolist(), ay.tolist(), az.tolist(), magnitude.tolist()
+
+
+def sampling_rate(file_path, fallback=DEFAULT_FS, use_cache=True):
+    # Zaman kolonu varsa örnekleme frekansı ardışık zaman farklarının medyanından bulunur
+    table = loadColumns(file_path, useCache=use_cache)
+    time_idx = next((i for i, h in enumerate(table["headers"]) if 'time' in h.strip().lower()), None)
+    if time_idx is None or table["rows"] < 2:
+        return fallback
+    steps = np.diff(table["columns"][time_idx])
+    steps = steps[steps > 0]
+    return float(1.0 / np.median(steps)) if steps.size else fallback
+
+
+def plot_magnitude(name, magnitude, output_dir="."):
+    return renderLinePlot(os.path.join(output_dir, f"{name}_plot.png"),
+                          [{"y": magnitude[:1000], "label": "Amplitude (√x²+y²+z²)", "color": 'black'}],
+                          title=f"{name.capitalize()} - Acceleration Magnitude",
+                          xlabel="Sample Index (Time)", ylabel="Acceleration (m/s²)",
+                          figsize=(10,4), grid=True)
+
+
+def plot_combined(name, ax, ay, az, magnitude, output_dir="."):
+    return renderLinePlot(os.path.join(output_dir, f"{name}_combined_plot.png"),
+                          [{"y": ax[:1000], "label": 'X-axis', "alpha": 0.7},
+                           {"y": ay[:1000], "label": 'Y-axis', "alpha": 0.7},
+                           {"y": az[:1000], "label": 'Z-axis', "alpha": 0.7},
+                           {"y": magnitude[:1000], "label": 'Amplitude', "color": 'black', "linewidth": 2}],
+                          title=f"{name.capitalize()} - X, Y, Z and Total Acceleration",
+                          xlabel="Sample Index (Time)", ylabel="Acceleration (m/s²)",
+                          figsize=(10,5), grid=True)
 
-print(f"\n All plots have moved to '{output_dir}/' successfully.")
+
+def compute_stats(data):
+    # Tek numpy geçişleri: ortalama, (popülasyon) standart sapma, maksimum ve minimum
+    data = np.asarray(data, dtype=np.float64)
+    return float(data.mean()), float(data.std()), float(data.max()), float(data.min())
+
+
+def window_features(signal, fs, window_size, step=None):
+    # Sabit uzunluklu pencereler (kopyasız görünüm), step verilmezse pencereler üst üste binmez
+    signal = np.asarray(signal, dtype=np.float64)
+    window_size = int(window_size)
+    step = int(step) if step else window_size
+    if window_size < 2 or step < 1:
+        raise ValueError(f"Window size must be >= 2 samples and step >= 1, got {window_size} and {step}")
+    if signal.size < window_size:
+        windows = np.empty((0, window_size))
+    else:
+        windows = sliding_window_view(signal, window_size)[::step]
+
+    mean = windows.mean(axis=1)
+    centered = windows - mean[:, None]
+
+    # Baskın frekans: DC bileşeni hariç en büyük FFT genliğinin frekansı
+    spectrum = np.abs(np.fft.rfft(centered, axis=1))
+    spectrum[:, 0] = 0.0
+    dominant = np.argmax(spectrum, axis=1) * (fs / window_size) if windows.shape[0] else np.empty(0)
+
+    # Sıfır geçiş oranı: ortalaması çıkarılmış sinyalin örnek başına işaret değişimi
+    signs = np.signbit(centered)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (window_size - 1)
+
+    return {
+        "window": np.arange(windows.shape[0]),
+        "start_s": np.arange(windows.shape[0]) * step / fs,
+        "mean": mean,
+        "std": np.sqrt(np.einsum("ij,ij->i", centered, centered) / window_size),
+        "min": windows.min(axis=1) if windows.shape[0] else np.empty(0),
+        "max": windows.max(axis=1) if windows.shape[0] else np.empty(0),
+        "energy": np.einsum("ij,ij->i", windows, windows) / window_size,
+        "dominant_freq_hz": dominant,
+        "zcr": zcr,
+    }
+
+
+def extract_features(file_path, activity=None, output_dir="outputs", window_seconds=2.0, step_seconds=None, fs=None, plots=True, use_cache=True):
+    # Tek bir aktivite dosyası: yükleme, genel istatistikler, pencere özellikleri ve grafikler
+    # store://cihaz/oturum?start=&end= kaynaklarında etiket oturum adıdır
+    activity = activity or os.path.splitext(os.path.basename(file_path.split("?")[0]))[0]
+    ax, ay, az, magnitude = load_data(file_path, use_cache=use_cache, as_array=True)
+    rate = fs or sampling_rate(file_path, use_cache=use_cache)
+    features = window_features(magnitude, rate, round(window_seconds * rate), round(step_seconds * rate) if step_seconds else None)
+
+    # Grafikler doğrudan çıktı klasörüne yazılır
+    plot_paths = []
+    if plots:
+        os.makedirs(output_dir, exist_ok=True)
+        plot_paths = [plot_magnitude(activity, magnitude, output_dir), plot_combined(activity, ax, ay, az, magnitude, output_dir)]
+
+    return {
+        "activity": activity,
+        "file": file_path,
+        "fs": rate,
+        "samples": int(magnitude.size),
+        "stats": compute_stats(magnitude) if magnitude.size else None,
+        "features": features,
+        "plots": plot_paths,
+    }
+
+
+def extract_all(file_paths, workers=None, **options):
+    # Dosyalar paralel işlenir (her dosya ayrı bir süreçte), sonuçlar giriş sırasıyla döner
+    run = partial(extract_features, **options)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(file_paths)))
+    if workers == 1:
+        return [run(path) for path in file_paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, file_paths))
+
+
+def write_feature_table(results, path, output_format="csv"):
+    # Tüm dosyaların pencereleri tek tabloda: her satır bir pencere, 'activity' kolonu etiket olarak kullanılır
+    columns = [np.concatenate([np.full(len(r["features"]["window"]), r["activity"]) for r in results]) if results else np.empty(0, dtype="<U64")]
+    for name, _, _ in FEATURE_LAYOUT[1:]:
+        columns.append(np.concatenate([r["features"][name] for r in results]) if results else np.empty(0))
+    return writeTable(path, output_format, FEATURE_LAYOUT, columns, {"kind": "features", "files": [r["file"] for r in results], "fs": [r["fs"] for r in results]})
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Part 1 - activity feature extraction (windowed features and plots per recording)")
+    ap.add_argument("files", nargs="*", help="Activity CSV files, globs or store://device/session?start=&end= sources (default: data/standing, sitting, walking and running .csv); the file (session) name is the activity label")
+    ap.add_argument("--out", default="outputs", help="Output folder for the plots and the feature table (default: outputs)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: all cores)")
+    ap.add_argument("--window", type=float, default=2.0, help="Window length in seconds (default=2)")
+    ap.add_argument("--step", type=float, default=None, help="Window step in seconds (default: the window length, no overlap)")
+    ap.add_argument("--fs", type=float, default=None, help="Sampling rate (Hz). If omitted, it is taken from the time column (or 100)")
+    ap.add_argument("--out-format", choices=OUTPUT_FORMATS, default="csv", help="Feature table format: 'csv', 'npz' or 'bin'")
+    ap.add_argument("--no-plot", action="store_true", help="Skip the two plots per recording")
+    ap.add_argument("--no-cache", action="store_true", help="Always parse the CSV instead of using its binary .imucache sidecar")
+    args = ap.parse_args(argv)
+
+    file_paths = [path for pattern in args.files for path in (sorted(glob.glob(pattern)) or [pattern]) if not path.endswith(".imucache")]
+    if not file_paths:
+        file_paths = [f"data/{act}.csv" for act in DEFAULT_ACTIVITIES]
+
+    results = extract_all(file_paths, workers=args.workers, output_dir=args.out, window_seconds=args.window, step_seconds=args.step, fs=args.fs,
+                          plots=not args.no_plot, use_cache=not args.no_cache)
+    for result in results:
+        if result["stats"] is None:
+            print(f"{result['activity']}: no samples")
+            continue
+        mean, std, maxv, minv = result["stats"]
+        print(f"{result['activity']}: mean={mean:.2f}, std={std:.2f}, max={maxv:.2f}, min={minv:.2f}")
+
+    os.makedirs(args.out, exist_ok=True)
+    table_path = write_feature_table(results, outputPath(args.out, "features", args.out_format), args.out_format)
+    print(f"\n Feature table ({sum(len(r['features']['window']) for r in results)} windows): {table_path}")
+    if not args.no_plot:
+        print(f" All plots have been written to '{args.out}/' successfully.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+
+# Ortak modüller (imucommon) bir üst klasörde
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from imucommon.activity import DEFAULT_MODEL_PATH, DEFAULT_WINDOW_SECONDS, activityFeatures, evaluateModel, saveModel, trainModel, windowSamples, windowStats
+from inspect_data import DEFAULT_ACTIVITIES, load_data, sampling_rate
+
+
+def recording_features(file_path, window_seconds, holdout=0.0, fs=None, use_cache=True):
+    # Kayıt zamanda ikiye bölünür: ilk kısım eğitim, son 'holdout' oranı test için (pencereler sınırı aşmaz)
+    _, _, _, magnitude = load_data(file_path, use_cache=use_cache, as_array=True)
+    window_size = windowSamples(window_seconds, fs or sampling_rate(file_path, use_cache=use_cache))
+    split = int(round(magnitude.size * (1.0 - holdout)))
+    train = activityFeatures(windowStats(magnitude[:split], window_size))
+    test = activityFeatures(windowStats(magnitude[split:], window_size))
+    return train, test
+
+
+def print_confusion(evaluation):
+    classes = evaluation["classes"]
+    width = max(len(c) for c in classes) + 2
+    print(" " * width + "".join(c.rjust(width) for c in classes))
+    for label, row in zip(classes, evaluation["confusion"]):
+        print(label.ljust(width) + "".join(str(v).rjust(width) for v in row))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Part 1 - trains and evaluates the windowed activity classifier (imucommon/activity.py)")
+    ap.add_argument("files", nargs="*", help="Labelled recordings or globs, the file name is the activity (default: data/standing, sitting, walking and running .csv)")
+    ap.add_argument("--window", type=float, default=DEFAULT_WINDOW_SECONDS, help="Window length in seconds (default=2)")
+    ap.add_argument("--holdout", type=float, default=0.3, help="Last part of every recording kept for the evaluation (default=0.3)")
+    ap.add_argument("--fs", type=float, default=None, help="Sampling rate (Hz). If omitted, it is taken from the time column")
+    ap.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Where to save the model trained on all windows (default: imucommon/activity_model.json)")
+    ap.add_argument("--no-save", action="store_true", help="Only evaluate, do not write the model")
+    args = ap.parse_args(argv)
+    if not 0.0 < args.holdout < 1.0:
+        ap.error("--holdout must be between 0 and 1")
+
+    file_paths = [path for pattern in args.files for path in (sorted(glob.glob(pattern)) or [pattern]) if not path.endswith(".imucache")]
+    if not file_paths:
+        file_paths = [f"data/{act}.csv" for act in DEFAULT_ACTIVITIES]
+
+    # 1) Pencere özellikleri: aynı etiketli kayıtlar birleştirilir
+    train_sets, test_sets, all_sets = {}, {}, {}
+    for file_path in file_paths:
+        activity = os.path.splitext(os.path.basename(file_path))[0]
+        train, test = recording_features(file_path, args.window, args.holdout, args.fs)
+        train_sets[activity] = np.concatenate([train_sets[activity], train]) if activity in train_sets else train
+        test_sets[activity] = np.concatenate([test_sets[activity], test]) if activity in test_sets else test
+    for activity in train_sets:
+        all_sets[activity] = np.concatenate([train_sets[activity], test_sets[activity]])
+
+    # 2) Eğitim kısmıyla eğitip test kısmında değerlendirme
+    evaluation = evaluateModel(trainModel(train_sets, args.window), {a: f for a, f in test_sets.items() if len(f)})
+    print(f"Held-out evaluation (last {args.holdout:.0%} of every recording, {evaluation['windows']} windows of {args.window:g} s):")
+    print_confusion(evaluation)
+    print(f"Accuracy: {evaluation['accuracy']:.3f}")
+
+    # 3) Son model tüm pencerelerle eğitilir
+    if not args.no_save:
+        model = trainModel(all_sets, args.window)
+        model["evaluation"] = {"holdout": args.holdout, "accuracy": evaluation["accuracy"], "confusion": evaluation["confusion"]}
+        print(f"\n Saved model ({sum(model['windows'].values())} windows): {saveModel(model, args.model)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,15 @@
 # main.py: Running part of the Part 2 and saves all results in /outputs folder!
 import argparse
 import os
-import csv
-import matplotlib.pyplot as plt
 
 # Local Imports:
-from modules.stepcounter import processFile
+from modules.cadence import CADENCE_LAYOUT, CADENCE_METHODS, cadenceColumns
+from modules.stepcounter import processFile, saveSteps, stepsMeta
+from modules.filters import FILTER_ENGINES
+from modules.peaks import PEAK_MODES
+from imucommon.plotting import renderLinePlot
+from imucommon.profiling import PROFILE_FORMATS, StageProfiler, writeProfile
+from imucommon.resultfiles import OUTPUT_FORMATS, outputPath, writeTable
 
 def main():
     # 1) Parsing of the command-line arguments!
@@ -13,69 +17,144 @@ def main():
     ap.add_argument("--file", required=True, help="Path to walking.csv file")
     ap.add_argument("--fs", type=int, default=50, help="Sampling rate (Hz)")
     ap.add_argument("--threshold", default="auto",
-                    help="Threshold value or 'auto' (mean + k*std)")
+                    help="Threshold value, 'auto' (mean + k*std) or 'window:<seconds>' (mean + k*std over the last <seconds>)")
     ap.add_argument("--k-auto", type=float, default=0.8,
                     help="Multiplier for auto threshold (default=0.8)")
     ap.add_argument("--min-gap-ms", type=int, default=350,
                     help="Minimum gap between peaks in ms (default=350)")
+    ap.add_argument("--peak-mode", choices=PEAK_MODES, default="refractory",
+                    help="Close peaks: 'refractory' (first peak wins) or 'merge' (strongest peak wins)")
+    ap.add_argument("--engine", choices=FILTER_ENGINES, default="list",
+                    help="Filter engine: 'list' (pure Python) or 'numpy' (array-backed, faster)")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="Always parse the CSV instead of using its binary .imucache sidecar")
+    ap.add_argument("--chunk-size", type=int, default=None, metavar="N",
+                    help="Out-of-core mode for recordings larger than memory: process N samples at a time and stream steps.csv (no --plot)")
+    ap.add_argument("--skip-stationary", action="store_true",
+                    help="Label 2 s windows by activity (imucommon/activity.py) and skip peak detection where the user is standing or sitting")
+    ap.add_argument("--activity-model", default=None, metavar="PATH",
+                    help="Activity model for --skip-stationary (default: imucommon/activity_model.json, see Part1_FeatureAnalysis/train_activity.py)")
+    ap.add_argument("--cadence", choices=CADENCE_METHODS, default=None,
+                    help="Also estimate the cadence per 8 s window (2 s hop) from the spectrum or autocorrelation of the magnitude and save cadence.csv, cross-checked with the detected steps")
+    ap.add_argument("--cadence-only", action="store_true",
+                    help="Fast path with --cadence: skip the filters and peak detection, the step count is the one the cadence series adds up to (no steps file, no --plot)")
     ap.add_argument("--plot", action="store_true",
                     help="If set, saves steps_detected.png in outputs/ folder")
+    ap.add_argument("--out-format", choices=OUTPUT_FORMATS, default="csv",
+                    help="Steps file format: 'csv' (default), 'npz' (numpy archive) or 'bin' (binary table with a JSON header, see imucommon/resultfiles.py)")
+    ap.add_argument("--profile", default=None, metavar="PATH",
+                    help="Write per-stage wall/CPU time, sample counts and allocation peaks to PATH")
+    ap.add_argument("--profile-format", choices=PROFILE_FORMATS, default="json",
+                    help="Profile file format: 'json' or 'chrome' (trace event format for chrome://tracing / Perfetto)")
+    ap.add_argument("--profile-no-memory", action="store_true",
+                    help="Skip allocation tracking (tracemalloc) while profiling, which makes the timings closer to an unprofiled run")
     args = ap.parse_args()
+    if args.chunk_size is not None and args.out_format == "npz":
+        ap.error("--out-format npz needs the whole recording, use csv or bin with --chunk-size")
+    if args.chunk_size is not None and args.skip_stationary:
+        ap.error("--skip-stationary needs the whole recording and cannot be combined with --chunk-size")
+    if args.cadence is not None and args.chunk_size is not None:
+        ap.error("--cadence needs the whole recording and cannot be combined with --chunk-size")
+    if args.cadence_only and args.cadence is None:
+        ap.error("--cadence-only needs --cadence spectrum or --cadence autocorr")
+    profiler = StageProfiler(enabled=bool(args.profile), traceMemory=not args.profile_no_memory, label=args.file)
+    steps_csv_path = outputPath("outputs", "steps", args.out_format)
 
-    # 2) Executing of the full step counting pipeline!
+    # 2) Creating of the output directory, chunked runs write steps.csv while they go
+    os.makedirs("outputs", exist_ok=True)
+
+    # 3) Executing of the full step counting pipeline!
     result = processFile(
         csvPath=args.file,
         samplingFrequency=args.fs,
         thresholdMode=args.threshold,
         sensitivityFactor=args.k_auto,
         minGapMiliseconds=args.min_gap_ms,
+        filterEngine=args.engine,
+        useCache=not args.no_cache,
+        profiler=profiler,
+        peakMode=args.peak_mode,
+        chunkSize=args.chunk_size,
+        stepsPath=steps_csv_path if args.chunk_size is not None else None,
+        stepsFormat=args.out_format,
+        skipStationary=args.skip_stationary,
+        activityModel=args.activity_model,
+        cadenceMethod=args.cadence,
+        cadenceOnly=args.cadence_only,
     )
 
-    # 3) Creating of the output directory
-    os.makedirs("outputs", exist_ok=True)
+    # 4) Saving of detected step data as steps.csv and of the cadence series as cadence.csv
+    if args.chunk_size is None and not args.cadence_only:
+        with profiler.stage("save_steps", samples=result["steps"]):
+            saveSteps(result["peaks"], args.fs, steps_csv_path, args.out_format,
+                      stepsMeta(args.file, args.fs, args.threshold, args.k_auto, args.min_gap_ms, args.peak_mode), result["gait"])
+    if not args.cadence_only:
+        print(f" Saved: {steps_csv_path}")
+    cadence = result["cadence"]
+    if cadence is not None:
+        cadencePath = writeTable(outputPath("outputs", "cadence", args.out_format), args.out_format, CADENCE_LAYOUT, cadenceColumns(cadence, cadence.get("peak_cadence_spm")),
+                                 {"kind": "cadence", "source": args.file, "fs": args.fs, "method": cadence["method"], "window_s": cadence["window_s"], "hop_s": cadence["hop_s"]})
+        print(f" Saved: {cadencePath}")
 
-    # 4) Saving of detected step data as steps.csv
-    steps_csv_path = os.path.join("outputs", "steps.csv")
-    with open(steps_csv_path, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["step_index", "time_s"])
-        for idx in result["peaks"]:
-            t = idx / args.fs if args.fs > 0 else idx
-            writer.writerow([idx, f"{t:.3f}"])
-    print(f" Saved: {steps_csv_path}")
-
-    # 5) Plotting and saving of the filtered signal and detected steps!
-    if args.plot and result["signal"]:
-        plt.figure(figsize=(10, 4))
-        plt.plot(result["signal"], label="Filtered Signal", linewidth=1)
-        plt.axhline(result["threshold"], color="green", linestyle="--",
-                    label=f"Threshold ({result['threshold']:.2f})")
-        if result["peaks"]:
-            plt.scatter(result["peaks"],
-                        [result["signal"][i] for i in result["peaks"]],
-                        color="red", s=20, label="Detected Steps")
-        plt.title("Step Detection Result")
-        plt.xlabel("Sample Index")
-        plt.ylabel("Magnitude (filtered)")
-        plt.legend()
-        plt.tight_layout()
-        plt.savefig("outputs/steps_detected.png", dpi=160)
-        plt.close()
-        print(" Saved: outputs/steps_detected.png")
+    # 5) Plotting and saving of the filtered signal and detected steps (the chunked mode and the cadence-only mode keep no signal to plot)!
+    if args.plot and result["signal"] is None:
+        print(f" Skipped plot: --plot is not available with {'--cadence-only' if args.cadence_only else '--chunk-size'}")
+    elif args.plot and len(result["signal"]) > 0:
+        with profiler.stage("plot", samples=len(result["signal"])):
+            points = []
+            if result["peaks"]:
+                points.append({"x": result["peaks"], "y": [result["signal"][i] for i in result["peaks"]],
+                               "color": "red", "s": 20, "label": "Detected Steps"})
+            lines, hlines = [{"y": result["signal"], "label": "Filtered Signal", "linewidth": 1}], []
+            if result["threshold_series"] is not None:
+                lines.append({"y": result["threshold_series"], "color": "green", "linestyle": "--", "label": "Windowed Threshold"})
+            else:
+                hlines.append({"y": result["threshold"], "color": "green", "linestyle": "--", "label": f"Threshold ({result['threshold']:.2f})"})
+            renderLinePlot("outputs/steps_detected.png",
+                           lines=lines,
+                           hlines=hlines,
+                           points=points,
+                           title="Step Detection Result", xlabel="Sample Index", ylabel="Magnitude (filtered)",
+                           figsize=(10, 4), dpi=160, tightLayout=True)
+            print(" Saved: outputs/steps_detected.png")
 
     # ---- Print summary ----
     print("\n********** Step Count Summary **********")
     print(f"File              : {args.file}")
     print(f"Sampling Rate (fs): {args.fs} Hz")
-    print(f"Threshold used    : {result['threshold']:.2f}")
-    print(f"Steps Detected    : {result['steps']}")
+    if result["threshold"] is not None:
+        print(f"Threshold used    : {result['threshold']:.2f}{' (windowed, mean)' if str(args.threshold).startswith('window') else ''}")
+    print(f"Steps Detected    : {result['steps']}{' (from the cadence series)' if args.cadence_only else ''}")
+    print(f"Rejected rows     : {result['rejected_rows']}")
+    if result["activity"] is not None:
+        stationarySegments = sum(1 for _, _, label in result["activity"]["segments"] if label in result["activity"]["stationary"])
+        print(f"Stationary skipped: {result['activity']['stationary_samples'] / args.fs:.1f} s in {stationarySegments} segment(s)")
     
     if result["cadence_spm"] is not None:
         print(f"Mean Cadence      : {result['cadence_spm']:.1f} steps/min")
     
     else:
         print("Mean Cadence      : (fs not provided)")
+    gait = result["gait"]["summary"] if result["gait"] is not None else None
+    if gait is not None and gait["step_time_s_mean"] is not None:
+        print(f"Walking Cadence   : {gait['cadence_spm']:.1f} steps/min in {gait['bouts']} bout(s), pauses excluded")
+        print(f"Step Time         : {gait['step_time_s_mean']:.3f} s (CV {gait['step_time_s_cv'] * 100:.1f}%)")
+        if gait["stride_time_s_mean"] is not None:
+            print(f"Stride Time       : {gait['stride_time_s_mean']:.3f} s (CV {gait['stride_time_s_cv'] * 100:.1f}%)")
+            print(f"Step Asymmetry    : {gait['asymmetry_mean'] * 100:.1f}% (alternating steps)")
+        print(f"Peak Amplitude    : {gait['amplitude_mean']:.2f} (CV {gait['amplitude_cv'] * 100:.1f}%)")
+    if cadence is not None:
+        median = f"{cadence['median_cadence_spm']:.1f} steps/min" if cadence["median_cadence_spm"] is not None else "(no confident window)"
+        print(f"Window Cadence    : {median} median, {cadence['method']}, {int((cadence['confidence'] >= cadence['min_confidence']).sum())}/{len(cadence['confidence'])} confident windows")
+        if not args.cadence_only:
+            agreement = f"{cadence['agreement'] * 100:.0f}% of confident windows within {cadence['tolerance'] * 100:.0f}%" if cadence["agreement"] is not None else "(no confident window)"
+            print(f"Cadence estimate  : {cadence['steps_estimate']:.1f} steps, peaks agree in {agreement}")
     print("========================================\n")
 
+    # 6) Writing of the stage profile!
+    if args.profile:
+        profiler.close()
+        print(f" Saved profile: {writeProfile(args.profile, [profiler.report()], args.profile_format)}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,159 @@
+# cadence.py: Estimates the step frequency (cadence) per sliding window directly from the accelerometer magnitude, without the time-domain
+# filter chain and peak detection: every window's spectrum (or autocorrelation) is computed with batched FFTs and its strongest periodicity
+# inside the walking/running band is the cadence of that window, with a confidence between 0 and 1. The band ends at a few Hz, so the magnitude
+# is first averaged over blocks of samples down to DECIMATED_RATE_FACTOR x the band's upper edge, which makes the FFTs ~100x smaller at 100 Hz:
+#   spectrum  Hann-tapered, zero-padded power spectrum, peak frequency refined by parabolic interpolation. Confidence: share of the band power
+#             in the peak's main lobe
+#   autocorr  normalized autocorrelation (Wiener-Khinchin, |FFT|² back-transformed). Its highest peak in the band is usually the stride (two
+#             steps, left and right foot differ), so the step period is half of it whenever the autocorrelation there is positive (for a
+#             peak that already is one step, half of it is in anti-phase). Confidence: the autocorrelation at the highest peak
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+CADENCE_METHODS = ("spectrum", "autocorr")
+CADENCE_BAND_HZ = (0.5, 4.0) # 30 to 240 steps/min
+CADENCE_MIN_CONFIDENCE = 0.3
+CADENCE_MIN_STD = 0.2 # m/s², quieter windows (the phone is resting) get confidence 0
+ZERO_PADDING = 4
+DECIMATED_RATE_FACTOR = 2.5
+
+# Windows are transformed in blocks of at most this many FFT values, so long recordings need bounded memory!
+FFT_BLOCK_VALUES = 1 << 22
+
+# Channels of the cadence table: (name, CSV format, dtype)!
+CADENCE_LAYOUT = (("time_s", ".3f", "<f8"), ("cadence_spm", ".2f", "<f8"), ("confidence", ".4f", "<f8"), ("peak_cadence_spm", ".2f", "<f8"))
+
+# Helper function that refines the position of a maximum at integer index k from its two neighbours (parabola through the three values)!
+def parabolicOffset(left: np.ndarray, center: np.ndarray, right: np.ndarray) -> np.ndarray:
+    curvature = left - 2.0 * center + right
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = np.where(curvature < 0.0, 0.5 * (left - right) / curvature, 0.0)
+    return np.clip(offset, -0.5, 0.5)
+
+# 1) Spectrum method for a block of demeaned windows (windows x window length): step frequency (Hz) and confidence per window
+def spectrumBlock(windows: np.ndarray, samplingFrequency: float, bandHz: Tuple[float, float]) -> Tuple[np.ndarray, np.ndarray]:
+    windowLength = windows.shape[1]
+    fftLength = 1 << int(np.ceil(np.log2(windowLength * ZERO_PADDING)))
+    power = np.fft.rfft(windows * np.hanning(windowLength), n=fftLength, axis=1)
+    power = power.real ** 2 + power.imag ** 2
+    frequencies = np.fft.rfftfreq(fftLength, 1.0 / samplingFrequency)
+    low, high = np.searchsorted(frequencies, bandHz[0]), np.searchsorted(frequencies, bandHz[1], side="right")
+    band = power[:, low:high]
+    rows = np.arange(len(windows))
+    peak = np.clip(np.argmax(band, axis=1), 1, band.shape[1] - 2)
+    offset = parabolicOffset(band[rows, peak - 1], band[rows, peak], band[rows, peak + 1])
+    stepHz = frequencies[low + peak] + offset * (samplingFrequency / fftLength)
+
+    # Main lobe of the Hann window: +-2 bins of the unpadded resolution
+    lobe = max(1, int(round(2.0 * fftLength / windowLength)))
+    cumulative = np.concatenate((np.zeros((len(windows), 1)), np.cumsum(band, axis=1)), axis=1)
+    lobePower = cumulative[rows, np.minimum(peak + lobe + 1, band.shape[1])] - cumulative[rows, np.maximum(peak - lobe, 0)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        confidence = np.where(cumulative[:, -1] > 0.0, lobePower / cumulative[:, -1], 0.0)
+    return stepHz, confidence
+
+# 2) Autocorrelation method for a block of demeaned windows: step frequency (Hz) and confidence per window
+def autocorrBlock(windows: np.ndarray, samplingFrequency: float, bandHz: Tuple[float, float]) -> Tuple[np.ndarray, np.ndarray]:
+    windowLength = windows.shape[1]
+    spectrum = np.fft.rfft(windows, n=2 * windowLength, axis=1)
+    acf = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, axis=1)[:, :windowLength]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        acf = np.where(acf[:, :1] > 0.0, acf / acf[:, :1], 0.0)
+    minLag = max(2, int(np.floor(samplingFrequency / bandHz[1])))
+    maxLag = min(windowLength - 2, int(np.ceil(samplingFrequency / bandHz[0])))
+    if maxLag <= minLag:
+        raise ValueError(f"Cadence windows of {windowLength} samples are too short for the band {bandHz} Hz at {samplingFrequency} Hz")
+
+    # Highest local maximum inside the lag range, refined by parabolic interpolation
+    lags = acf[:, minLag - 1:maxLag + 2]
+    middle = lags[:, 1:-1]
+    isPeak = (middle >= lags[:, :-2]) & (middle > lags[:, 2:])
+    peakValues = np.where(isPeak, middle, -np.inf)
+    chosen = np.argmax(peakValues, axis=1)
+    rows = np.arange(len(windows))
+    found = isPeak[rows, chosen]
+    lag = minLag + chosen + parabolicOffset(lags[rows, chosen], lags[rows, chosen + 1], lags[rows, chosen + 2])
+
+    # Stride or step: the (linearly interpolated) autocorrelation at half the lag decides
+    half = lag / 2.0
+    below = np.floor(half).astype(np.int64)
+    fraction = half - below
+    halfValue = acf[rows, below] * (1.0 - fraction) + acf[rows, below + 1] * fraction
+    lag = np.where((halfValue > 0.0) & (half >= samplingFrequency / bandHz[1]), half, lag)
+    stepHz = np.where(found, samplingFrequency / lag, np.nan)
+    confidence = np.where(found, np.clip(middle[rows, chosen], 0.0, 1.0), 0.0)
+    return stepHz, confidence
+
+# 3) Main function: cadence series of a magnitude signal over windows of windowSeconds starting every hopSeconds. Returns the window
+# centers, the cadence (steps/min), its confidence and the summary over the confident windows: their median cadence and the number of
+# steps the series adds up to (windows below minConfidence count as no walking)!
+def windowedCadence(magnitude: Sequence[float], samplingFrequency: Optional[float], method: str = "spectrum", windowSeconds: float = 8.0, hopSeconds: float = 2.0,
+                    bandHz: Tuple[float, float] = CADENCE_BAND_HZ, minConfidence: float = CADENCE_MIN_CONFIDENCE, minStd: float = CADENCE_MIN_STD) -> Dict[str, object]:
+    if method not in CADENCE_METHODS:
+        raise ValueError(f"Unknown cadence method '{method}', expected one of {CADENCE_METHODS}")
+    fs = float(samplingFrequency) if samplingFrequency and samplingFrequency > 0 else 50.0
+    if bandHz[1] > fs / 2.0:
+        raise ValueError(f"The cadence band {bandHz} Hz must stay below fs/2 = {fs / 2.0} Hz")
+
+    # 3.1) Block averages of factor samples (the means also low-pass the signal before it is decimated), windows and hop in decimated samples
+    factor = max(1, int(fs // (DECIMATED_RATE_FACTOR * bandHz[1])))
+    signal = np.asarray(magnitude, dtype=np.float64)
+    signal = signal[:signal.size - signal.size % factor].reshape(-1, factor).mean(axis=1) if factor > 1 else signal
+    fs /= factor
+    windowLength, hop = int(round(windowSeconds * fs)), max(1, int(round(hopSeconds * fs)))
+    if windowLength < 4:
+        raise ValueError(f"Cadence windows need >= 4 samples, got {windowLength} at {fs} Hz")
+
+    # 3.2) Overlapping windows as a strided view, transformed block by block
+    windows = sliding_window_view(signal, windowLength)[::hop] if signal.size >= windowLength else np.empty((0, windowLength))
+    stepHz, confidence = np.empty(len(windows)), np.empty(len(windows))
+    transform = spectrumBlock if method == "spectrum" else autocorrBlock
+    blockWindows = max(1, FFT_BLOCK_VALUES // (2 * windowLength * ZERO_PADDING))
+    for start in range(0, len(windows), blockWindows):
+        block = windows[start:start + blockWindows]
+        centered = block - block.mean(axis=1, keepdims=True)
+        stepHz[start:start + blockWindows], confidence[start:start + blockWindows] = transform(centered, fs, bandHz)
+        quiet = np.sqrt(np.einsum("ij,ij->i", centered, centered) / windowLength) < minStd
+        confidence[start:start + blockWindows][quiet] = 0.0
+
+    # 3.3) Summary: the windows tile the recording with the hop, the first and last window also cover their outer (window - hop) / 2
+    confident = confidence >= minConfidence
+    walkingHz = np.where(confident, stepHz, 0.0)
+    stepEstimate = float(walkingHz.sum() * hop / fs + (walkingHz[0] + walkingHz[-1]) * (windowLength - hop) / (2.0 * fs)) if len(windows) else 0.0
+    return {
+        "method": method,
+        "window_s": windowLength / fs,
+        "hop_s": hop / fs,
+        "window_starts": np.arange(len(windows)) * hop * factor, # in samples of the input
+        "window_length": windowLength * factor,
+        "decimation": factor,
+        "time_s": (np.arange(len(windows)) * hop + windowLength / 2.0) / fs,
+        "cadence_spm": stepHz * 60.0,
+        "confidence": confidence,
+        "min_confidence": minConfidence,
+        "median_cadence_spm": float(np.median(stepHz[confident]) * 60.0) if confident.any() else None,
+        "steps_estimate": stepEstimate,
+    }
+
+# 4) Cross-check with the peak-based steps: the cadence each window gets from counting the detected peaks inside it, and the share of the
+# confident windows where both cadences agree within tolerance (relative)!
+def peakCadence(cadence: Dict[str, object], peaks: Sequence[int], samplingFrequency: Optional[float], tolerance: float = 0.1) -> Dict[str, object]:
+    fs = float(samplingFrequency) if samplingFrequency and samplingFrequency > 0 else 50.0
+    peaks = np.sort(np.asarray(peaks, dtype=np.int64))
+    starts = np.asarray(cadence["window_starts"], dtype=np.int64)
+    counts = np.searchsorted(peaks, starts + cadence["window_length"]) - np.searchsorted(peaks, starts)
+    peakSpm = counts * (60.0 * fs / cadence["window_length"])
+    confident = np.asarray(cadence["confidence"]) >= cadence["min_confidence"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        agrees = np.abs(cadence["cadence_spm"] - peakSpm) <= tolerance * peakSpm
+    return {
+        "peak_cadence_spm": peakSpm,
+        "agreement": float(agrees[confident].mean()) if confident.any() else None,
+        "tolerance": tolerance,
+    }
+
+# Helper function that lists the columns of CADENCE_LAYOUT (the peak cadence is NaN when no peaks were detected)!
+def cadenceColumns(cadence: Dict[str, object], peakSpm: Optional[np.ndarray] = None) -> List[np.ndarray]:
+    return [cadence["time_s"], cadence["cadence_spm"], cadence["confidence"], peakSpm if peakSpm is not None else np.full(len(cadence["time_s"]), np.nan)]
@@ -1,28 +1,49 @@
 # dataloader.py: Reads accelometer CSV data and computes the magnitude '√(x² + y² + z²)' for each row:
-import csv, math
+import os, sys
+from typing import Dict, Iterator, List, Tuple
 
-def loadMagnitude(csvPath):
+import numpy as np
 
-    magnitudes = []
+# The shared columnar CSV loader lives in MotionAnalysis/imucommon, next to the Part folders!
+sharedRoot = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if sharedRoot not in sys.path:
+    sys.path.append(sharedRoot)
+from imucommon.columnar import findAxisColumns, iterCsvBlocks, vectorMagnitude
+from imucommon.reccache import iterColumnBlocks, loadColumns, sourceHeaders
 
-    # 1) Including filename as input and cleaning the headers
-    with open(csvPath, "r", newline="") as csvFile:
-        csvReader = csv.reader(csvFile)
-        rawHeaders = next(csvReader)
-        normalizedHeaders = [h.strip().lower() for h in rawHeaders]
+# Helper function that finds the 'x', 'y', and 'z' column indexes from the header of the file (or of a 'store://' recording):
+def accelColumns(csvPath):
+    headers = sourceHeaders(csvPath)
+    return findAxisColumns([h.strip().lower() for h in headers])
 
-        # 2) Finding the 'x', 'y', and 'z' columns:
-        xColumnIndex = next(i for i,h in enumerate(normalizedHeaders) if 'x' in h)
-        yColumnIndex = next(i for i,h in enumerate(normalizedHeaders) if 'y' in h)
-        zColumnIndex = next(i for i,h in enumerate(normalizedHeaders) if 'z' in h)
+def loadAccelColumns(csvPath, useCache: bool = True) -> Dict[str, object]:
 
-        # 3) Reading line by line while calculating the vector magnitude of 'x', 'y', and 'z' values:
-        for row in csvReader:
-            try:
-                xAcceleration = float(row[xColumnIndex]); yAcceleration = float(row[yColumnIndex]); zAcceleration = float(row[zColumnIndex])
-                magnitudes.append(math.sqrt(xAcceleration*xAcceleration + yAcceleration*yAcceleration + zAcceleration*zAcceleration))
-            
-            except Exception:
-                continue
+    # 1) Finding the 'x', 'y', and 'z' columns from the cleaned headers:
+    xColumnIndex, yColumnIndex, zColumnIndex = accelColumns(csvPath)
 
-    return magnitudes
\ No newline at end of file
+    # 2) Parsing the whole file at once (or mapping its binary cache from an earlier run), rows that cannot be parsed are counted as rejected:
+    table = loadColumns(csvPath, usecols=(xColumnIndex, yColumnIndex, zColumnIndex), useCache=useCache)
+    xAcceleration, yAcceleration, zAcceleration = table["columns"]
+
+    # 3) Calculating the vector magnitude of 'x', 'y', and 'z' values for all rows:
+    return {
+        "magnitude": vectorMagnitude(xAcceleration, yAcceleration, zAcceleration),
+        "rows": table["rows"],
+        "rejected_rows": table["rejected_rows"],
+    }
+
+def loadMagnitude(csvPath, asArray: bool = False, useCache: bool = True):
+    magnitudes = loadAccelColumns(csvPath, useCache=useCache)["magnitude"]
+    return magnitudes if asArray else magnitudes.tolist()
+
+
+# Reading the magnitudes in chunks of at most chunkSize values, so the whole recording never has to be in memory:
+def iterMagnitudeChunks(csvPath, chunkSize: int = 4096) -> Iterator[List[float]]:
+    for block, _ in iterCsvBlocks(csvPath, usecols=accelColumns(csvPath), rowsPerBlock=chunkSize):
+        if len(block):
+            yield vectorMagnitude(block[:, 0], block[:, 1], block[:, 2]).tolist()
+
+# Same as iterMagnitudeChunks for the out-of-core pipeline: yields (magnitude array, rejected rows) per chunk, served from the binary cache when it is valid:
+def iterAccelChunks(csvPath, chunkSize: int = 65536, useCache: bool = True) -> Iterator[Tuple[np.ndarray, int]]:
+    for (xAcceleration, yAcceleration, zAcceleration), rejected in iterColumnBlocks(csvPath, accelColumns(csvPath), rowsPerBlock=chunkSize, useCache=useCache):
+        yield vectorMagnitude(xAcceleration, yAcceleration, zAcceleration), rejected
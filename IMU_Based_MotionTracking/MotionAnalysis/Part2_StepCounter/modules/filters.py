@@ -1,5 +1,10 @@
 # filters.py: Processes accelerometer magnitudes with custom high-pass and low-pass filters to isolate step-related motion:
-from typing import List, Optional
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# Available filter engines: "list" is the original pure-Python chain, "numpy" is the array-backed one!
+FILTER_ENGINES = ("list", "numpy")
 
 # 1) Sliding Window mechanism that computes a moving average:
 def movingAvg(signalValues: List[float], windowLength: int) -> List[float]:
@@ -14,23 +19,120 @@ def movingAvg(signalValues: List[float], windowLength: int) -> List[float]:
         smoothedSignal.append(sumWindow / len(buffer))
     return smoothedSignal
 
+# 1.1) Array-backed moving average using cumulative sums, it gives the same output as movingAvg (including the warm-up where the window is still growing):
+def movingAvgArray(signalValues: Sequence[float], windowLength: int) -> np.ndarray:
+    return MovingAvgChunks(windowLength).update(signalValues)
+
+# 1.1.1) movingAvgArray fed chunk by chunk: the cumulative sum continues from the previous chunk and only its last windowLength entries are kept,
+# so the concatenated outputs are bit-for-bit those of one movingAvgArray call over the whole signal!
+class MovingAvgChunks:
+    def __init__(self, windowLength: int):
+        self.windowLength = int(windowLength)
+        self.offset: Optional[float] = None
+        self.history = np.zeros(1) # cumulative sums of the samples before this chunk, history[-1] is the running total
+        self.processed = 0
+
+    def update(self, signalValues: Sequence[float]) -> np.ndarray:
+        values = np.asarray(signalValues, dtype=np.float64)
+        if values.size == 0 or self.windowLength <= 1:
+            return values.copy()
+
+        # 1) Cumulative sum of the values shifted by the first sample, so the running sum stays small on long recordings
+        if self.offset is None:
+            self.offset = values[0]
+        kept = self.history.size
+        cumulativeSum = np.empty(kept + values.size, dtype=np.float64)
+        cumulativeSum[:kept] = self.history
+        np.subtract(values, self.offset, out=cumulativeSum[kept:])
+        np.cumsum(cumulativeSum[kept - 1:], out=cumulativeSum[kept - 1:])
+
+        # 2) Number of samples inside each window, grows 1, 2, ... until it reaches windowLength
+        first = self.processed - kept + 1 # sample count that cumulativeSum[0] belongs to
+        windowEnd = np.arange(self.processed + 1, self.processed + values.size + 1)
+        windowCount = np.minimum(windowEnd, self.windowLength)
+        averages = (cumulativeSum[kept:] - cumulativeSum[windowEnd - windowCount - first]) / windowCount + self.offset
+
+        self.history = cumulativeSum[-min(cumulativeSum.size, self.windowLength):].copy()
+        self.processed += values.size
+        return averages
+
+# 1.2) Choosing the moving average implementation for the selected engine:
+def selectMovingAvg(engine: str):
+    if engine == "list":
+        return movingAvg
+    if engine == "numpy":
+        return movingAvgArray
+    raise ValueError(f"Unknown filter engine '{engine}', expected one of {FILTER_ENGINES}")
+
+# 1.3) Incremental moving average over a fixed ring buffer, one sample at a time with constant memory.
+# It adds and removes values in the same order as movingAvg, so the outputs are identical!
+class MovingAvgStream:
+    def __init__(self, windowLength: int):
+        self.windowLength = max(1, int(windowLength))
+        self.ring = [0.0] * self.windowLength
+        self.position = 0
+        self.count = 0
+        self.sumWindow = 0.0
+
+    def update(self, value: float) -> float:
+        if self.windowLength <= 1:
+            return value
+        self.sumWindow += value
+        if self.count == self.windowLength:
+            self.sumWindow -= self.ring[self.position]
+        else:
+            self.count += 1
+        self.ring[self.position] = value
+        self.position = (self.position + 1) % self.windowLength
+        return self.sumWindow / self.count
+
 # 2) High Pass filter, removing the slow gravity signals to highlight walking motion:
-def highpassGravityRemoval(magnitude: List[float], fs: Optional[int] = None) -> List[float]:
-    windowLength = int(fs * 1.0) if (fs and fs > 0) else 25
-    gravityTrend = movingAvg(magnitude, windowLength)
+def highpassGravityRemoval(magnitude: List[float], fs: Optional[int] = None, engine: str = "list") -> List[float]:
+    windowLength = highpassWindowLength(fs)
+    gravityTrend = selectMovingAvg(engine)(magnitude, windowLength)
+    if engine == "numpy":
+        return np.asarray(magnitude, dtype=np.float64) - gravityTrend
     return [rawAcceleration - gravityEstimate for rawAcceleration, gravityEstimate in zip(magnitude, gravityTrend)]
 
 
+# 2.1) Window length used by the high pass filter:
+def highpassWindowLength(fs: Optional[int] = None) -> int:
+    return int(fs * 1.0) if (fs and fs > 0) else 25
+
+
 # 3) Low Pass Filter, smoothing the high frequency noise signals to highlight clearer step patterns:
-def lowpassSmoother(filteredSignals: List[float], samplingFrequency: Optional[int] = None) -> List[float]:
+def lowpassSmoother(filteredSignals: List[float], samplingFrequency: Optional[int] = None, engine: str = "list") -> List[float]:
+    return selectMovingAvg(engine)(filteredSignals, lowpassWindowLength(samplingFrequency))
+
+# 3.1) Window length used by the low pass filter:
+def lowpassWindowLength(samplingFrequency: Optional[int] = None) -> int:
     if samplingFrequency and samplingFrequency > 0:
         windowLength = int(samplingFrequency * 0.25)
     else:
         windowLength = 5
-
-    return movingAvg(filteredSignals, max(1, windowLength))
+    return max(1, windowLength)
 
 
 # 4) Combining both the filters:
-def preprocessSteps(magnitude: List[float], samplingFrequency: Optional[int] = None) -> List[float]:
-    return lowpassSmoother(highpassGravityRemoval(magnitude, fs=samplingFrequency), samplingFrequency=samplingFrequency)
\ No newline at end of file
+def preprocessSteps(magnitude: List[float], samplingFrequency: Optional[int] = None, engine: str = "list") -> List[float]:
+    return lowpassSmoother(highpassGravityRemoval(magnitude, fs=samplingFrequency, engine=engine), samplingFrequency=samplingFrequency, engine=engine)
+
+# 4.1) preprocessSteps for a recording that arrives in chunks: both moving averages keep their state between chunks, so the concatenated
+# outputs equal one preprocessSteps call of the same engine ('numpy' returns arrays, 'list' lists)!
+class PreprocessChunks:
+    def __init__(self, samplingFrequency: Optional[int] = None, engine: str = "list"):
+        selectMovingAvg(engine)
+        self.engine = engine
+        if engine == "numpy":
+            self.highpassTrend = MovingAvgChunks(highpassWindowLength(samplingFrequency))
+            self.lowpass = MovingAvgChunks(lowpassWindowLength(samplingFrequency))
+        else:
+            self.highpassTrend = MovingAvgStream(highpassWindowLength(samplingFrequency))
+            self.lowpass = MovingAvgStream(lowpassWindowLength(samplingFrequency))
+
+    def update(self, magnitude: Sequence[float]) -> List[float] | np.ndarray:
+        if self.engine == "numpy":
+            values = np.asarray(magnitude, dtype=np.float64)
+            return self.lowpass.update(values - self.highpassTrend.update(values))
+        highpassTrend, lowpass = self.highpassTrend.update, self.lowpass.update
+        return [lowpass(value - highpassTrend(value)) for value in magnitude]
\ No newline at end of file
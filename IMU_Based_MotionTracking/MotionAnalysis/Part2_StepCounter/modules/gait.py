@@ -0,0 +1,143 @@
+# gait.py: Per-step gait metrics from the detected step peaks, in one vectorized pass over the peak index array (the signal is only read at
+# the peaks themselves). Every step k gets:
+#   amplitude            filtered magnitude at the peak
+#   step_time_s          time since the previous step (NaN for the first step of a walking bout)
+#   stride_time_s        time since the step before that, one full gait cycle of the same foot (needs two step times of the bout)
+#   asymmetry            |step time k - step time k-1| / their mean, the difference between alternating (left/right) steps
+#   rolling_cadence_spm  steps/min over the last GAIT_ROLLING_STEPS step times of the bout
+# A step time longer than maxStepSeconds is a pause: it is not a step time and the next step starts a new bout. GaitTracker gives the same
+# rows and summary incrementally, for the chunked processFile and the streaming step counter!
+import math
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+GAIT_ROLLING_STEPS = 8
+GAIT_MAX_STEP_SECONDS = 2.0
+GAIT_METRICS = ("amplitude", "step_time_s", "stride_time_s", "asymmetry", "rolling_cadence_spm")
+
+# Channels added to the steps table: (name, CSV format, dtype)!
+GAIT_LAYOUT = (("amplitude", ".4f", "<f8"), ("step_time_s", ".3f", "<f8"), ("stride_time_s", ".3f", "<f8"), ("asymmetry", ".4f", "<f8"), ("rolling_cadence_spm", ".2f", "<f8"))
+
+# Metrics with a mean/std/CV in the summary!
+SUMMARY_METRICS = ("amplitude", "step_time_s", "stride_time_s", "asymmetry")
+
+# Helper function that returns the sampling frequency the times are computed with (50 Hz when unknown, like the peak distance)!
+def gaitRate(samplingFrequency: Optional[float]) -> float:
+    return float(samplingFrequency) if samplingFrequency and samplingFrequency > 0 else 50.0
+
+# 1) Core: metrics of the steps at 'times' (seconds), where the first 'carried' steps were already reported (they only give the history)
+# and the first step sits at position firstPosition of its bout. Returns the rows of the new steps and the bout position of the last step!
+def gaitRows(times: np.ndarray, carried: int, firstPosition: int, rollingSteps: int, maxStepSeconds: float) -> Dict[str, object]:
+    count = times.size
+    intervals = np.full(count, np.nan)
+    if count > 1:
+        intervals[1:] = np.diff(times)
+
+    # 1.1) Bouts: a pause resets the position in the bout (the number of step times before a step)
+    steps = np.arange(count)
+    breaks = intervals > maxStepSeconds
+    boutStarts = np.where(breaks, steps, np.iinfo(np.int64).min)
+    if count:
+        boutStarts[0] = -firstPosition if not breaks[0] else 0
+    positions = steps - np.maximum.accumulate(boutStarts) if count else steps
+    intervals[breaks] = np.nan
+
+    # 1.2) Stride time and asymmetry from two consecutive step times, rolling cadence over the last min(rollingSteps, position) of them
+    previous = np.concatenate(([np.nan], intervals[:-1])) if count else intervals
+    both = ~np.isnan(intervals) & ~np.isnan(previous)
+    stride = np.where(both, intervals + previous, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        asymmetry = np.where(both, np.abs(intervals - previous) / (0.5 * (intervals + previous)), np.nan)
+        window = np.minimum(positions, rollingSteps)
+        rolling = np.where(window > 0, 60.0 * window / (times - times[np.maximum(steps - window, 0)]), np.nan)
+    return {
+        "step_time_s": intervals[carried:],
+        "stride_time_s": stride[carried:],
+        "asymmetry": asymmetry[carried:],
+        "rolling_cadence_spm": rolling[carried:],
+        "last_position": int(positions[-1]) if count else firstPosition,
+    }
+
+# Helper function that adds the count, sum and sum of squares of every summary metric (NaNs skipped) to 'moments'!
+def addMoments(moments: Dict[str, List[float]], rows: Dict[str, np.ndarray]) -> None:
+    for name in SUMMARY_METRICS:
+        values = rows[name][~np.isnan(rows[name])]
+        moments[name][0] += values.size
+        moments[name][1] += float(values.sum())
+        moments[name][2] += float(np.dot(values, values))
+
+# Helper function that turns the moments into the summary: mean, std (population) and coefficient of variation per metric!
+def gaitSummary(moments: Dict[str, List[float]], stepCount: int, boutCount: int) -> Dict[str, object]:
+    summary: Dict[str, object] = {"steps": stepCount, "bouts": boutCount}
+    for name in SUMMARY_METRICS:
+        count, total, squares = moments[name]
+        mean = total / count if count else None
+        std = math.sqrt(max(squares / count - mean * mean, 0.0)) if count else None
+        summary[f"{name}_mean"] = mean
+        summary[f"{name}_std"] = std
+        summary[f"{name}_cv"] = std / mean if count and mean else None
+    stepTime = summary["step_time_s_mean"]
+    summary["cadence_spm"] = 60.0 / stepTime if stepTime else None # walking cadence, pauses excluded
+    return summary
+
+def emptyMoments() -> Dict[str, List[float]]:
+    return {name: [0, 0.0, 0.0] for name in SUMMARY_METRICS}
+
+# Helper function that gathers the filtered signal (list or array) at the peaks, without a pass over the signal!
+def peakAmplitudes(signal: Sequence[float] | np.ndarray, peaks: Sequence[int]) -> np.ndarray:
+    if isinstance(signal, np.ndarray):
+        return signal[np.asarray(peaks, dtype=np.int64)]
+    return np.array([signal[i] for i in peaks], dtype=np.float64)
+
+# 2) Main function: gait metrics of all detected steps (peak indices with their amplitudes, see peakAmplitudes), returns one array per
+# GAIT_METRICS entry plus the summary!
+def gaitMetrics(peaks: Sequence[int], amplitudes: Sequence[float], samplingFrequency: Optional[float], rollingSteps: int = GAIT_ROLLING_STEPS, maxStepSeconds: float = GAIT_MAX_STEP_SECONDS) -> Dict[str, object]:
+    indices = np.asarray(peaks, dtype=np.int64)
+    rows = gaitRows(indices / gaitRate(samplingFrequency), 0, 0, rollingSteps, maxStepSeconds)
+    rows["amplitude"] = np.asarray(amplitudes, dtype=np.float64)
+    moments = emptyMoments()
+    addMoments(moments, rows)
+    metrics = {name: rows[name] for name in GAIT_METRICS}
+    metrics["summary"] = gaitSummary(moments, int(indices.size), int(np.count_nonzero(np.isnan(rows["step_time_s"])))) # every bout starts with a NaN step time
+    return metrics
+
+# Helper function that lists the columns of GAIT_LAYOUT!
+def gaitColumns(metrics: Dict[str, object]) -> List[np.ndarray]:
+    return [metrics[name] for name, _, _ in GAIT_LAYOUT]
+
+# 3) Incremental variant: steps are fed as they are confirmed (global peak indices with their amplitudes), the tracker keeps the times of the
+# last max(rollingSteps, 2) steps of the current bout (stride time and asymmetry need two step times) and the moments of the summary, so
+# memory does not grow with the session. rollingSteps must be >= 1!
+class GaitTracker:
+    def __init__(self, samplingFrequency: Optional[float], rollingSteps: int = GAIT_ROLLING_STEPS, maxStepSeconds: float = GAIT_MAX_STEP_SECONDS):
+        if rollingSteps < 1:
+            raise ValueError(f"rollingSteps must be >= 1, got {rollingSteps}")
+        self.rate = gaitRate(samplingFrequency)
+        self.rollingSteps = int(rollingSteps)
+        self.maxStepSeconds = maxStepSeconds
+        self.history = np.empty(0) # times of the last steps of the bout, at most max(rollingSteps, 2) (and at least 1 once there was a step)
+        self.lastPosition = 0
+        self.moments = emptyMoments()
+        self.stepCount = 0
+        self.boutCount = 0
+
+    # Feeding the next confirmed steps, returns their rows (same as gaitMetrics for these steps)!
+    def update(self, peaks: Sequence[int], amplitudes: Sequence[float]) -> Dict[str, np.ndarray]:
+        times = np.asarray(peaks, dtype=np.float64) / self.rate
+        carried = self.history.size
+        firstPosition = self.lastPosition - carried + 1 if carried else 0
+        rows = gaitRows(np.concatenate((self.history, times)), carried, firstPosition, self.rollingSteps, self.maxStepSeconds)
+        rows["amplitude"] = np.asarray(amplitudes, dtype=np.float64)
+        addMoments(self.moments, rows)
+
+        if times.size:
+            self.boutCount += int(np.count_nonzero(np.isnan(rows["step_time_s"])))
+            self.stepCount += times.size
+            self.lastPosition = rows["last_position"]
+            keep = min(max(self.rollingSteps, 2), self.lastPosition + 1)
+            self.history = np.concatenate((self.history, times))[-keep:]
+        return {name: rows[name] for name in GAIT_METRICS}
+
+    def summary(self) -> Dict[str, object]:
+        return gaitSummary(self.moments, self.stepCount, self.boutCount)
@@ -1,8 +1,17 @@
 # peaks.py: Detects step peaks from filtered acceleration signals using a custom local-maximum method with adaptive thresholding and refractory gap control:
-from typing import List
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
 
-# 1) Computing a dynamic threshold:
-def dynamicTreshold(signalMagnitude: List[float], tresholdSensitivity: float = 0.8) -> float:
+import numpy as np
+
+PEAK_MODES = ("refractory", "merge")
+
+# Arrays are reduced in blocks of this many samples, so a chunked run that reads the signal back in the same blocks gets the same threshold!
+THRESHOLD_BLOCK = 65536
+
+# 1) Computing a dynamic threshold (arrays are reduced with numpy, lists keep the original two Python passes):
+def dynamicTreshold(signalMagnitude: List[float] | np.ndarray, tresholdSensitivity: float = 0.8) -> float:
+    if isinstance(signalMagnitude, np.ndarray):
+        return streamedTreshold(lambda: (signalMagnitude[i:i + THRESHOLD_BLOCK] for i in range(0, signalMagnitude.size, THRESHOLD_BLOCK)), tresholdSensitivity)
     if not signalMagnitude:
         return 0.0
     
@@ -18,8 +27,153 @@ def dynamicTreshold(signalMagnitude: List[float], tresholdSensitivity: float = 0
     return avgValue + tresholdSensitivity * standardDeviation
 
 
+# 1.0) dynamicTreshold over a signal that is read block by block (twice: mean, then variance). readBlocks() returns a new iterator over the blocks.
+# List blocks continue Python's left-to-right sums, so the result is the list dynamicTreshold's; array blocks are summed by numpy!
+def streamedTreshold(readBlocks: Callable[[], Iterable[Sequence[float]]], tresholdSensitivity: float = 0.8) -> float:
+    sampleCount, total = 0, 0.0
+    for block in readBlocks():
+        sampleCount += len(block)
+        total = float(total + block.sum()) if isinstance(block, np.ndarray) else sum(block, total)
+    if sampleCount == 0:
+        return 0.0
+    avgValue = total / float(sampleCount)
+
+    squaredDiffSum = 0.0
+    for block in readBlocks():
+        if isinstance(block, np.ndarray):
+            deviation = block - avgValue
+            squaredDiffSum = float(squaredDiffSum + np.dot(deviation, deviation))
+        else:
+            squaredDiffSum = sum(((x - avgValue) * (x - avgValue) for x in block), squaredDiffSum)
+    variance = squaredDiffSum / max(1.0, (sampleCount - 1.0))
+    return avgValue + tresholdSensitivity * variance ** 0.5
+
+
+# 1.1) Running version of dynamicTreshold, updating mean and variance with Welford's method for every new sample:
+class RunningThreshold:
+    def __init__(self, tresholdSensitivity: float = 0.8):
+        self.tresholdSensitivity = tresholdSensitivity
+        self.count = 0
+        self.mean = 0.0
+        self.squaredDiffSum = 0.0
+
+    def update(self, value: float) -> float:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.squaredDiffSum += delta * (value - self.mean)
+        return self.value()
+
+    def value(self) -> float:
+        if self.count == 0:
+            return 0.0
+        variance = self.squaredDiffSum / max(1.0, self.count - 1.0)
+        return self.mean + self.tresholdSensitivity * variance ** 0.5
+
+
+# 1.2) Threshold over the last windowLength samples only, so it follows changes in activity intensity:
+class WindowedThreshold:
+    def __init__(self, windowLength: int, tresholdSensitivity: float = 0.8):
+        self.windowLength = max(2, int(windowLength))
+        self.tresholdSensitivity = tresholdSensitivity
+        self.ring = [0.0] * self.windowLength
+        self.position = 0
+        self.count = 0
+        self.sumWindow = 0.0
+        self.squaredSumWindow = 0.0
+
+    def update(self, value: float) -> float:
+        if self.count == self.windowLength:
+            oldValue = self.ring[self.position]
+            self.sumWindow -= oldValue
+            self.squaredSumWindow -= oldValue * oldValue
+        else:
+            self.count += 1
+        self.ring[self.position] = value
+        self.position = (self.position + 1) % self.windowLength
+        self.sumWindow += value
+        self.squaredSumWindow += value * value
+
+        # Re-summing the ring once per lap keeps rounding errors of the running sums from piling up on long sessions
+        if self.position == 0:
+            self.sumWindow = sum(self.ring)
+            self.squaredSumWindow = sum(v * v for v in self.ring)
+        return self.value()
+
+    def value(self) -> float:
+        if self.count == 0:
+            return 0.0
+        mean = self.sumWindow / self.count
+        variance = max(0.0, (self.squaredSumWindow - self.count * mean * mean) / max(1.0, self.count - 1.0))
+        return mean + self.tresholdSensitivity * variance ** 0.5
+
+
+# 1.3) Vectorized WindowedThreshold over a whole signal: element i is the threshold of the last windowLength samples up to and including i,
+# the same value WindowedThreshold.update gives for sample i. Window sums come from one cumulative sum, so the cost does not depend on the window!
+def windowedThresholds(signalMagnitude: Sequence[float], windowLength: int, tresholdSensitivity: float = 0.8) -> np.ndarray:
+    return WindowedThresholdChunks(windowLength, tresholdSensitivity).update(signalMagnitude)
+
+# 1.3.1) windowedThresholds fed chunk by chunk: both cumulative sums continue from the previous chunk and keep only their last windowLength entries,
+# so the concatenated outputs equal one windowedThresholds call over the whole signal!
+class WindowedThresholdChunks:
+    def __init__(self, windowLength: int, tresholdSensitivity: float = 0.8):
+        self.windowLength = max(2, int(windowLength))
+        self.tresholdSensitivity = tresholdSensitivity
+        self.offset: Optional[float] = None
+        self.sums = np.zeros(1)
+        self.squaredSums = np.zeros(1)
+        self.processed = 0
+
+    def update(self, signalMagnitude: Sequence[float]) -> np.ndarray:
+        values = np.asarray(signalMagnitude, dtype=np.float64)
+        if values.size == 0:
+            return values.copy()
+
+        # Centering on the first sample keeps the cumulative sums small, so differences of them do not lose the variance to rounding
+        if self.offset is None:
+            self.offset = values[0]
+        centered = values - self.offset
+        kept = self.sums.size
+        sums = np.concatenate((self.sums, centered))
+        squaredSums = np.concatenate((self.squaredSums, centered * centered))
+        np.cumsum(sums[kept - 1:], out=sums[kept - 1:])
+        np.cumsum(squaredSums[kept - 1:], out=squaredSums[kept - 1:])
+
+        first = self.processed - kept + 1 # sample count that sums[0] belongs to
+        ends = np.arange(self.processed + 1, self.processed + values.size + 1)
+        starts = np.maximum(0, ends - self.windowLength)
+        counts = (ends - starts).astype(np.float64)
+        windowSum = sums[kept:] - sums[starts - first]
+        windowMean = windowSum / counts
+        variance = np.maximum(0.0, (squaredSums[kept:] - squaredSums[starts - first] - windowSum * windowMean) / np.maximum(1.0, counts - 1.0))
+
+        self.sums = sums[-min(sums.size, self.windowLength):].copy()
+        self.squaredSums = squaredSums[-min(squaredSums.size, self.windowLength):].copy()
+        self.processed += values.size
+        return windowMean + self.offset + self.tresholdSensitivity * np.sqrt(variance)
+
+
+# 1.4) Reading a threshold mode: 'auto' (global mean + k*std), 'window:<seconds>' (windowed mean + k*std) or a fixed number.
+# Returns the mode name and its value (window seconds or the fixed threshold)!
+def parseThresholdMode(thresholdMode: str | float) -> Tuple[str, Optional[float]]:
+    if isinstance(thresholdMode, str):
+        mode = thresholdMode.strip().lower()
+        if mode == "auto":
+            return "auto", None
+        if mode.startswith("window:"):
+            seconds = float(mode.split(":", 1)[1])
+            if seconds <= 0:
+                raise ValueError(f"Threshold window must be positive, got '{thresholdMode}'")
+            return "window", seconds
+    return "fixed", float(thresholdMode)
+
+
 # 2) Finding local maxima above the threshold while enforcing a refractory gap to prevent double counting.
-def peakDetection(signalMagnitude: List[float], threshold: float, minGapDistance: int) -> List[int]:
+# The threshold is one value, or one value per sample (e.g. from windowedThresholds, handled by findPeaks)
+def peakDetection(signalMagnitude: List[float], threshold: float | Sequence[float], minGapDistance: int) -> List[int]:
+    if np.ndim(threshold) != 0:
+        return findPeaks(signalMagnitude, threshold, minGapDistance, mode="refractory")
+    threshold = float(threshold) # numpy scalars (np.float32, 0-d arrays) are one threshold too
     
     # 2.1) Validating input and ensure a minimum gap value:
     sampleCount = len(signalMagnitude)
@@ -53,7 +207,10 @@ def peakDetection(signalMagnitude: List[float], threshold: float, minGapDistance
 
 
 # 3) Merging closely spaced peaks, keeping the stronger one to handle twin-peak artifacts.
-def peakDetectionWithMerge(signalMagnitude: List[float], threshold: float, minGapDistance: int) -> List[int]:
+def peakDetectionWithMerge(signalMagnitude: List[float], threshold: float | Sequence[float], minGapDistance: int) -> List[int]:
+    if np.ndim(threshold) != 0:
+        return findPeaks(signalMagnitude, threshold, minGapDistance, mode="merge")
+    threshold = float(threshold)
     
     # 3.1) Collecting all local maxima above the threshold!
     candidateIndex: List[int] = []
@@ -75,3 +232,102 @@ def peakDetectionWithMerge(signalMagnitude: List[float], threshold: float, minGa
         else:
             mergedPeaks.append(currentIndex)
     return mergedPeaks
+
+
+
+# 4) Array-based peak finder: the local-maximum candidates come from one vectorized comparison, then only the sparse candidate set is resolved.
+# mode 'refractory' gives exactly the peaks of peakDetection (first peak wins), 'merge' those of peakDetectionWithMerge (strongest peak wins)!
+def peakCandidates(signalMagnitude: Sequence[float] | np.ndarray, threshold: float | Sequence[float]) -> np.ndarray:
+    values = np.asarray(signalMagnitude, dtype=np.float64)
+    if values.size < 3:
+        return np.empty(0, dtype=np.intp)
+    middle = values[1:-1]
+    thresholds = float(threshold) if np.ndim(threshold) == 0 else np.asarray(threshold, dtype=np.float64)[1:values.size - 1]
+    isPeak = (values[:-2] < middle) & (middle >= values[2:]) & (middle > thresholds)
+    return np.flatnonzero(isPeak) + 1
+
+def findPeaks(signalMagnitude: Sequence[float] | np.ndarray, threshold: float | Sequence[float], minGapDistance: int, mode: str = "refractory") -> List[int]:
+    finder = PeakFinder(minGapDistance, mode)
+    return finder.update(signalMagnitude, threshold) + finder.finish()
+
+# 4.1) The peak finder behind findPeaks, for signals that arrive in chunks. The last two samples (and their thresholds) are carried over,
+# because a sample is only a candidate once its next sample is known; the refractory/merge state carries the last peak!
+class PeakFinder:
+    def __init__(self, minGapDistance: int, mode: str = "refractory"):
+        if mode not in PEAK_MODES:
+            raise ValueError(f"Unknown peak mode '{mode}', expected one of {PEAK_MODES}")
+        self.minGapDistance = max(1, int(minGapDistance))
+        self.mode = mode
+        self.tail = np.empty(0)
+        self.tailThresholds = np.empty(0)
+        self.processed = 0
+        self.lastPeak: Optional[int] = None
+        self.lastStrength = 0.0
+        self.emitted = (np.empty(0), 0, 0.0) # values and base index of the last update(), strength of the peak kept before it
+
+    # Feeding the next chunk of the signal with its threshold (one value or one per sample), returns the peaks that are final now!
+    def update(self, signalMagnitude: Sequence[float] | np.ndarray, threshold: float | Sequence[float]) -> List[int]:
+        values = np.asarray(signalMagnitude, dtype=np.float64)
+        if values.size == 0:
+            self.emitted = (values, self.processed, self.lastStrength)
+            return []
+
+        # A single threshold stays a scalar unless the carried samples were compared against another one
+        scalar = np.ndim(threshold) == 0
+        if scalar and not np.any(self.tailThresholds != float(threshold)):
+            thresholds = float(threshold)
+        else:
+            thresholds = np.full(values.size, float(threshold)) if scalar else np.asarray(threshold, dtype=np.float64)[:values.size]
+            thresholds = np.concatenate((self.tailThresholds, thresholds)) if self.tail.size else thresholds
+        if self.tail.size:
+            values = np.concatenate((self.tail, values))
+        base = self.processed - self.tail.size
+        candidates = peakCandidates(values, thresholds)
+        strengths = values[candidates].tolist() if self.mode == "merge" else None
+        self.tail = values[-2:].copy()
+        self.tailThresholds = np.full(self.tail.size, thresholds) if isinstance(thresholds, float) else thresholds[-2:].copy()
+        self.processed = base + values.size
+        self.emitted = (values, base, self.lastStrength)
+        return self.resolve((candidates + base).tolist(), strengths)
+
+    def resolve(self, candidateList: List[int], strengths: List[float]) -> List[int]:
+        minGapDistance, lastPeak, lastStrength = self.minGapDistance, self.lastPeak, self.lastStrength
+
+        # 4.1.1) Refractory: a candidate is accepted when it is at least minGapDistance after the last accepted one
+        peaks: List[int] = []
+        if self.mode == "refractory":
+            for currentIndex in candidateList:
+                if lastPeak is None or currentIndex - lastPeak >= minGapDistance:
+                    peaks.append(currentIndex)
+                    lastPeak = currentIndex
+            self.lastPeak = lastPeak
+            return peaks
+
+        # 4.1.2) Merge: a candidate closer than minGapDistance to the kept peak replaces it only when strictly stronger (a chain, so it stays
+        # a loop over candidates). The kept peak is final once a candidate at least minGapDistance later shows up, or at finish()
+        for currentIndex, strength in zip(candidateList, strengths):
+            if lastPeak is not None and currentIndex - lastPeak < minGapDistance:
+                if strength > lastStrength:
+                    lastPeak, lastStrength = currentIndex, strength
+            else:
+                if lastPeak is not None:
+                    peaks.append(lastPeak)
+                lastPeak, lastStrength = currentIndex, strength
+        self.lastPeak, self.lastStrength = lastPeak, lastStrength
+        return peaks
+
+    # End of the signal: the peak still kept by the merge mode!
+    def finish(self) -> List[int]:
+        self.emitted = (np.empty(0), self.processed, self.lastStrength)
+        if self.mode == "merge" and self.lastPeak is not None:
+            peak, self.lastPeak = self.lastPeak, None
+            return [peak]
+        return []
+
+    # Signal values at the peaks returned by the last update() / finish(), only computed when asked for (the gait metrics need them):
+    # the merge mode can return the peak it kept from an earlier chunk, its value is the strength it was kept with!
+    def amplitudes(self, peaks: Sequence[int]) -> np.ndarray:
+        values, base, keptStrength = self.emitted
+        offsets = np.asarray(peaks, dtype=np.int64) - base
+        amplitudes = values[np.clip(offsets, 0, max(values.size - 1, 0))] if values.size else np.zeros(offsets.size)
+        return np.where(offsets < 0, keptStrength, amplitudes)
@@ -1,63 +1,290 @@
 # stepcounter.py: Processes filtered accelerometer magnitudes to detect step peaks and compute walking metrics.
 from typing import Dict, Optional, List
 
+import numpy as np
+
 # Local Imports:
-from modules.dataloader import loadMagnitude
-from modules.filters import preprocessSteps
-from modules.peaks import dynamicTreshold, peakDetection
+from modules.cadence import CADENCE_METHODS, peakCadence, windowedCadence
+from modules.dataloader import iterAccelChunks, loadAccelColumns
+from modules.filters import PreprocessChunks, preprocessSteps
+from modules.gait import GAIT_LAYOUT, GAIT_METRICS, GaitTracker, gaitColumns, gaitMetrics, peakAmplitudes
+from modules.peaks import PEAK_MODES, THRESHOLD_BLOCK, PeakFinder, WindowedThresholdChunks, dynamicTreshold, findPeaks, parseThresholdMode, streamedTreshold, windowedThresholds
+from imucommon.activity import classifyRecording, loadModel
+from imucommon.profiling import StageProfiler, profilerOrNull
+from imucommon.resultfiles import openTableWriter, writeTable
+from imucommon.spill import SpillFile
 
-def processFile(csvPath: str, samplingFrequency: Optional[int] = None, thresholdMode: str | float = "auto", sensitivityFactor: float = 0.8, minGapMiliseconds: int = 350,) -> Dict[str, object]:
+def processFile(csvPath: str, samplingFrequency: Optional[int] = None, thresholdMode: str | float = "auto", sensitivityFactor: float = 0.8, minGapMiliseconds: int = 350, filterEngine: str = "list", useCache: bool = True, profiler: Optional[StageProfiler] = None, peakMode: str = "refractory", chunkSize: Optional[int] = None, stepsPath: Optional[str] = None, stepsFormat: str = "csv", skipStationary: bool = False, activityModel: Optional[str] = None, cadenceMethod: Optional[str] = None, cadenceOnly: bool = False, gait: bool = True) -> Dict[str, object]:
+    if peakMode not in PEAK_MODES:
+        raise ValueError(f"Unknown peak mode '{peakMode}', expected one of {PEAK_MODES}")
+    if cadenceMethod is not None and cadenceMethod not in CADENCE_METHODS:
+        raise ValueError(f"Unknown cadence method '{cadenceMethod}', expected one of {CADENCE_METHODS}")
+    if cadenceOnly and cadenceMethod is None:
+        raise ValueError("Counting steps from the cadence alone needs a cadence method")
+    if chunkSize is not None:
+        if skipStationary:
+            raise ValueError("Skipping stationary segments needs the whole recording and is not available in the chunked mode")
+        if cadenceMethod is not None:
+            raise ValueError("The windowed cadence needs the whole recording and is not available in the chunked mode")
+        return processFileChunked(csvPath, samplingFrequency, thresholdMode, sensitivityFactor, minGapMiliseconds, filterEngine, useCache, profiler, peakMode, chunkSize, stepsPath, stepsFormat, gait)
+    stages = profilerOrNull(profiler)
 
     # 1) Loading of the accelometer magnitude data from the CSV file!
-    mag: List[float] = loadMagnitude(csvPath)
-    if not mag:
+    with stages.stage("load") as stage:
+        loaded = loadAccelColumns(csvPath, useCache=useCache)
+        mag = loaded["magnitude"] if filterEngine == "numpy" or cadenceOnly else loaded["magnitude"].tolist()
+        stage.samples = len(mag)
+    if len(mag) == 0:
         return {
             "signal": [],
             "threshold": 0.0,
+            "threshold_series": None,
             "peaks": [],
             "steps": 0,
             "fs": samplingFrequency,
             "duration_s": None,
             "cadence_spm": None,
+            "peak_mode": peakMode,
+            "activity": None,
+            "cadence": None,
+            "gait": None,
+            "rejected_rows": loaded["rejected_rows"],
+            "samples": 0,
+            "profile": stages.report(),
         }
 
-    # 2) Applying of High pass (gravity removal) and Low pass (noise smoothing)!
-    filteredSignal: List[float] = preprocessSteps(mag, samplingFrequency=samplingFrequency)
-
-    # 3) Determining the threshold mode, automatic or fixed!
-    if isinstance(thresholdMode, str) and thresholdMode.lower() == "auto":
-        thresholdLevel = float(dynamicTreshold(filteredSignal, tresholdSensitivity=sensitivityFactor))
+    # 2) With cadenceMethod, the cadence per sliding window from batched FFTs of the raw magnitude (modules/cadence.py)! With cadenceOnly
+    # that is the fast path: the filters and the peak search are skipped and the steps are the ones the cadence series adds up to
+    cadence = None
+    if cadenceMethod is not None:
+        with stages.stage("cadence", samples=len(mag)):
+            cadence = windowedCadence(mag, samplingFrequency, cadenceMethod)
+    if cadenceOnly:
+        detected = {"signal": None, "threshold": None, "threshold_series": None, "peaks": None, "steps": int(round(cadence["steps_estimate"])), "activity": None}
     else:
-        thresholdLevel = float(thresholdMode)
+        # 3) Filtering, threshold and step peaks of the loaded magnitudes, cross-checked with the cadence series!
+        detected = detectSteps(mag, samplingFrequency, thresholdMode, sensitivityFactor, minGapMiliseconds, filterEngine, stages, peakMode, skipStationary, activityModel)
+        if cadence is not None:
+            cadence.update(peakCadence(cadence, detected["peaks"], samplingFrequency))
 
-    # 4) Converting of refractory gap from ms to samples!
-    if samplingFrequency and samplingFrequency > 0:
-        minPeakDistance = max(1, int(samplingFrequency * (minGapMiliseconds / 1000.0)))
-    else:
-        minPeakDistance = 15 # If sampling frequency is unknown then use a conservative default, which is around 15 samples
+    # 4) Per-step gait metrics from the peak indices (modules/gait.py), the signal is only read at the peaks!
+    gaitResult = None
+    if gait and detected["peaks"] is not None:
+        with stages.stage("gait", samples=detected["steps"]):
+            gaitResult = gaitMetrics(detected["peaks"], peakAmplitudes(detected["signal"], detected["peaks"]), samplingFrequency)
 
-    # 5) Detecting of step peaks that are above the threshold!
-    detectedPeaks = peakDetection(filteredSignal, thresholdLevel, minPeakDistance)
-    stepCount = len(detectedPeaks)
+    # 5) Calculating of total duration in seconds and cadence in steps per minute!
+    durationSeconds, cadenceSPM = walkingRate(len(mag), detected["steps"], samplingFrequency)
 
-    # 6) Calculating of total duration in seconds and cadence in steps per minute!
-    if samplingFrequency and samplingFrequency > 0:
-        durationSeconds = len(filteredSignal) / samplingFrequency
-    else:
-        durationSeconds = None
+    # 6) Returning of all computed results in dict. format!
+    return {
+        "signal": detected["signal"],
+        "threshold": detected["threshold"],
+        "threshold_series": detected["threshold_series"],
+        "peaks": detected["peaks"],
+        "steps": detected["steps"],
+        "fs": samplingFrequency,
+        "duration_s": durationSeconds,
+        "cadence_spm": cadenceSPM,
+        "peak_mode": peakMode,
+        "activity": detected["activity"],
+        "cadence": cadence,
+        "gait": gaitResult,
+        "rejected_rows": loaded["rejected_rows"],
+        "samples": len(mag),
+        "profile": stages.report(),
+    }
 
-    if durationSeconds and durationSeconds > 0:
-        cadenceSPM = (stepCount / durationSeconds) * 60.0
-    else:
-        cadenceSPM = None
 
-    # 7) Returning of all computed results in dict. format!
+# Stages of processFile after loading, for magnitudes that are already in memory (the fused pipeline computes them from a merged recording)!
+def detectSteps(mag: List[float] | np.ndarray, samplingFrequency: Optional[int] = None, thresholdMode: str | float = "auto", sensitivityFactor: float = 0.8, minGapMiliseconds: int = 350, filterEngine: str = "list", stages: Optional[StageProfiler] = None, peakMode: str = "refractory", skipStationary: bool = False, activityModel: Optional[str] = None) -> Dict[str, object]:
+    stages = profilerOrNull(stages)
+
+    # 1) Applying of High pass (gravity removal) and Low pass (noise smoothing)! The numpy engine keeps the signal as an array up to the peaks
+    with stages.stage("filter", samples=len(mag)):
+        filteredSignal: List[float] | np.ndarray = preprocessSteps(mag, samplingFrequency=samplingFrequency, engine=filterEngine)
+
+    # 2) Determining the threshold mode: automatic (global), windowed ('window:<seconds>', one threshold per sample) or fixed!
+    thresholdSeries: Optional[List[float] | np.ndarray] = None
+    with stages.stage("threshold", samples=len(filteredSignal)):
+        modeName, modeValue = parseThresholdMode(thresholdMode)
+        if modeName == "auto":
+            thresholdLevel = float(dynamicTreshold(filteredSignal, tresholdSensitivity=sensitivityFactor))
+        elif modeName == "window":
+            windowLength = int(modeValue * samplingFrequency) if (samplingFrequency and samplingFrequency > 0) else int(modeValue * 50)
+            thresholds = windowedThresholds(filteredSignal, windowLength, tresholdSensitivity=sensitivityFactor)
+            thresholdLevel = float(thresholds.mean())
+            thresholdSeries = thresholds if filterEngine == "numpy" else thresholds.tolist()
+        else:
+            thresholdLevel = modeValue
+
+    # 3) Converting of refractory gap from ms to samples!
+    minPeakDistance = peakDistance(samplingFrequency, minGapMiliseconds)
+
+    # 4) With skipStationary, labelling windows of the raw magnitude by activity (imucommon/activity.py), standing and sitting segments are not searched!
+    activity = None
+    if skipStationary:
+        with stages.stage("activity", samples=len(filteredSignal)):
+            activity = classifyRecording(mag, samplingFrequency, loadModel(activityModel))
+
+    # 5) Detecting of step peaks that are above the threshold, with the refractory gap (first peak wins) or merging close peaks (strongest wins)!
+    with stages.stage("peaks", samples=len(filteredSignal) if activity is None else len(filteredSignal) - activity["stationary_samples"]):
+        if activity is None:
+            detectedPeaks = findPeaks(filteredSignal, thresholdLevel if thresholdSeries is None else thresholdSeries, minPeakDistance, mode=peakMode)
+        else:
+            detectedPeaks = []
+            for start, stop in activity["moving_segments"]:
+                segmentPeaks = findPeaks(filteredSignal[start:stop], thresholdLevel if thresholdSeries is None else thresholdSeries[start:stop], minPeakDistance, mode=peakMode)
+                detectedPeaks.extend(start + peak for peak in segmentPeaks)
+        stepCount = len(detectedPeaks)
+
     return {
         "signal": filteredSignal,
         "threshold": thresholdLevel,
+        "threshold_series": thresholdSeries,
+        "peaks": detectedPeaks,
+        "steps": stepCount,
+        "activity": activity,
+    }
+
+
+# Helper function that converts the refractory gap from ms to samples!
+def peakDistance(samplingFrequency: Optional[int], minGapMiliseconds: int) -> int:
+    if samplingFrequency and samplingFrequency > 0:
+        return max(1, int(samplingFrequency * (minGapMiliseconds / 1000.0)))
+    return 15 # If sampling frequency is unknown then use a conservative default, which is around 15 samples
+
+# Helper function that returns the duration in seconds and the cadence in steps per minute (None when the sampling frequency is unknown)!
+def walkingRate(sampleCount: int, stepCount: int, samplingFrequency: Optional[int]):
+    durationSeconds = sampleCount / samplingFrequency if samplingFrequency and samplingFrequency > 0 else None
+    cadenceSPM = (stepCount / durationSeconds) * 60.0 if durationSeconds and durationSeconds > 0 else None
+    return durationSeconds, cadenceSPM
+
+
+# Out-of-core version of processFile for recordings larger than memory: the file is read in chunks of chunkSize samples and every stage
+# carries its state (filter windows, threshold windows, the last samples and peak of the peak finder) from chunk to chunk, so the steps are
+# the same as those of an in-memory run. Peak memory depends on chunkSize, not on the file length:
+#   - fixed and 'window:<seconds>' thresholds need a single pass,
+#   - the automatic threshold needs the mean/std of the whole filtered signal, so that signal is spilled to a temporary file and read back.
+# With stepsPath the steps are written to that file (stepsFormat 'csv' or 'bin') while they are found and "peaks" is None; the filtered signal is never returned!
+def processFileChunked(csvPath: str, samplingFrequency: Optional[int] = None, thresholdMode: str | float = "auto", sensitivityFactor: float = 0.8, minGapMiliseconds: int = 350, filterEngine: str = "list", useCache: bool = True, profiler: Optional[StageProfiler] = None, peakMode: str = "refractory", chunkSize: int = 65536, stepsPath: Optional[str] = None, stepsFormat: str = "csv", gait: bool = True) -> Dict[str, object]:
+    stages = profilerOrNull(profiler)
+    if chunkSize < 1:
+        raise ValueError(f"Chunk size must be a positive number of samples, got {chunkSize}")
+    modeName, modeValue = parseThresholdMode(thresholdMode)
+    preprocess = PreprocessChunks(samplingFrequency, engine=filterEngine)
+    finder = PeakFinder(peakDistance(samplingFrequency, minGapMiliseconds), mode=peakMode)
+    sampleCount, rejectedRows, thresholdLevel, stepCount = 0, 0, 0.0, 0
+    detectedPeaks: Optional[List[int]] = [] if stepsPath is None else None
+    tracker = GaitTracker(samplingFrequency) if gait else None
+    gaitParts: Dict[str, List[np.ndarray]] = {name: [] for name in GAIT_METRICS}
+    writer = openTableWriter(stepsPath, stepsFormat, stepsLayout(gait), stepsMeta(csvPath, samplingFrequency, thresholdMode, sensitivityFactor, minGapMiliseconds, peakMode)) if stepsPath is not None else None
+    try:
+        # Helper function that keeps (or writes) the peaks the finder has confirmed, with their gait metrics (the finder knows their amplitudes)
+        def emit(peaks: List[int]) -> None:
+            nonlocal stepCount
+            stepCount += len(peaks)
+            rows = tracker.update(peaks, finder.amplitudes(peaks)) if tracker is not None else None
+            if writer is not None:
+                writer.write(stepColumns(peaks, samplingFrequency) + (gaitColumns(rows) if rows is not None else []))
+            else:
+                detectedPeaks.extend(peaks)
+                if rows is not None:
+                    for name in GAIT_METRICS:
+                        gaitParts[name].append(rows[name])
+
+        # 1) Automatic threshold: filtering every chunk into the spill file, then the threshold over it and the peaks in a second read
+        if modeName == "auto":
+            with SpillFile() as spill:
+                with stages.stage("filter") as stage:
+                    for magnitude, rejected in iterAccelChunks(csvPath, chunkSize, useCache=useCache):
+                        rejectedRows += rejected
+                        spill.append(preprocess.update(magnitude if filterEngine == "numpy" else magnitude.tolist()))
+                    sampleCount = stage.samples = spill.size
+
+                # 1.1) Lists are read back as lists, so both engines reproduce their in-memory threshold exactly (blocks of THRESHOLD_BLOCK like dynamicTreshold)
+                with stages.stage("threshold", samples=sampleCount):
+                    if filterEngine == "numpy":
+                        thresholdLevel = streamedTreshold(lambda: spill.blocks(THRESHOLD_BLOCK), sensitivityFactor)
+                    else:
+                        thresholdLevel = streamedTreshold(lambda: (block.tolist() for block in spill.blocks(THRESHOLD_BLOCK)), sensitivityFactor)
+                with stages.stage("peaks", samples=sampleCount):
+                    for block in spill.blocks(chunkSize):
+                        emit(finder.update(block, thresholdLevel))
+                    emit(finder.finish())
+
+        # 2) Fixed or windowed threshold: filtering, thresholds and peaks in one pass. The windowed thresholdLevel is their running mean,
+        # so it can differ from the in-memory np.mean in the last digits (the per-sample thresholds and the steps do not)
+        else:
+            windowed = None
+            if modeName == "window":
+                windowed = WindowedThresholdChunks(int(modeValue * samplingFrequency) if (samplingFrequency and samplingFrequency > 0) else int(modeValue * 50), sensitivityFactor)
+            else:
+                thresholdLevel = modeValue
+            thresholdSum = 0.0
+            with stages.stage("stream") as stage:
+                for magnitude, rejected in iterAccelChunks(csvPath, chunkSize, useCache=useCache):
+                    rejectedRows += rejected
+                    filtered = preprocess.update(magnitude if filterEngine == "numpy" else magnitude.tolist())
+                    sampleCount += len(filtered)
+                    if windowed is None:
+                        emit(finder.update(filtered, thresholdLevel))
+                    else:
+                        thresholds = windowed.update(filtered)
+                        thresholdSum += float(thresholds.sum())
+                        emit(finder.update(filtered, thresholds))
+                emit(finder.finish())
+                stage.samples = sampleCount
+            if windowed is not None and sampleCount:
+                thresholdLevel = thresholdSum / sampleCount
+    finally:
+        if writer is not None:
+            writer.close()
+
+    # 3) Returning of the same dict. as processFile, without the signal and threshold series (and without the per-step gait arrays when they were written)!
+    durationSeconds, cadenceSPM = walkingRate(sampleCount, stepCount, samplingFrequency) if sampleCount else (None, None)
+    gaitResult = None
+    if tracker is not None:
+        gaitResult = {name: (np.concatenate(parts) if parts else np.empty(0)) if writer is None else None for name, parts in gaitParts.items()}
+        gaitResult["summary"] = tracker.summary()
+    return {
+        "signal": None,
+        "threshold": thresholdLevel,
+        "threshold_series": None,
         "peaks": detectedPeaks,
         "steps": stepCount,
         "fs": samplingFrequency,
         "duration_s": durationSeconds,
         "cadence_spm": cadenceSPM,
+        "peak_mode": peakMode,
+        "activity": None,
+        "cadence": None,
+        "gait": gaitResult,
+        "rejected_rows": rejectedRows,
+        "samples": sampleCount,
+        "steps_path": stepsPath,
+        "chunk_size": chunkSize,
+        "profile": stages.report(),
     }
+
+
+# Channels of the steps table: (name, CSV format, dtype)!
+STEP_LAYOUT = (("step_index", "d", "<i8"), ("time_s", ".3f", "<f8"))
+
+# Helper function that returns the channels of the steps file, with the gait metrics of modules/gait.py after the step and its time!
+def stepsLayout(gait: bool = True):
+    return STEP_LAYOUT + GAIT_LAYOUT if gait else STEP_LAYOUT
+
+# Helper function that turns detected step indices into the columns of STEP_LAYOUT (the time is the index itself when fs is unknown)!
+def stepColumns(peaks: List[int], samplingFrequency: Optional[int]) -> List[np.ndarray]:
+    indices = np.asarray(peaks, dtype=np.int64)
+    times = indices / float(samplingFrequency) if samplingFrequency and samplingFrequency > 0 else indices.astype(np.float64)
+    return [indices, times]
+
+# Helper function that collects the settings stored in the header of the binary steps formats!
+def stepsMeta(csvPath: str, samplingFrequency: Optional[int], thresholdMode: str | float, sensitivityFactor: float, minGapMiliseconds: int, peakMode: str) -> Dict[str, object]:
+    return {"kind": "steps", "source": csvPath, "fs": samplingFrequency, "threshold_mode": str(thresholdMode), "k_auto": sensitivityFactor, "min_gap_ms": minGapMiliseconds, "peak_mode": peakMode}
+
+# Saving of detected step indices and their timestamps as a CSV file (or 'npz' / 'bin', see imucommon/resultfiles.py), with the per-step gait metrics when given!
+def saveSteps(peaks: List[int], samplingFrequency: Optional[int], csvPath: str, outputFormat: str = "csv", meta: Optional[Dict[str, object]] = None, gait: Optional[Dict[str, object]] = None) -> str:
+    return writeTable(csvPath, outputFormat, stepsLayout(gait is not None), stepColumns(peaks, samplingFrequency) + (gaitColumns(gait) if gait is not None else []), meta)
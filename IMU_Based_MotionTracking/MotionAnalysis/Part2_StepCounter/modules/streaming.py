@@ -0,0 +1,118 @@
+# streaming.py: Counts steps on a live stream of accelerometer magnitudes with constant memory, reporting each step as soon as it is confirmed.
+from collections import deque
+from numbers import Real
+from typing import Dict, Iterable, List, Optional
+
+# Local Imports:
+from modules.filters import MovingAvgStream, highpassWindowLength, lowpassWindowLength
+from modules.gait import GaitTracker
+from modules.peaks import RunningThreshold, WindowedThreshold, parseThresholdMode
+
+class StreamingStepCounter:
+
+    def __init__(self, samplingFrequency: Optional[int] = None, thresholdMode: str | float = "auto", sensitivityFactor: float = 0.8, minGapMiliseconds: int = 350, thresholdWindowSeconds: Optional[float] = None, warmupSamples: Optional[int] = None, maxPending: int = 4096, gait: bool = True):
+
+        # 1) Same filter chain as preprocessSteps, but as ring buffers that are updated sample by sample!
+        self.fs = samplingFrequency
+        self.highpassTrend = MovingAvgStream(highpassWindowLength(samplingFrequency))
+        self.lowpass = MovingAvgStream(lowpassWindowLength(samplingFrequency))
+
+        # 2) Threshold: fixed value, running mean + k*std over the whole session (Welford) or over the last thresholdWindowSeconds ('window:<seconds>' sets it too)!
+        self.fixedThreshold: Optional[float] = None
+        self.runningThreshold = None
+        modeName, modeValue = parseThresholdMode(thresholdMode)
+        if modeName == "window":
+            thresholdWindowSeconds = modeValue
+        if modeName in ("auto", "window"):
+            if thresholdWindowSeconds:
+                windowLength = int(thresholdWindowSeconds * samplingFrequency) if (samplingFrequency and samplingFrequency > 0) else int(thresholdWindowSeconds * 50)
+                self.runningThreshold = WindowedThreshold(windowLength, tresholdSensitivity=sensitivityFactor)
+            else:
+                self.runningThreshold = RunningThreshold(tresholdSensitivity=sensitivityFactor)
+        else:
+            self.fixedThreshold = modeValue
+
+        # 3) Refractory gap in samples, same conversion as processFile!
+        if samplingFrequency and samplingFrequency > 0:
+            self.minPeakDistance = max(1, int(samplingFrequency * (minGapMiliseconds / 1000.0)))
+        else:
+            self.minPeakDistance = 15
+
+        # 4) No peaks are accepted until the gravity trend window is filled once, so the running threshold has settled!
+        self.warmupSamples = highpassWindowLength(samplingFrequency) if warmupSamples is None else max(0, int(warmupSamples))
+
+        # 5) Detection state that survives chunk boundaries: the last two filtered samples, the threshold at the middle one and the last accepted peak
+        self.sampleCount = 0
+        self.previousValue: Optional[float] = None
+        self.currentValue: Optional[float] = None
+        self.currentThreshold = 0.0
+        self.lastPeak = -float('inf')
+        self.stepCount = 0
+        self.pending: deque = deque(maxlen=maxPending)
+
+        # 6) Gait metrics of the confirmed steps (modules/gait.py), updated step by step with the filtered value at the peak as its amplitude!
+        self.gait = GaitTracker(samplingFrequency) if gait else None
+
+    # Feeding one raw magnitude sample through the filters and threshold, returns the index of a step if the previous sample is confirmed as one!
+    def pushSample(self, value: float) -> Optional[int]:
+        highpassed = value - self.highpassTrend.update(value)
+        filtered = self.lowpass.update(highpassed)
+        threshold = self.fixedThreshold if self.runningThreshold is None else self.runningThreshold.update(filtered)
+        index = self.sampleCount
+        self.sampleCount += 1
+
+        # The middle sample (index - 1) is a peak if prev < curr >= next and curr is above the threshold at its time, like in peakDetection
+        confirmedStep = None
+        if self.previousValue is not None and self.currentValue is not None:
+            peakIndex = index - 1
+            if self.previousValue < self.currentValue >= filtered and self.currentValue > self.currentThreshold and peakIndex >= self.warmupSamples:
+                if peakIndex - self.lastPeak >= self.minPeakDistance:
+                    self.lastPeak = peakIndex
+                    self.stepCount += 1
+                    self.pending.append(peakIndex)
+                    confirmedStep = peakIndex
+                    if self.gait is not None:
+                        self.gait.update((peakIndex,), (self.currentValue,))
+
+        self.previousValue, self.currentValue = self.currentValue, filtered
+        self.currentThreshold = threshold
+        return confirmedStep
+
+    # Feeding a chunk (or a single sample), returns the step indices confirmed inside it!
+    def push(self, samples: float | Iterable[float]) -> List[int]:
+        if isinstance(samples, Real): # numpy scalars (np.int64, np.float32) are Real too
+            samples = (samples,)
+        newSteps: List[int] = []
+        for value in samples:
+            step = self.pushSample(float(value))
+            if step is not None:
+                newSteps.append(step)
+        return newSteps
+
+    # Draining the steps confirmed since the last pull (at most maxPending are kept)!
+    def pull(self) -> List[int]:
+        steps = list(self.pending)
+        self.pending.clear()
+        return steps
+
+    # Summary of the session so far, in the same format as processFile!
+    def summary(self) -> Dict[str, object]:
+        if self.fs and self.fs > 0:
+            durationSeconds = self.sampleCount / self.fs
+        else:
+            durationSeconds = None
+
+        if durationSeconds and durationSeconds > 0:
+            cadenceSPM = (self.stepCount / durationSeconds) * 60.0
+        else:
+            cadenceSPM = None
+
+        return {
+            "threshold": self.fixedThreshold if self.runningThreshold is None else self.runningThreshold.value(),
+            "steps": self.stepCount,
+            "samples": self.sampleCount,
+            "fs": self.fs,
+            "duration_s": durationSeconds,
+            "cadence_spm": cadenceSPM,
+            "gait": self.gait.summary() if self.gait is not None else None,
+        }
@@ -0,0 +1,28 @@
+# test_gait.py: The incremental GaitTracker against the one-pass gaitMetrics.
+import numpy as np
+import pytest
+
+from imucommon.parts import STEP_COUNTER_PART, importPartModule
+
+gait = importPartModule(STEP_COUNTER_PART, "modules.gait")
+
+# Helper function: step peaks ~0.55 s apart at 100 Hz with jitter and a pause (new bout) every 40 steps, and their amplitudes!
+def syntheticSteps(count: int = 1000):
+    rng = np.random.default_rng(3)
+    intervals = np.rint(rng.normal(0.55, 0.04, count) * 100).astype(np.int64)
+    intervals[::40] += 500
+    return np.cumsum(intervals), rng.normal(3.0, 0.5, count)
+
+@pytest.mark.parametrize("rollingSteps", [1, 2, 8])
+@pytest.mark.parametrize("chunk", [1, 7, 64, 1000])
+def test_trackerMatchesGaitMetrics(rollingSteps, chunk):
+    peaks, amplitudes = syntheticSteps()
+    expected = gait.gaitMetrics(peaks, amplitudes, 100, rollingSteps=rollingSteps)
+    tracker = gait.GaitTracker(100, rollingSteps=rollingSteps)
+    parts = [tracker.update(peaks[start:start + chunk], amplitudes[start:start + chunk]) for start in range(0, peaks.size, chunk)]
+    for name in gait.GAIT_METRICS:
+        np.testing.assert_array_equal(np.concatenate([part[name] for part in parts]), expected[name], err_msg=name)
+    summary = tracker.summary()
+    assert summary.keys() == expected["summary"].keys()
+    for key, value in expected["summary"].items():
+        assert summary[key] == pytest.approx(value, rel=1e-9, nan_ok=True), key
@@ -0,0 +1,36 @@
+# test_peaks.py: The array-based peak finder against the per-sample peakDetection / peakDetectionWithMerge loops.
+import numpy as np
+import pytest
+
+from imucommon.parts import STEP_COUNTER_PART, importPartModule
+
+peaks = importPartModule(STEP_COUNTER_PART, "modules.peaks")
+
+REFERENCES = {"refractory": peaks.peakDetection, "merge": peaks.peakDetectionWithMerge}
+
+@pytest.mark.parametrize("mode", peaks.PEAK_MODES)
+@pytest.mark.parametrize("minGap", [1, 5, 35, 120])
+def test_findPeaksMatchesReference(stepSignal, mode, minGap):
+    threshold = peaks.dynamicTreshold(stepSignal.tolist())
+    expected = REFERENCES[mode](stepSignal.tolist(), threshold, minGap)
+    assert expected
+    assert peaks.findPeaks(stepSignal, threshold, minGap, mode=mode) == expected
+
+@pytest.mark.parametrize("mode", peaks.PEAK_MODES)
+def test_peakFinderChunksMatchWholeSignal(stepSignal, mode):
+    thresholds = peaks.windowedThresholds(stepSignal, 200)
+    expected = peaks.findPeaks(stepSignal, thresholds, 35, mode=mode)
+    finder = peaks.PeakFinder(35, mode)
+    found = []
+    for start in range(0, stepSignal.size, 257):
+        found += finder.update(stepSignal[start:start + 257], thresholds[start:start + 257])
+    assert found + finder.finish() == expected
+
+# numpy scalars (e.g. a threshold computed with numpy) are one threshold, like Python floats
+@pytest.mark.parametrize("mode", peaks.PEAK_MODES)
+@pytest.mark.parametrize("scalar", [np.float64, np.float32, np.array])
+def test_numpyScalarThreshold(stepSignal, mode, scalar):
+    threshold = float(np.float32(peaks.dynamicTreshold(stepSignal)))
+    expected = REFERENCES[mode](stepSignal.tolist(), threshold, 35)
+    assert REFERENCES[mode](stepSignal.tolist(), scalar(threshold), 35) == expected
+    assert peaks.findPeaks(stepSignal, scalar(threshold), 35, mode=mode) == expected
@@ -0,0 +1,25 @@
+# test_stepcounter.py: The chunked (out-of-core) processFile against the in-memory run.
+import os
+
+import numpy as np
+import pytest
+
+from imucommon.parts import MOTION_ANALYSIS_ROOT, STEP_COUNTER_PART, importPartModule
+
+stepcounter = importPartModule(STEP_COUNTER_PART, "modules.stepcounter")
+
+WALKING_CSV = os.path.join(MOTION_ANALYSIS_ROOT, STEP_COUNTER_PART, "data", "walking.csv")
+
+@pytest.mark.parametrize("engine", ["list", "numpy"])
+@pytest.mark.parametrize("peakMode", ["refractory", "merge"])
+@pytest.mark.parametrize("thresholdMode", ["auto", "window:5"])
+@pytest.mark.parametrize("chunkSize", [97, 1000])
+def test_chunkedMatchesInMemory(engine, peakMode, thresholdMode, chunkSize):
+    options = dict(samplingFrequency=100, thresholdMode=thresholdMode, filterEngine=engine, peakMode=peakMode, useCache=False)
+    expected = stepcounter.processFile(WALKING_CSV, **options)
+    chunked = stepcounter.processFile(WALKING_CSV, chunkSize=chunkSize, **options)
+    assert expected["steps"] > 0
+    assert chunked["peaks"] == expected["peaks"]
+    assert (chunked["samples"], chunked["steps"], chunked["cadence_spm"]) == (expected["samples"], expected["steps"], expected["cadence_spm"])
+    for name in stepcounter.GAIT_METRICS:
+        np.testing.assert_array_equal(chunked["gait"][name], expected["gait"][name], err_msg=name)
@@ -0,0 +1,122 @@
+# loadgen.py: Local load generator for server.py, simulates many devices streaming IMU samples at a fixed rate and measures
+# the end-to-end latency (sample time -> orientation line received back as a subscriber), so sustained rates can be tested without hardware.
+# python loadgen.py --devices 50 --rate 100 --duration 30 --protocol udp --format binary
+import argparse
+import asyncio
+import time
+from math import sin, cos, pi
+
+# Local Imports:
+from modules.poseserver import INGEST_FORMATS, formatSampleLine, packSample
+
+# Synthetic device: rocking roll motion (amplitude 30 deg at 0.5 Hz) with a slow yaw rate, accelerometer consistent with the roll!
+def syntheticSample(device: int, t: float, gravity: float = 9.81):
+    phase = 2.0 * pi * 0.5 * t + device
+    roll = (30.0 * pi / 180.0) * sin(phase)
+    rollRate = (30.0 * pi / 180.0) * 2.0 * pi * 0.5 * cos(phase)
+    return 0.0, gravity * sin(roll), gravity * cos(roll), rollRate, 0.0, 0.05
+
+# 1) Subscriber side: counting orientation lines and their latency relative to the sample time!
+async def subscribe(host: str, port: int, results: dict):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b"SUB *\n")
+    await writer.drain()
+    results["ready"].set()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            fields = line.split(b",")
+            if len(fields) == 5:
+                results["received"] += 1
+                results["latencies"].append(time.perf_counter() - (results["started"] + float(fields[1])))
+    except asyncio.CancelledError:
+        pass
+    finally:
+        writer.close()
+
+# 2) Device side: every tick each device sends the samples that became due since the last tick!
+async def produce(args, started: float, results: dict):
+    encode = packSample if args.format == "binary" else formatSampleLine
+    loop = asyncio.get_running_loop()
+    if args.protocol == "udp":
+        transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(args.host, args.port))
+        send = [transport.sendto] * args.devices
+        writers = []
+    else:
+        writers = [(await asyncio.open_connection(args.host, args.port))[1] for _ in range(args.devices)]
+        send = [writer.write for writer in writers]
+
+    period = args.batch / args.rate
+    ticks = int(args.duration / period)
+    for tick in range(ticks):
+        # 2.1) Pacing: sleeping until the last sample of the tick is due, a tick that starts late counts as 'late'
+        due = started + (tick * args.batch + args.batch - 1) / args.rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif delay < -period:
+            results["late_ticks"] += 1
+
+        # 2.2) Sending one message per device with 'batch' samples
+        for device in range(args.devices):
+            payload = b"".join(encode(device, t, *syntheticSample(device, t)) for t in ((tick * args.batch + k) / args.rate for k in range(args.batch)))
+            send[device](payload)
+        results["sent"] += args.devices * args.batch
+        for writer in writers:
+            await writer.drain()
+
+    if args.protocol == "udp":
+        transport.close()
+    for writer in writers:
+        writer.close()
+
+async def run(args):
+    results = {"sent": 0, "received": 0, "late_ticks": 0, "latencies": [], "ready": asyncio.Event(), "started": 0.0}
+    subscriber = None
+    if args.sub_port:
+        subscriber = asyncio.ensure_future(subscribe(args.host, args.sub_port, results))
+        await results["ready"].wait()
+    started = results["started"] = time.perf_counter()
+    await produce(args, started, results)
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(args.settle)
+    if subscriber is not None:
+        subscriber.cancel()
+        await asyncio.gather(subscriber, return_exceptions=True)
+    return results, elapsed
+
+def main():
+
+    # 1) Creating argument parser for command-line interface!
+    parser = argparse.ArgumentParser(description="Load generator for the pose estimation server")
+    parser.add_argument("--host", default="127.0.0.1", help="Server address (default: 127.0.0.1)")
+    parser.add_argument("--protocol", choices=("udp", "tcp"), default="udp", help="Ingest protocol (default: udp)")
+    parser.add_argument("--port", type=int, default=None, help="Ingest port (default: 9750 for udp, 9751 for tcp)")
+    parser.add_argument("--sub-port", type=int, default=9752, help="Subscriber port, 0 to only send (default=9752)")
+    parser.add_argument("--format", choices=INGEST_FORMATS, default="line", help="Ingest format, must match the server (default: line)")
+    parser.add_argument("--devices", type=int, default=10, help="Simulated devices (default=10)")
+    parser.add_argument("--rate", type=float, default=100.0, help="Samples per second per device (default=100)")
+    parser.add_argument("--batch", type=int, default=1, help="Samples per message per device (default=1)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to send (default=10)")
+    parser.add_argument("--settle", type=float, default=0.5, help="Seconds to keep listening after the last sample (default=0.5)")
+    args = parser.parse_args()
+    if args.port is None:
+        args.port = 9750 if args.protocol == "udp" else 9751
+
+    # 2) Running and reporting!
+    results, elapsed = asyncio.run(run(args))
+    latencies = sorted(results["latencies"])
+    print("\n========== Load Generator Summary ==========")
+    print(f"Devices       : {args.devices} x {args.rate:g} Hz ({args.protocol}, {args.format}, batch {args.batch})")
+    print(f"Sent          : {results['sent']} samples in {elapsed:.2f} s ({results['sent'] / elapsed:.0f} samples/s, target {args.devices * args.rate:.0f})")
+    print(f"Late ticks    : {results['late_ticks']}")
+    if args.sub_port:
+        print(f"Received      : {results['received']} orientation lines ({100.0 * results['received'] / max(1, results['sent']):.1f} %)")
+        if latencies:
+            print(f"Latency       : p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, p99 {latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+    print("============================================\n")
+
+if __name__ == "__main__":
+    main()
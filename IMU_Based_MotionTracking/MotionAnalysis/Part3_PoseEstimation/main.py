@@ -1,9 +1,17 @@
 # main.py:
 # python main.py --file data/mergedWalk.csv --fs 100 --gyro-unit rad --alpha 0.98
+# python main.py --file data/mergedWalk.csv --engine numpy          (no --fs: dt is taken from the timestamp column)
+# python main.py --file data/mergedWalk.csv --fs 100 --filter madgwick --quaternion
+# python main.py --file data/mergedWalk.csv --fs 100 --profile outputs/profile.json --profile-format chrome
+# python main.py --file data/huge.csv --engine numpy --chunk-size 65536     (out-of-core: constant memory, no plot)
 import argparse
 
 # Local Imports:
 from modules.poseEstimator import estimate_pose
+from modules.filter import GAP_MODES, POSE_ENGINES, TIME_MODES
+from modules.orientation import ORIENTATION_FILTERS
+from imucommon.profiling import PROFILE_FORMATS, StageProfiler, writeProfile
+from imucommon.resultfiles import OUTPUT_FORMATS
 
 def main():
 
@@ -12,12 +20,32 @@ def main():
     
     # 1.1) Adding required and optional arguments for user input!
     parser.add_argument("--file", required=True, help="Path to merged IMU CSV (e.g., data/mergedWalk.csv)")
-    parser.add_argument("--fs", type=int, required=True, help="Sampling rate in Hz (e.g., 100)")
+    parser.add_argument("--fs", type=float, default=None, help="Sampling rate in Hz (e.g., 100). If omitted, dt is taken from the timestamps")
+    parser.add_argument("--time-mode", choices=TIME_MODES, default="auto", help="'fixed' (dt = 1/fs), 'timestamps' (real sample spacing) or 'auto' (timestamps when --fs is omitted)")
+    parser.add_argument("--gap-factor", type=float, default=5.0, help="A timestamp step longer than this many median steps is a dropped-packet gap (default=5)")
+    parser.add_argument("--gap-mode", choices=GAP_MODES, default="reset", help="Gap handling: 'reset' to accel tilt, 'hold' the gyro rate after the gap over it, or count it as one 'nominal' step")
     parser.add_argument("--gyro-unit", default="rad", help="Gyro unit: 'rad' or 'deg' (default: rad)")
     parser.add_argument("--alpha", type=float, default=0.98, help="Complementary filter alpha (default=0.98)")
+    parser.add_argument("--filter", choices=ORIENTATION_FILTERS, default="complementary", help="Orientation filter: 'complementary' (Euler angles) or quaternion-based 'madgwick' / 'mahony'")
+    parser.add_argument("--beta", type=float, default=0.1, help="Madgwick gain (default=0.1)")
+    parser.add_argument("--kp", type=float, default=1.0, help="Mahony proportional gain (default=1.0)")
+    parser.add_argument("--ki", type=float, default=0.0, help="Mahony integral gain (default=0.0)")
+    parser.add_argument("--yaw", action="store_true", help="Also write yaw_deg (always on for the quaternion filters)")
+    parser.add_argument("--quaternion", action="store_true", help="Also write the orientation quaternion (qw, qx, qy, qz) to the output CSV")
+    parser.add_argument("--engine", choices=POSE_ENGINES, default="list", help="Filter engine: 'list' (per-sample loop) or 'numpy' (batched kernel, faster)")
+    parser.add_argument("--no-cache", action="store_true", help="Always parse the CSV instead of using its binary .imucache sidecar")
+    parser.add_argument("--no-plot", action="store_true", help="Skip pose_plot.png (matplotlib is then never imported)")
+    parser.add_argument("--out-format", choices=OUTPUT_FORMATS, default="csv", help="Output file format: 'csv' (default), 'npz' (numpy archive) or 'bin' (binary table with a JSON header, see imucommon/resultfiles.py)")
+    parser.add_argument("--chunk-size", type=int, default=None, metavar="N", help="Out-of-core mode for recordings larger than memory: process N samples at a time and stream the CSV (implies --no-plot)")
+    parser.add_argument("--profile", default=None, metavar="PATH", help="Write per-stage wall/CPU time, sample counts and allocation peaks to PATH")
+    parser.add_argument("--profile-format", choices=PROFILE_FORMATS, default="json", help="Profile file format: 'json' or 'chrome' (trace event format for chrome://tracing / Perfetto)")
+    parser.add_argument("--profile-no-memory", action="store_true", help="Skip allocation tracking (tracemalloc) while profiling, which makes the timings closer to an unprofiled run")
     
     # 1.2) Parsing command-line arguments!
     args = parser.parse_args()
+    if args.chunk_size is not None and args.out_format == "npz":
+        parser.error("--out-format npz needs the whole recording, use csv or bin with --chunk-size")
+    profiler = StageProfiler(traceMemory=not args.profile_no_memory, label=args.file) if args.profile else None
 
     # 2) Calling the main pose estimation function with parsed arguments!
     res = estimate_pose(
@@ -26,17 +54,48 @@ def main():
         gyroUnit=args.gyro_unit,
         alpha=args.alpha,
         outputDir="outputs",
-        plot=True
+        plot=not args.no_plot and args.chunk_size is None,
+        useCache=not args.no_cache,
+        engine=args.engine,
+        timeMode=args.time_mode,
+        gapFactor=args.gap_factor,
+        gapMode=args.gap_mode,
+        filterName=args.filter,
+        beta=args.beta,
+        kp=args.kp,
+        ki=args.ki,
+        includeYaw=True if args.yaw else None,
+        quaternionOutput=args.quaternion,
+        profiler=profiler,
+        chunkSize=args.chunk_size,
+        outputFormat=args.out_format
     )
 
     print("\n========== Pose Estimation Summary ==========")
     print(f"File          : {args.file}")
-    print(f"Sampling Rate : {args.fs} Hz")
+    if res["dt_report"] is None:
+        print(f"Sampling Rate : {res['fs']:g} Hz")
+    else:
+        report = res["dt_report"]
+        print(f"Sampling Rate : {report['fs']:.3f} Hz (from timestamps, median dt {report['nominal_dt'] * 1000:.3f} ms)")
+        print(f"Timing issues : {report['non_positive']} non-increasing steps, {report['gaps']} gaps ({report['gap_seconds']:.3f} s, gap mode '{report['gap_mode']}')")
     print(f"Gyro Unit     : {args.gyro_unit}")
-    print(f"Alpha (α)     : {args.alpha}")
-    print(f"Output CSV    : {res['csv_path']}")
+    print(f"Filter        : {args.filter}")
+    if args.filter == "complementary":
+        print(f"Alpha (α)     : {args.alpha}")
+    elif args.filter == "madgwick":
+        print(f"Beta (β)      : {args.beta}")
+    else:
+        print(f"Kp / Ki       : {args.kp} / {args.ki}")
+    print(f"Output File   : {res['output_path']}")
     print(f"Output Plot   : {res['plot_path']}")
+    print(f"Rejected rows : {res['rejected_rows']}")
     print("=============================================\n")
 
+    # 3) Writing the stage profile!
+    if profiler is not None:
+        profiler.close()
+        print(f" Saved profile: {writeProfile(args.profile, [res['profile']], args.profile_format)}")
+
 if __name__ == "__main__":
     main()
@@ -1,29 +1,35 @@
 # dataloader.py: Loading Inertial Measurement Unit data from a CSV file, separating accelerometer and gyroscope readings for further signal processing.
-import csv
-
-def load_imu(file_path):
-    timestamp, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro = [], [], [], [], [], [], []
-
-    # 1) Opening the CSV file for reading!
-    with open(file_path, "r") as f:
-        reader = csv.reader(f)
-        next(reader, None)  
-        
-        # 2) Iterating through each row in the CSV!
-        for row in reader:
-            if not row:
-                continue
-            try:
-                # 3) Converting each sensor reading to float and storing them!
-                timestamp.append(float(row[0]))
-                xAccel.append(float(row[1]))
-                yAccel.append(float(row[2]))
-                zAccel.append(float(row[3]))
-                xGyro.append(float(row[4]))
-                yGyro.append(float(row[5]))
-                zGyro.append(float(row[6]))
-            
-            except ValueError:
-                continue
-
-    return timestamp, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro
\ No newline at end of file
+import os, sys
+from typing import Dict, Iterator, Tuple
+
+# The shared columnar CSV loader lives in MotionAnalysis/imucommon, next to the Part folders!
+sharedRoot = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if sharedRoot not in sys.path:
+    sys.path.append(sharedRoot)
+from imucommon.reccache import iterColumnBlocks, loadColumns
+
+IMU_CHANNELS = ("timestamp", "ax", "ay", "az", "gx", "gy", "gz")
+
+def load_imu_columns(file_path, useCache: bool = True) -> Dict[str, object]:
+
+    # 1) Parsing the first seven columns of the whole CSV at once (or mapping its binary cache), rows that cannot be parsed are counted as rejected!
+    table = loadColumns(file_path, usecols=range(len(IMU_CHANNELS)), useCache=useCache)
+
+    # 2) Each channel is a contiguous float64 array!
+    loaded: Dict[str, object] = dict(zip(IMU_CHANNELS, table["columns"]))
+    loaded["rows"] = table["rows"]
+    loaded["rejected_rows"] = table["rejected_rows"]
+    return loaded
+
+def load_imu(file_path, asArray: bool = False, useCache: bool = True):
+    loaded = load_imu_columns(file_path, useCache=useCache)
+    channels = [loaded[name] for name in IMU_CHANNELS]
+    if not asArray:
+        channels = [channel.tolist() for channel in channels]
+    return tuple(channels)
+
+def iter_imu_chunks(file_path, chunkSize: int = 65536, useCache: bool = True) -> Iterator[Tuple[Dict[str, object], int]]:
+
+    # Same channels as load_imu_columns, chunkSize rows at a time, so recordings larger than memory can be processed: yields (channels, rejected rows)!
+    for block, rejected in iterColumnBlocks(file_path, range(len(IMU_CHANNELS)), rowsPerBlock=chunkSize, useCache=useCache):
+        yield dict(zip(IMU_CHANNELS, block)), rejected
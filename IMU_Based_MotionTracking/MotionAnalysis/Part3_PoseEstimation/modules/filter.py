@@ -1,5 +1,19 @@
 # filter.py: Combining accelerometer and gyroscope data using a complementary filterto estimate orientation (for roll, pitch, and yaw) in degrees.
-from math import atan2, sqrt, pi
+from math import atan2, sqrt, pi, ceil, floor, log
+from typing import Dict, Optional
+
+import numpy as np
+
+# Available filter engines: "list" is the original per-sample loop, "numpy" is the batched kernel!
+POSE_ENGINES = ("list", "numpy")
+
+# Time base of the integration: "fixed" uses dt = 1/samplingRate, "timestamps" uses the real spacing of the timestamp column,
+# "auto" picks "timestamps" when no sampling rate is given!
+TIME_MODES = ("auto", "fixed", "timestamps")
+
+# Handling of dropped packets in "timestamps" mode: "reset" restarts roll/pitch from the accelerometer tilt after the gap (yaw is held),
+# "hold" integrates the gyro rate of the first sample after the gap over the whole gap (like every other step), "nominal" counts the gap as one regular sample!
+GAP_MODES = ("reset", "hold", "nominal")
 
 # Helper function that ensures alpha value stays within [0-1] to maintain valid complementary filter weighting!
 def alphaLimit(alpha: float) -> float:
@@ -17,17 +31,87 @@ def computeAccelTilt(xAccel: float, yAccel: float, zAccel: float):
     pitchAccel = atan2(-xAccel, sqrt(yAccel*yAccel + zAccel*zAccel))    
     return radToDegree(rollAccel), radToDegree(pitchAccel)
 
+# Helper function that rejects unknown gap modes and gap factors that would flag regular steps as gaps!
+def checkGapOptions(gapFactor: float, gapMode: str) -> None:
+    if gapMode not in GAP_MODES:
+        raise ValueError(f"Unknown gap mode '{gapMode}', expected one of {GAP_MODES}")
+    if gapFactor <= 1.0:
+        raise ValueError("gapFactor must be > 1")
+
+# Helper function that turns a timestamp column (seconds) into per-sample integration steps dt[i] = t[i] - t[i-1], with dt[0] unused (0).
+# Duplicated or backwards timestamps get the median step, and steps longer than gapFactor * median are dropped packets, handled by gapMode!
+def timestampSteps(timestamps, gapFactor: float = 5.0, gapMode: str = "reset") -> Dict[str, object]:
+    checkGapOptions(gapFactor, gapMode)
+
+    # 1) Nominal step (median of the increasing steps between consecutive timestamps), which replaces duplicated/backwards steps!
+    t = np.asarray(timestamps, dtype=np.float64)
+    steps = t[1:] - t[:-1]
+    positive = steps[steps > 0.0]
+    if positive.size == 0:
+        raise ValueError("Timestamps never increase, cannot derive dt from them (give a sampling rate instead)")
+    return chunkTimestampSteps(t, float(np.median(positive)), gapFactor, gapMode)
+
+# Helper function behind timestampSteps for one chunk of a longer recording, with the nominal step of the whole recording given.
+# previousTimestamp is the last timestamp of the previous chunk: dt[0] is then a real step (reset index 0 after a gap) instead of unused!
+def chunkTimestampSteps(timestamps, nominalDt: float, gapFactor: float = 5.0, gapMode: str = "reset", previousTimestamp: Optional[float] = None) -> Dict[str, object]:
+    checkGapOptions(gapFactor, gapMode)
+
+    # 1) Raw steps between consecutive timestamps!
+    t = np.asarray(timestamps, dtype=np.float64)
+    dt = np.zeros(t.size)
+    if t.size:
+        np.subtract(t[1:], t[:-1], out=dt[1:])
+        if previousTimestamp is not None:
+            dt[0] = t[0] - previousTimestamp
+    first = 0 if previousTimestamp is not None else 1
+    steps = dt[first:]
+
+    # 2) Duplicated/backwards steps get the nominal step
+    nonPositive = np.flatnonzero(steps <= 0.0) + first
+    dt[nonPositive] = nominalDt
+
+    # 3) Gaps longer than gapFactor * nominal step
+    gaps = np.flatnonzero(steps > gapFactor * nominalDt) + first
+    maxDt = float(steps.max()) if steps.size else 0.0
+    gapSeconds = float(dt[gaps].sum() - gaps.size * nominalDt)
+    if gapMode == "nominal":
+        dt[gaps] = nominalDt
+    elif gapMode == "reset":
+        dt[gaps] = 0.0
+
+    return {
+        "dt": dt,
+        "resets": gaps if gapMode == "reset" else np.empty(0, dtype=np.intp),
+        "nominal_dt": nominalDt,
+        "fs": 1.0 / nominalDt,
+        "max_dt": maxDt,
+        "non_positive": int(nonPositive.size),
+        "gaps": int(gaps.size),
+        "gap_seconds": gapSeconds,
+        "gap_mode": gapMode,
+    }
+
 # Main function: 
-def combineIMUData(xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, samplingRate: float, alpha: float = 0.98, gyroUnit: str = "rad", includeYAW: bool = False):
+# For chunked (out-of-core) runs, steps is the chunkTimestampSteps dict of the chunk and initialState the (roll, pitch, yaw) of the sample
+# before it, so the chunk continues the filter instead of starting from the accelerometer tilt!
+def combineIMUData(xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, samplingRate: Optional[float], alpha: float = 0.98, gyroUnit: str = "rad", includeYAW: bool = False, timestamps=None, gapFactor: float = 5.0, gapMode: str = "reset",
+                   steps: Optional[Dict[str, object]] = None, initialState=None):
     
-    # 1) Validating data length and sampling rate!
+    # 1) Validating data length and sampling rate (not needed when timestamps or steps are given)!
     sampleCount = min(len(xAccel), len(yAccel), len(zAccel), len(xGyro), len(yGyro), len(zGyro))
-    if sampleCount == 0 or samplingRate <= 0:
+    if sampleCount == 0 or (timestamps is None and steps is None and (samplingRate is None or samplingRate <= 0)):
         return ([] , []) if not includeYAW else ([], [], [])
 
     # 2) Normalizing parameters by...
     alpha = alphaLimit(alpha) # ..keeping alpha in [0,1]
-    dt = 1.0 / float(samplingRate) # ..sample perios in seconds
+    if timestamps is None and steps is None:
+        dtSteps = [1.0 / float(samplingRate)] * sampleCount # ..sample perios in seconds
+        resets = set()
+    else:
+        if steps is None:
+            steps = timestampSteps(timestamps[:sampleCount], gapFactor, gapMode) # ..or real spacing of the timestamps
+        dtSteps = steps["dt"][:sampleCount].tolist()
+        resets = set(steps["resets"].tolist())
 
     # 3) Converting gyro units to deg/s for the combination process for roll/pitch!
     if gyroUnit.lower().startswith("deg"):
@@ -39,14 +123,20 @@ def combineIMUData(xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, samplingRate: fl
         yGyroDegree = [g * 180.0 / pi for g in yGyro[:sampleCount]]
         zGyroDegree = [g * 180.0 / pi for g in zGyro[:sampleCount]]
     
-    # 4) Initializing angles (roll, pitch and partially yaw) using accelerometer
-    rollInitial, pitchInitial = computeAccelTilt(xAccel[0], yAccel[0], zAccel[0])
-    rollDegree  = [rollInitial]
-    pitchDegree = [pitchInitial]
-    yawDegree   = [0.0]  
+    # 4) Initializing angles (roll, pitch and partially yaw) using accelerometer, or continuing from the previous chunk
+    if initialState is None:
+        rollInitial, pitchInitial = computeAccelTilt(xAccel[0], yAccel[0], zAccel[0])
+        rollDegree  = [rollInitial]
+        pitchDegree = [pitchInitial]
+        yawDegree   = [0.0]  
+        first = 1
+    else:
+        rollDegree, pitchDegree, yawDegree = [float(initialState[0])], [float(initialState[1])], [float(initialState[2])]
+        first = 0
 
     # 5) Iterating through all samples to: (1) integrate gyro for angle prediction, (2)compute instantaneous tilt from accelerometer, (3) combine them using filter equation
-    for i in range(1, sampleCount):
+    for i in range(first, sampleCount):
+        dt = dtSteps[i]
 
         # 5.1) integrate gyro for angle prediction,
         rollGyro  = rollDegree[-1]  + xGyroDegree[i] * dt
@@ -56,16 +146,136 @@ def combineIMUData(xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, samplingRate: fl
         # 5.2) compute instantaneous tilt from accelerometer,
         rollAccel, pitchAccel = computeAccelTilt(xAccel[i], yAccel[i], zAccel[i])
 
-        # 5.3) combine (high-freq from gyro and low-freq from accel) with filter equation,
-        rollTotal = alpha * rollGyro  + (1.0 - alpha) * rollAccel
-        pitchTotal = alpha * pitchGyro + (1.0 - alpha) * pitchAccel
+        # 5.3) combine (high-freq from gyro and low-freq from accel) with filter equation, or restart from the accel tilt after a gap,
+        if i in resets:
+            rollTotal, pitchTotal = rollAccel, pitchAccel
+        else:
+            rollTotal = alpha * rollGyro  + (1.0 - alpha) * rollAccel
+            pitchTotal = alpha * pitchGyro + (1.0 - alpha) * pitchAccel
 
         # 5.4) append to output arrays!
         rollDegree.append(rollTotal)
         pitchDegree.append(pitchTotal)
         yawDegree.append(yawGyro)
 
+    if initialState is not None:
+        rollDegree, pitchDegree, yawDegree = rollDegree[1:], pitchDegree[1:], yawDegree[1:]
+    if includeYAW:
+        return rollDegree, pitchDegree, yawDegree
+    else:
+        return rollDegree, pitchDegree
+
+
+# Helper function that calculates roll and pitch angles (in degrees) for whole accelerometer arrays in one vectorized pass!
+def computeAccelTiltBatch(xAccel: np.ndarray, yAccel: np.ndarray, zAccel: np.ndarray):
+    rollAccel  = np.arctan2(yAccel, zAccel)
+    pitchAccel = np.arctan2(-xAccel, np.sqrt(yAccel*yAccel + zAccel*zAccel))
+    for angle in (rollAccel, pitchAccel):
+        angle *= 180.0
+        angle /= pi
+    return rollAccel, pitchAccel
+
+# Helper function that evaluates the first-order recurrence y[i] = coefficient*y[i-1] + inputs[i] (with y[-1] = initial) without a per-sample loop.
+# The signal is cut into blocks of B samples where coefficient^B is about 1e-12: inside a block the solution is a scaled cumulative sum,
+# and the state entering each block is a short (truncated) series over the previous block ends!
+def linearRecurrence(inputs, coefficient: float, initial: float = 0.0) -> np.ndarray:
+    u = np.asarray(inputs, dtype=np.float64)
+    sampleCount = u.size
+    if sampleCount == 0 or coefficient == 0.0:
+        return u.copy()
+    if coefficient == 1.0:
+        return initial + np.cumsum(u)
+
+    # 1) Splitting into blocks and summing every block from a zero state: S[b, j] = sum_k coefficient^-k * u[b, k]
+    blockLength = int(min(sampleCount, max(1, floor(log(1e-12) / log(coefficient)))))
+    blockCount = -(-sampleCount // blockLength)
+    blocks = np.zeros((blockCount, blockLength))
+    blocks.ravel()[:sampleCount] = u
+    exponents = np.arange(blockLength)
+    blocks *= coefficient ** -exponents
+    np.cumsum(blocks, axis=1, out=blocks)
+
+    # 2) State entering block b: s[b] = c^B * s[b-1] + (end of block b-1), summed only while c^(B*t) still matters in double precision
+    blockCoefficient = coefficient ** blockLength
+    blockEnds = blocks[:, -1] * coefficient ** (blockLength - 1)
+    entering = np.zeros(blockCount)
+    entering[0] = initial
+    terms = min(blockCount - 1, 1 if blockCoefficient == 0.0 else max(1, ceil(log(1e-18) / log(blockCoefficient))))
+    for t in range(terms):
+        entering[t + 1:] += blockCoefficient ** t * blockEnds[:blockCount - 1 - t]
+    entering[1:terms + 1] += initial * blockCoefficient ** np.arange(1, terms + 1)
+
+    # 3) y[b, j] = c^j * (S[b, j] + c * s[b])
+    blocks += (coefficient * entering)[:, None]
+    blocks *= coefficient ** exponents
+    return blocks.ravel()[:sampleCount]
+
+# Batched version of combineIMUData: same inputs and same outputs (as float64 arrays), without the per-sample Python loop!
+# steps/initialState continue a chunked run like in combineIMUData. Roll and pitch then agree with a whole-recording run to about 1e-12 degrees
+# (the blocked recurrence solver rounds differently at chunk borders), yaw is exact! accelTilt passes the (roll, pitch) of computeAccelTiltBatch
+# when it is already known, e.g. a parameter sweep reuses it for every alpha!
+def combineIMUDataBatch(xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, samplingRate: Optional[float], alpha: float = 0.98, gyroUnit: str = "rad", includeYAW: bool = False, timestamps=None, gapFactor: float = 5.0, gapMode: str = "reset",
+                        steps: Optional[Dict[str, object]] = None, initialState=None, accelTilt=None):
+
+    # 1) Validating data length and sampling rate (not needed when timestamps or steps are given)!
+    sampleCount = min(len(xAccel), len(yAccel), len(zAccel), len(xGyro), len(yGyro), len(zGyro))
+    if sampleCount == 0 or (timestamps is None and steps is None and (samplingRate is None or samplingRate <= 0)):
+        return (np.empty(0), np.empty(0)) if not includeYAW else (np.empty(0), np.empty(0), np.empty(0))
+
+    # 2) Normalizing parameters, the gyro conversion to deg/s is folded into the integration step (dt is a scalar or a per-sample array)!
+    # Segments start at sample 0 and after every reset; a continued chunk starts with a segment carrying the previous state
+    alpha = alphaLimit(alpha)
+    if timestamps is None and steps is None:
+        dt = 1.0 / float(samplingRate)
+        restarts = []
+    else:
+        if steps is None:
+            steps = timestampSteps(np.asarray(timestamps)[:sampleCount], gapFactor, gapMode)
+        dt = steps["dt"][:sampleCount]
+        restarts = steps["resets"].tolist()
+    restarts = sorted(set(restarts) | ({0} if initialState is None else set()))
+    segmentStarts = restarts if restarts and restarts[0] == 0 else [0] + restarts
+    segmentBounds = list(zip(segmentStarts, segmentStarts[1:] + [sampleCount]))
+    restarts = set(restarts)
+    gyroScale = 1.0 if gyroUnit.lower().startswith("deg") else 180.0 / pi
+    xAccel, yAccel, zAccel, xGyro, yGyro, zGyro = (np.asarray(a, dtype=np.float64)[:sampleCount] for a in (xAccel, yAccel, zAccel, xGyro, yGyro, zGyro))
+
+    # 3) Accelerometer tilt for every sample at once!
+    rollAccel, pitchAccel = computeAccelTiltBatch(xAccel, yAccel, zAccel) if accelTilt is None else (np.asarray(accelTilt[0])[:sampleCount], np.asarray(accelTilt[1])[:sampleCount])
+
+    # 4) Filter equation y[i] = alpha*(y[i-1] + gyro[i]*dt[i]) + (1-alpha)*accel[i], where y[0] is the accelerometer tilt of sample 0.
+    # A gap reset starts a new segment whose first sample is again the accelerometer tilt!
+    angles = []
+    for k, (gyro, accelDegree) in enumerate(((xGyro, rollAccel), (yGyro, pitchAccel))):
+        inputs = gyro * (alpha * gyroScale * dt)
+        inputs += (1.0 - alpha) * accelDegree
+        if len(segmentBounds) == 1 and initialState is None:
+            inputs[0] = accelDegree[0]
+            angles.append(linearRecurrence(inputs, alpha))
+            continue
+        angle = np.empty(sampleCount)
+        for start, stop in segmentBounds:
+            initial = 0.0
+            if start in restarts:
+                inputs[start] = accelDegree[start]
+            else:
+                initial = float(initialState[k])
+            angle[start:stop] = linearRecurrence(inputs[start:stop], alpha, initial=initial)
+        angles.append(angle)
+    rollDegree, pitchDegree = angles
+
+    # Yaw is a plain running sum, a continued chunk prepends the previous yaw so the sums are the same as in one run
     if includeYAW:
+        if initialState is None:
+            yawDegree = zGyro * (gyroScale * dt)
+            yawDegree[0] = 0.0
+            np.cumsum(yawDegree, out=yawDegree)
+        else:
+            yawDegree = np.empty(sampleCount + 1)
+            yawDegree[0] = initialState[2]
+            np.multiply(zGyro, gyroScale * dt, out=yawDegree[1:])
+            np.cumsum(yawDegree, out=yawDegree)
+            yawDegree = yawDegree[1:]
         return rollDegree, pitchDegree, yawDegree
     else:
         return rollDegree, pitchDegree
@@ -1,48 +1,186 @@
-# merge_imu.py: Merges accelerometer and gyroscope data into a single time-synchronized CSV file for further analysis.
-import csv
-
-ACC_PATH = "data/Accelerometer.csv"
-GYR_PATH = "data/Gyroscope.csv"
-OUT_PATH = "data/mergedWalk.csv"
-
-# 1) Loading the Accelerometer Data:
-accelTime, xAccel, yAccel, zAccel = [], [], [], []
-with open(ACC_PATH, "r") as file:
-    reader = csv.reader(file); head = next(reader)
-    for row in reader:
-        try:
-            accelTime.append(float(row[0])) # Time (s)
-            xAccel.append(float(row[1])) # X (m/s^2)
-            yAccel.append(float(row[2])) # Y (m/s^2)
-            zAccel.append(float(row[3])) # Z (m/s^2)
-        except:
-            continue
-
-
-# 2) Loading the Gyroscope Data:
-gyroTime, xGyro, yGyro, zGyro = [], [], [], []
-with open(GYR_PATH, "r") as file:
-    reader = csv.reader(file); head = next(reader)
-    for row in reader:
-        try:
-            gyroTime.append(float(row[0])) # Time (s)
-            xGyro.append(float(row[1])) # X (rad/s)
-            yGyro.append(float(row[2])) # Y (rad/s)
-            zGyro.append(float(row[3])) # Z (rad/s)
-        except:
-            continue
-
-
-# 3) Syncing the record lengths and normalizing the time
-sampleCount = min(len(accelTime), len(gyroTime), len(xAccel), len(xGyro))
-startTime = accelTime[0] if sampleCount > 0 else 0.0
-timestamp = [accelTime[i] - startTime for i in range(sampleCount)] # Normalize timestamps relative to the first accelerometer sample
-
-# 4) Writing the Merged Dataset to CSV
-with open(OUT_PATH, "w", newline="") as file:
-    writer = csv.writer(file)
-    writer.writerow(["timestamp", "ax", "ay", "az", "gx", "gy", "gz"])
-    for i in range(sampleCount):
-        writer.writerow([f"{timestamp[i]:.6f}", xAccel[i], yAccel[i], zAccel[i], xGyro[i], yGyro[i], zGyro[i]])
-
-print(f" Created {OUT_PATH} ({sampleCount} samples). Duration ~ {timestamp[-1]:.2f}s")
\ No newline at end of file
+# merge_imu.py: Merges accelerometer and gyroscope data into a single time-synchronized CSV file for further analysis.
+# Both streams are aligned on their own 'Time (s)' columns and resampled to one uniform clock, reading the files block by block.
+import argparse
+import math
+import os
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# The shared columnar CSV loader lives in MotionAnalysis/imucommon, next to the Part folders!
+sharedRoot = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if sharedRoot not in sys.path:
+    sys.path.append(sharedRoot)
+from imucommon.columnar import iterCsvBlocks, readCsvColumns
+from imucommon.resultfiles import CsvTableWriter
+
+ACC_PATH = "data/Accelerometer.csv"
+GYR_PATH = "data/Gyroscope.csv"
+OUT_PATH = "data/mergedWalk.csv"
+
+MERGE_METHODS = ("linear", "nearest", "index")
+# Merged table: (name, CSV format, dtype). The sensor channels are written with repr, so they read back as exactly the merged floats!
+MERGED_LAYOUT = (("timestamp", ".6f", "<f8"),) + tuple((name, "r", "<f8") for name in ("ax", "ay", "az", "gx", "gy", "gz"))
+MAX_LISTED_GAPS = 1000
+
+# 1) One sensor file read block by block ('Time (s)' + X, Y, Z columns), keeping only the samples still needed for resampling:
+class SensorStream:
+
+    def __init__(self, csvPath: str, rowsPerBlock: int = 65536, gapFactor: float = 3.0):
+        self.blocks = iterCsvBlocks(csvPath, usecols=(0, 1, 2, 3), rowsPerBlock=rowsPerBlock)
+        self.gapFactor = gapFactor
+        self.time = np.empty(0)
+        self.values = np.empty((0, 3))
+        self.lastTime = -math.inf
+        self.nominalDt: Optional[float] = None
+        self.report: Dict[str, object] = {"path": csvPath, "samples": 0, "rejected_rows": 0, "duplicates": 0, "out_of_order": 0, "gaps": 0, "missing_samples": 0, "gap_list": []}
+
+    # 1.1) Reading the next block, dropping duplicated and out-of-order timestamps and recording gaps. Returns False at the end of the file!
+    def readBlock(self) -> bool:
+        block, rejected = next(self.blocks, (None, 0))
+        if block is None:
+            return False
+        self.report["rejected_rows"] += rejected
+        if len(block) == 0:
+            return True
+
+        # 1.1.1) A sample is kept only if its time is later than every sample before it
+        blockTime = block[:, 0]
+        previousMax = np.maximum.accumulate(np.concatenate(([self.lastTime], blockTime)))[:-1]
+        keep = blockTime > previousMax
+        self.report["duplicates"] += int(np.count_nonzero(blockTime == previousMax))
+        self.report["out_of_order"] += int(np.count_nonzero(blockTime < previousMax))
+        blockTime, blockValues = blockTime[keep], block[keep, 1:]
+        if blockTime.size == 0:
+            return True
+
+        # 1.1.2) Nominal sample period from the first block, then gaps longer than gapFactor periods are reported as dropped samples
+        steps = np.diff(np.concatenate(([self.lastTime], blockTime))) if math.isfinite(self.lastTime) else np.diff(blockTime)
+        if self.nominalDt is None and blockTime.size > 1:
+            self.nominalDt = float(np.median(np.diff(blockTime)))
+        if self.nominalDt:
+            gapIndex = np.flatnonzero(steps > self.gapFactor * self.nominalDt)
+            offset = 1 if not math.isfinite(self.lastTime) else 0
+            for i in gapIndex:
+                gapStart, gapEnd = float(blockTime[i + offset] - steps[i]), float(blockTime[i + offset])
+                missing = max(0, int(round((gapEnd - gapStart) / self.nominalDt)) - 1)
+                self.report["gaps"] += 1
+                self.report["missing_samples"] += missing
+                if len(self.report["gap_list"]) < MAX_LISTED_GAPS:
+                    self.report["gap_list"].append({"start_s": gapStart, "end_s": gapEnd, "missing": missing})
+
+        self.report["samples"] += int(blockTime.size)
+        self.time = np.concatenate((self.time, blockTime))
+        self.values = np.concatenate((self.values, blockValues))
+        self.lastTime = float(blockTime[-1])
+        return True
+
+    # 1.2) Values of the three axes at the given (sorted) clock times!
+    def sample(self, clockTime: np.ndarray, method: str) -> np.ndarray:
+        if method == "linear":
+            return np.column_stack([np.interp(clockTime, self.time, self.values[:, axis]) for axis in range(3)])
+        right = np.clip(np.searchsorted(self.time, clockTime), 0, self.time.size - 1)
+        left = np.maximum(right - 1, 0)
+        nearest = np.where(np.abs(clockTime - self.time[left]) <= np.abs(self.time[right] - clockTime), left, right)
+        return self.values[nearest]
+
+    # 1.3) Forgetting the samples before the last one at or before clockTime, they are not needed anymore!
+    def trim(self, clockTime: float) -> None:
+        first = max(0, int(np.searchsorted(self.time, clockTime, side="right")) - 1)
+        self.time, self.values = self.time[first:], self.values[first:]
+
+# 2) Main function: resampling both sensors onto a uniform clock at 'rate' Hz (default: the accelerometer rate) and writing the merged CSV!
+def mergeStreams(accelPath: str = ACC_PATH, gyroPath: str = GYR_PATH, outPath: str = OUT_PATH, rate: Optional[float] = None, method: str = "linear", gapFactor: float = 3.0, rowsPerBlock: int = 65536) -> Dict[str, object]:
+    if method == "index":
+        return mergeByIndex(accelPath, gyroPath, outPath)
+    if method not in MERGE_METHODS:
+        raise ValueError(f"Unknown merge method '{method}', expected one of {MERGE_METHODS}")
+
+    # 2.1) Reading until both streams have samples (and a nominal period)
+    accel = SensorStream(accelPath, rowsPerBlock, gapFactor)
+    gyro = SensorStream(gyroPath, rowsPerBlock, gapFactor)
+    for stream in (accel, gyro):
+        while (stream.time.size < 2) and stream.readBlock():
+            pass
+
+    rowCount, startTime, clockIndex = 0, 0.0, 0
+    with CsvTableWriter(outPath, MERGED_LAYOUT) as writer:
+        if accel.time.size and gyro.time.size:
+            if rate is None:
+                rate = 1.0 / accel.nominalDt if accel.nominalDt else 100.0
+            if rate <= 0:
+                raise ValueError("Resampling rate must be > 0 Hz")
+            startTime = max(accel.time[0], gyro.time[0])
+
+            # 2.2) Emitting every clock tick that both streams already cover, then reading more of the stream that is behind
+            while True:
+                coveredUntil = min(accel.lastTime, gyro.lastTime)
+                clockEnd = int(math.floor((coveredUntil - startTime) * rate)) + 1
+                if clockEnd > clockIndex:
+                    clockTime = startTime + np.arange(clockIndex, clockEnd) / rate
+                    accelValues, gyroValues = accel.sample(clockTime, method), gyro.sample(clockTime, method)
+                    writer.write([clockTime - startTime, *accelValues.T, *gyroValues.T])
+                    rowCount += len(clockTime)
+                    clockIndex = clockEnd
+                    accel.trim(clockTime[-1]); gyro.trim(clockTime[-1])
+
+                behind = accel if accel.lastTime <= gyro.lastTime else gyro
+                if not behind.readBlock():
+                    break
+
+    return {
+        "out_path": outPath,
+        "method": method,
+        "rate_hz": rate,
+        "samples": rowCount,
+        "start_s": float(startTime),
+        "duration_s": (rowCount - 1) / rate if rowCount > 1 else 0.0,
+        "accel": accel.report,
+        "gyro": gyro.report,
+    }
+
+# 3) Legacy pairing: accelerometer row i with gyroscope row i, cut to the shorter file and using the accelerometer timestamps!
+def mergeByIndex(accelPath: str = ACC_PATH, gyroPath: str = GYR_PATH, outPath: str = OUT_PATH) -> Dict[str, object]:
+    accel = readCsvColumns(accelPath, usecols=(0, 1, 2, 3))
+    gyro = readCsvColumns(gyroPath, usecols=(0, 1, 2, 3))
+    sampleCount = min(accel["rows"], gyro["rows"])
+    startTime = accel["columns"][0][0] if sampleCount > 0 else 0.0
+    timestamps = accel["columns"][0][:sampleCount] - startTime
+    with CsvTableWriter(outPath, MERGED_LAYOUT) as writer:
+        writer.write([timestamps, *accel["columns"][1:, :sampleCount], *gyro["columns"][1:, :sampleCount]])
+    return {
+        "out_path": outPath,
+        "method": "index",
+        "rate_hz": None,
+        "samples": sampleCount,
+        "start_s": float(startTime),
+        "duration_s": float(timestamps[-1]) if sampleCount else 0.0,
+        "accel": {"path": accelPath, "samples": accel["rows"], "rejected_rows": accel["rejected_rows"]},
+        "gyro": {"path": gyroPath, "samples": gyro["rows"], "rejected_rows": gyro["rejected_rows"]},
+    }
+
+# Helper function that prints the per-sensor part of the merge report!
+def printStreamReport(name: str, report: Dict[str, object]) -> None:
+    line = f" {name:<5}: {report['samples']} samples, {report['rejected_rows']} rejected rows"
+    if "gaps" in report:
+        line += f", {report['duplicates']} duplicated, {report['out_of_order']} out of order, {report['gaps']} gaps (~{report['missing_samples']} dropped samples)"
+    print(line)
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Merge accelerometer and gyroscope CSVs on a common clock")
+    ap.add_argument("--acc", default=ACC_PATH, help=f"Accelerometer CSV (default: {ACC_PATH})")
+    ap.add_argument("--gyro", default=GYR_PATH, help=f"Gyroscope CSV (default: {GYR_PATH})")
+    ap.add_argument("--out", default=OUT_PATH, help=f"Merged output CSV (default: {OUT_PATH})")
+    ap.add_argument("--rate", type=float, default=None, help="Output rate in Hz (default: accelerometer rate)")
+    ap.add_argument("--method", choices=MERGE_METHODS, default="linear", help="Interpolation: linear, nearest, or index (legacy row pairing)")
+    ap.add_argument("--gap-factor", type=float, default=3.0, help="A step longer than this many sample periods is a gap (default=3)")
+    args = ap.parse_args(argv)
+
+    report = mergeStreams(args.acc, args.gyro, args.out, rate=args.rate, method=args.method, gapFactor=args.gap_factor)
+    print(f" Created {report['out_path']} ({report['samples']} samples). Duration ~ {report['duration_s']:.2f}s")
+    printStreamReport("accel", report["accel"])
+    printStreamReport("gyro", report["gyro"])
+
+if __name__ == "__main__":
+    main()
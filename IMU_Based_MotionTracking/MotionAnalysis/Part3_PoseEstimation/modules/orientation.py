@@ -0,0 +1,263 @@
+# orientation.py: Pluggable orientation filters (complementary, Madgwick, Mahony) that track a full 3D orientation quaternion.
+# Every filter has the same two entry points: run(...) for whole recordings and update(...) for one sample at a time (streaming),
+# and keeps its state in one small preallocated array: state[0:4] is the quaternion (w, x, y, z), the rest is filter specific!
+from math import sqrt, sin, cos, pi
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Local Imports:
+from modules.filter import alphaLimit, computeAccelTilt, computeAccelTiltBatch, linearRecurrence
+
+# Helper function that converts Euler angles (roll, pitch, yaw in degrees, ZYX order) of one sample into a quaternion!
+def quaternionFromEuler(rollDegree: float, pitchDegree: float, yawDegree: float) -> Tuple[float, float, float, float]:
+    cr, sr = cos(rollDegree * pi / 360.0), sin(rollDegree * pi / 360.0)
+    cp, sp = cos(pitchDegree * pi / 360.0), sin(pitchDegree * pi / 360.0)
+    cy, sy = cos(yawDegree * pi / 360.0), sin(yawDegree * pi / 360.0)
+    return (cr*cp*cy + sr*sp*sy, sr*cp*cy - cr*sp*sy, cr*sp*cy + sr*cp*sy, cr*cp*sy - sr*sp*cy)
+
+# Vectorized version of quaternionFromEuler: angle arrays in, (n, 4) quaternion array out!
+def eulerToQuaternion(rollDegree, pitchDegree, yawDegree, out: Optional[np.ndarray] = None) -> np.ndarray:
+    halfAngles = [np.asarray(angle, dtype=np.float64) * (pi / 360.0) for angle in (rollDegree, pitchDegree, yawDegree)]
+    (cr, cp, cy), (sr, sp, sy) = [np.cos(a) for a in halfAngles], [np.sin(a) for a in halfAngles]
+    if out is None:
+        out = np.empty((halfAngles[0].size, 4))
+    out[:, 0] = cr*cp*cy + sr*sp*sy
+    out[:, 1] = sr*cp*cy - cr*sp*sy
+    out[:, 2] = cr*sp*cy + sr*cp*sy
+    out[:, 3] = cr*cp*sy - sr*sp*cy
+    return out
+
+# Helper function that converts (n, 4) quaternions into roll, pitch and yaw arrays in degrees (ZYX order, pitch in [-90, 90])!
+def quaternionToEuler(quaternion: np.ndarray):
+    w, x, y, z = (quaternion[:, k] for k in range(4))
+    rollDegree = np.degrees(np.arctan2(2.0 * (w*x + y*z), 1.0 - 2.0 * (x*x + y*y)))
+    pitchDegree = np.degrees(np.arcsin(np.clip(2.0 * (w*y - z*x), -1.0, 1.0)))
+    yawDegree = np.degrees(np.arctan2(2.0 * (w*z + x*y), 1.0 - 2.0 * (y*y + z*z)))
+    return rollDegree, pitchDegree, yawDegree
+
+# Base class of the orientation filters. Subclasses set stateSize and implement _loop (the per-sample update over plain lists),
+# or override _integrate when the filter can run a whole segment vectorized!
+class OrientationFilter:
+    name = ""
+    stateSize = 4
+
+    def __init__(self, gyroUnit: str = "rad"):
+        self.gyroUnit = gyroUnit
+        self.state = np.zeros(self.stateSize)
+        self.reset()
+
+    # Radians per gyro unit, quaternion filters integrate in rad/s!
+    def gyroScale(self) -> float:
+        return pi / 180.0 if self.gyroUnit.lower().startswith("deg") else 1.0
+
+    def reset(self):
+        self.state[:] = 0.0
+        self.state[0] = 1.0
+        self.initialized = False
+
+    # Starting the orientation from the accelerometer tilt of one sample (yaw = 0), which skips the convergence phase!
+    def initialize(self, xAccel: float, yAccel: float, zAccel: float):
+        rollAccel, pitchAccel = computeAccelTilt(xAccel, yAccel, zAccel)
+        self.state[:] = 0.0
+        self.state[:4] = quaternionFromEuler(rollAccel, pitchAccel, 0.0)
+        self.initialized = True
+
+    def quaternion(self) -> Tuple[float, float, float, float]:
+        return tuple(self.state[:4].tolist())
+
+    # Streaming entry point: one sample in, the updated quaternion (w, x, y, z) out!
+    def update(self, xAccel: float, yAccel: float, zAccel: float, xGyro: float, yGyro: float, zGyro: float, dt: float) -> Tuple[float, float, float, float]:
+        if not self.initialized:
+            self.initialize(xAccel, yAccel, zAccel)
+        else:
+            self._loop([xAccel], [yAccel], [zAccel], [xGyro], [yGyro], [zGyro], [dt])
+        return self.quaternion()
+
+    # Batch entry point: whole channel arrays in, (n, 4) quaternions out. dt is a scalar or a per-sample array, and the filter
+    # restarts from the accelerometer tilt at every index in resets (e.g. after dropped packets) and at sample 0 of a fresh filter!
+    def run(self, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, dt, resets=None) -> np.ndarray:
+        channels = [np.asarray(channel, dtype=np.float64) for channel in (xAccel, yAccel, zAccel, xGyro, yGyro, zGyro)]
+        sampleCount = min(channel.size for channel in channels)
+        channels = [channel[:sampleCount] for channel in channels]
+        steps = np.full(sampleCount, float(dt)) if np.ndim(dt) == 0 else np.asarray(dt, dtype=np.float64)[:sampleCount]
+        out = np.empty((sampleCount, 4))
+
+        starts = set(int(i) for i in (resets if resets is not None else ()))
+        if not self.initialized:
+            starts.add(0)
+        position = 0
+        for start in sorted(i for i in starts if i < sampleCount) + [sampleCount]:
+            if start > position:
+                self._integrate(*(channel[position:start] for channel in channels), steps[position:start], out[position:start])
+            if start < sampleCount:
+                self.initialize(channels[0][start], channels[1][start], channels[2][start])
+                out[start] = self.state[:4]
+                position = start + 1
+        return out
+
+    def _integrate(self, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, dt, out: np.ndarray):
+        out[:] = self._loop(xAccel.tolist(), yAccel.tolist(), zAccel.tolist(), xGyro.tolist(), yGyro.tolist(), zGyro.tolist(), dt.tolist())
+
+    def _loop(self, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, dt) -> List[Tuple[float, float, float, float]]:
+        raise NotImplementedError
+
+
+# Complementary filter of filter.py behind the same interface. Extra state: state[4:7] = roll, pitch, yaw in degrees!
+class ComplementaryFilter(OrientationFilter):
+    name = "complementary"
+    stateSize = 7
+
+    def __init__(self, gyroUnit: str = "rad", alpha: float = 0.98):
+        self.alpha = alphaLimit(alpha)
+        super().__init__(gyroUnit)
+
+    # The complementary filter works in degrees!
+    def gyroScale(self) -> float:
+        return 1.0 if self.gyroUnit.lower().startswith("deg") else 180.0 / pi
+
+    def initialize(self, xAccel: float, yAccel: float, zAccel: float):
+        super().initialize(xAccel, yAccel, zAccel)
+        self.state[4:6] = computeAccelTilt(xAccel, yAccel, zAccel)
+
+    def update(self, xAccel: float, yAccel: float, zAccel: float, xGyro: float, yGyro: float, zGyro: float, dt: float) -> Tuple[float, float, float, float]:
+        if not self.initialized:
+            self.initialize(xAccel, yAccel, zAccel)
+            return self.quaternion()
+        alpha, step = self.alpha, self.gyroScale() * dt
+        rollDegree, pitchDegree, yawDegree = self.state[4:7].tolist()
+        rollAccel, pitchAccel = computeAccelTilt(xAccel, yAccel, zAccel)
+        rollDegree = alpha * (rollDegree + xGyro * step) + (1.0 - alpha) * rollAccel
+        pitchDegree = alpha * (pitchDegree + yGyro * step) + (1.0 - alpha) * pitchAccel
+        yawDegree += zGyro * step
+        self.state[4:7] = (rollDegree, pitchDegree, yawDegree)
+        self.state[:4] = quaternionFromEuler(rollDegree, pitchDegree, yawDegree)
+        return self.quaternion()
+
+    # Whole segment at once with the blocked recurrence solver, continuing from the current state!
+    def _integrate(self, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, dt, out: np.ndarray):
+        alpha = self.alpha
+        step = dt * self.gyroScale()
+        rollAccel, pitchAccel = computeAccelTiltBatch(xAccel, yAccel, zAccel)
+        angles = []
+        for gyro, accelDegree, initial in ((xGyro, rollAccel, self.state[4]), (yGyro, pitchAccel, self.state[5])):
+            inputs = gyro * step
+            inputs *= alpha
+            inputs += (1.0 - alpha) * accelDegree
+            angles.append(linearRecurrence(inputs, alpha, initial=float(initial)))
+        yawDegree = zGyro * step
+        np.cumsum(yawDegree, out=yawDegree)
+        yawDegree += self.state[6]
+        eulerToQuaternion(angles[0], angles[1], yawDegree, out=out)
+        self.state[4:7] = (angles[0][-1], angles[1][-1], yawDegree[-1])
+        self.state[:4] = out[-1]
+
+
+# Madgwick gradient-descent filter (IMU version, no magnetometer): gyro rate minus beta times the normalized gradient of the gravity error!
+class MadgwickFilter(OrientationFilter):
+    name = "madgwick"
+    stateSize = 4
+
+    def __init__(self, gyroUnit: str = "rad", beta: float = 0.1):
+        self.beta = beta
+        super().__init__(gyroUnit)
+
+    def _loop(self, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, dt):
+        q0, q1, q2, q3 = self.state[:4].tolist()
+        beta, scale = self.beta, self.gyroScale()
+        rows = []
+        for i in range(len(dt)):
+            gx, gy, gz = xGyro[i] * scale, yGyro[i] * scale, zGyro[i] * scale
+
+            # 1) Rate of change of the quaternion from the gyroscope
+            qDot0 = 0.5 * (-q1*gx - q2*gy - q3*gz)
+            qDot1 = 0.5 * (q0*gx + q2*gz - q3*gy)
+            qDot2 = 0.5 * (q0*gy - q1*gz + q3*gx)
+            qDot3 = 0.5 * (q0*gz + q1*gy - q2*gx)
+
+            # 2) Gradient-descent correction towards the measured gravity direction (skipped when the accelerometer reads zero)
+            ax, ay, az = xAccel[i], yAccel[i], zAccel[i]
+            norm = sqrt(ax*ax + ay*ay + az*az)
+            if norm > 0.0:
+                ax, ay, az = ax / norm, ay / norm, az / norm
+                q0q0, q1q1, q2q2, q3q3 = q0*q0, q1*q1, q2*q2, q3*q3
+                s0 = 4.0*q0*q2q2 + 2.0*q2*ax + 4.0*q0*q1q1 - 2.0*q1*ay
+                s1 = 4.0*q1*q3q3 - 2.0*q3*ax + 4.0*q0q0*q1 - 2.0*q0*ay - 4.0*q1 + 8.0*q1*q1q1 + 8.0*q1*q2q2 + 4.0*q1*az
+                s2 = 4.0*q0q0*q2 + 2.0*q0*ax + 4.0*q2*q3q3 - 2.0*q3*ay - 4.0*q2 + 8.0*q2*q1q1 + 8.0*q2*q2q2 + 4.0*q2*az
+                s3 = 4.0*q1q1*q3 - 2.0*q1*ax + 4.0*q2q2*q3 - 2.0*q2*ay
+                norm = sqrt(s0*s0 + s1*s1 + s2*s2 + s3*s3)
+                if norm > 0.0:
+                    qDot0 -= beta * s0 / norm
+                    qDot1 -= beta * s1 / norm
+                    qDot2 -= beta * s2 / norm
+                    qDot3 -= beta * s3 / norm
+
+            # 3) Integrating and normalizing!
+            step = dt[i]
+            q0, q1, q2, q3 = q0 + qDot0*step, q1 + qDot1*step, q2 + qDot2*step, q3 + qDot3*step
+            norm = sqrt(q0*q0 + q1*q1 + q2*q2 + q3*q3)
+            q0, q1, q2, q3 = q0 / norm, q1 / norm, q2 / norm, q3 / norm
+            rows.append((q0, q1, q2, q3))
+
+        self.state[:4] = (q0, q1, q2, q3)
+        return rows
+
+
+# Mahony filter (IMU version): proportional-integral feedback of the gravity error onto the gyro rate. Extra state: state[4:7] = integral term!
+class MahonyFilter(OrientationFilter):
+    name = "mahony"
+    stateSize = 7
+
+    def __init__(self, gyroUnit: str = "rad", kp: float = 1.0, ki: float = 0.0):
+        self.kp, self.ki = kp, ki
+        super().__init__(gyroUnit)
+
+    def _loop(self, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, dt):
+        q0, q1, q2, q3, ix, iy, iz = self.state.tolist()
+        kp, ki, scale = self.kp, self.ki, self.gyroScale()
+        rows = []
+        for i in range(len(dt)):
+            gx, gy, gz = xGyro[i] * scale, yGyro[i] * scale, zGyro[i] * scale
+            step = dt[i]
+
+            # 1) Error between the measured and the estimated gravity direction (skipped when the accelerometer reads zero)
+            ax, ay, az = xAccel[i], yAccel[i], zAccel[i]
+            norm = sqrt(ax*ax + ay*ay + az*az)
+            if norm > 0.0:
+                ax, ay, az = ax / norm, ay / norm, az / norm
+                vx = q1*q3 - q0*q2
+                vy = q0*q1 + q2*q3
+                vz = q0*q0 - 0.5 + q3*q3
+                ex = ay*vz - az*vy
+                ey = az*vx - ax*vz
+                ez = ax*vy - ay*vx
+
+                # 1.1) Integral and proportional feedback
+                if ki > 0.0:
+                    ix += 2.0 * ki * ex * step
+                    iy += 2.0 * ki * ey * step
+                    iz += 2.0 * ki * ez * step
+                    gx, gy, gz = gx + ix, gy + iy, gz + iz
+                gx, gy, gz = gx + 2.0*kp*ex, gy + 2.0*kp*ey, gz + 2.0*kp*ez
+
+            # 2) Integrating the corrected rate and normalizing!
+            gx, gy, gz = gx * 0.5 * step, gy * 0.5 * step, gz * 0.5 * step
+            q0, q1, q2, q3 = q0 - q1*gx - q2*gy - q3*gz, q1 + q0*gx + q2*gz - q3*gy, q2 + q0*gy - q1*gz + q3*gx, q3 + q0*gz + q1*gy - q2*gx
+            norm = sqrt(q0*q0 + q1*q1 + q2*q2 + q3*q3)
+            q0, q1, q2, q3 = q0 / norm, q1 / norm, q2 / norm, q3 / norm
+            rows.append((q0, q1, q2, q3))
+
+        self.state[:] = (q0, q1, q2, q3, ix, iy, iz)
+        return rows
+
+
+# Available orientation filters, by name!
+FILTER_CLASSES = {cls.name: cls for cls in (ComplementaryFilter, MadgwickFilter, MahonyFilter)}
+ORIENTATION_FILTERS = tuple(FILTER_CLASSES)
+
+# Helper function that builds a filter by name, passing only the parameters that filter understands (alpha, beta, kp, ki)!
+def createOrientationFilter(name: str, gyroUnit: str = "rad", **params) -> OrientationFilter:
+    if name not in FILTER_CLASSES:
+        raise ValueError(f"Unknown orientation filter '{name}', expected one of {ORIENTATION_FILTERS}")
+    accepted: Dict[str, Tuple[str, ...]] = {"complementary": ("alpha",), "madgwick": ("beta",), "mahony": ("kp", "ki")}
+    return FILTER_CLASSES[name](gyroUnit=gyroUnit, **{key: value for key, value in params.items() if key in accepted[name] and value is not None})
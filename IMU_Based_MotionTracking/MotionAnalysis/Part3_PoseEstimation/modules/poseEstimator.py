@@ -1,59 +1,258 @@
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 import os
-import csv
-import matplotlib.pyplot as plt
+import numpy as np
 
 # Local Imports:
-from modules.dataloader import load_imu        
-from modules.filter import combineIMUData  
+from modules.dataloader import IMU_CHANNELS, iter_imu_chunks, load_imu_columns
+from modules.filter import POSE_ENGINES, TIME_MODES, checkGapOptions, chunkTimestampSteps, combineIMUData, combineIMUDataBatch, timestampSteps
+from modules.orientation import createOrientationFilter, eulerToQuaternion, quaternionToEuler
+from imucommon.plotting import renderLinePlot
+from imucommon.profiling import StageProfiler, profilerOrNull
+from imucommon.resultfiles import checkOutputFormat, openTableWriter, outputPath, writeTable
+from imucommon.spill import SpillFile, spilledMedian
+
+def estimate_pose(csvPath: str, sampleRate: Optional[float] = None, gyroUnit: str = "rad", alpha: float = 0.98, outputDir: str = "outputs", plot: bool = True, useCache: bool = True, engine: str = "list", timeMode: str = "auto", gapFactor: float = 5.0, gapMode: str = "reset",
+                  filterName: str = "complementary", beta: float = 0.1, kp: float = 1.0, ki: float = 0.0, includeYaw: Optional[bool] = None, quaternionOutput: bool = False, profiler: Optional[StageProfiler] = None, chunkSize: Optional[int] = None,
+                  outputFormat: str = "csv") -> Dict[str, object]:
+    checkOutputFormat(outputFormat)
+    if chunkSize is not None:
+        return estimatePoseChunked(csvPath, sampleRate, gyroUnit, alpha, outputDir, plot, useCache, engine, timeMode, gapFactor, gapMode, filterName, beta, kp, ki, includeYaw, quaternionOutput, profiler, chunkSize, outputFormat)
+    stages = profilerOrNull(profiler)
 
-def estimate_pose(csvPath: str, sampleRate: int, gyroUnit: str = "rad", alpha: float = 0.98, outputDir: str = "outputs", plot: bool = True) -> Dict[str, object]:
-    
     # 1) Loading IMU data from the CSV!
-    timestamps, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro = load_imu(csvPath)
+    with stages.stage("load") as stage:
+        loaded = load_imu_columns(csvPath, useCache=useCache)
+        if engine == "numpy":
+            timestamps, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro = [loaded[name] for name in IMU_CHANNELS]
+        elif engine == "list":
+            timestamps, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro = [loaded[name].tolist() for name in IMU_CHANNELS]
+        else:
+            raise ValueError(f"Unknown pose engine '{engine}', expected 'list' or 'numpy'")
     
-    # 1.1) Aligning data by taking the minimum valid sample length across all channels
-    sampleCount = min(len(timestamps), len(xAccel), len(yAccel), len(zAccel), len(xGyro), len(yGyro), len(zGyro))
+        # 1.1) Aligning data by taking the minimum valid sample length across all channels
+        sampleCount = min(len(timestamps), len(xAccel), len(yAccel), len(zAccel), len(xGyro), len(yGyro), len(zGyro))
+        stage.samples = sampleCount
     
-    # 1.2) Checking for empty data or invalid sampling frequency
-    if sampleCount == 0 or sampleRate <= 0:
+    # 1.2) Checking for empty data or invalid sampling frequency (the timestamps give dt when no fs is set)
+    if timeMode not in TIME_MODES:
+        raise ValueError(f"Unknown time mode '{timeMode}', expected one of {TIME_MODES}")
+    if timeMode == "auto":
+        timeMode = "fixed" if sampleRate else "timestamps"
+    if sampleCount == 0 or (timeMode == "fixed" and (sampleRate is None or sampleRate <= 0)):
         raise ValueError("Empty data or fs <= 0. Check file and arguments.")
 
-    # 2) Running the complementary filter to estimate roll and pitch, in degrees!
-    rollDegree, pitchDegree = combineIMUData(xAccel[:sampleCount], yAccel[:sampleCount], zAccel[:sampleCount], xGyro[:sampleCount], yGyro[:sampleCount], zGyro[:sampleCount], samplingRate=sampleRate, alpha=alpha, gyroUnit=gyroUnit, includeYAW=False)
+    # 1.3) Measuring the real sample spacing: nominal rate, jitter outliers and dropped-packet gaps
+    with stages.stage("timing", samples=sampleCount):
+        dtReport: Optional[Dict[str, object]] = None
+        if timeMode == "timestamps":
+            steps = timestampSteps(timestamps[:sampleCount], gapFactor, gapMode)
+            dtReport = {key: value for key, value in steps.items() if key not in ("dt", "resets")}
+
+    # 2) Running the orientation filter to estimate roll, pitch and yaw in degrees! The complementary filter works on Euler angles directly,
+    # the quaternion filters (madgwick, mahony) give quaternions that are converted to Euler angles for the output
+    with stages.stage("filter", samples=sampleCount):
+        quaternion = None
+        if includeYaw is None:
+            includeYaw = filterName != "complementary"
+        if filterName == "complementary":
+            combine = combineIMUDataBatch if engine == "numpy" else combineIMUData
+            rollDegree, pitchDegree, yawDegree = combine(xAccel[:sampleCount], yAccel[:sampleCount], zAccel[:sampleCount], xGyro[:sampleCount], yGyro[:sampleCount], zGyro[:sampleCount], samplingRate=sampleRate, alpha=alpha, gyroUnit=gyroUnit, includeYAW=True,
+                                                         steps=steps if timeMode == "timestamps" else None)
+            if quaternionOutput:
+                quaternion = eulerToQuaternion(rollDegree, pitchDegree, yawDegree)
+        else:
+            orientationFilter = createOrientationFilter(filterName, gyroUnit=gyroUnit, beta=beta, kp=kp, ki=ki)
+            dt, resets = (steps["dt"], steps["resets"]) if timeMode == "timestamps" else (1.0 / float(sampleRate), None)
+            quaternion = orientationFilter.run(xAccel[:sampleCount], yAccel[:sampleCount], zAccel[:sampleCount], xGyro[:sampleCount], yGyro[:sampleCount], zGyro[:sampleCount], dt, resets)
+            rollDegree, pitchDegree, yawDegree = quaternionToEuler(quaternion)
 
-    # 3) Creating output directory and saving orientation data to CSV!
-    os.makedirs(outputDir, exist_ok=True)
-    csvPath = os.path.join(outputDir, "orientation_output.csv")
-    with open(csvPath, "w", newline="") as file:
-        w = csv.writer(file)
-        w.writerow(["time_s", "roll_deg", "pitch_deg"])
-        for i in range(sampleCount):
-            w.writerow([f"{timestamps[i]:.6f}", f"{rollDegree[i]:.4f}", f"{pitchDegree[i]:.4f}"])
+    # 3) Creating output directory and saving orientation data to CSV, or to a binary table (yaw and quaternion columns only when asked for)!
+    with stages.stage("output", samples=sampleCount):
+        os.makedirs(outputDir, exist_ok=True)
+        outputFile = writeTable(outputPath(outputDir, "orientation_output", outputFormat), outputFormat, outputLayout(includeYaw, quaternionOutput),
+                                outputColumns(timestamps[:sampleCount], rollDegree, pitchDegree, yawDegree, quaternion, includeYaw, quaternionOutput),
+                                poseMeta(csvPath, sampleRate if timeMode == "fixed" else dtReport["fs"], timeMode, alpha, gyroUnit, filterName))
 
     # 4) Plotting a PNG that shows roll and pitch over time!
     plotPath: Optional[str] = None
     if plot:
-        plotPath = os.path.join(outputDir, "pose_plot.png")
-        plt.figure(figsize=(10, 4))
-        plt.plot(timestamps[:sampleCount], rollDegree, label="Roll (deg)")
-        plt.plot(timestamps[:sampleCount], pitchDegree, label="Pitch (deg)")
-        plt.title("Orientation (Complementary Filter)")
-        plt.xlabel("Time (s)")
-        plt.ylabel("Angle (deg)")
-        plt.legend()
-        plt.tight_layout()
-        plt.savefig(plotPath, dpi=160)
-        plt.close()
+        with stages.stage("plot", samples=sampleCount):
+            lines = [{"x": timestamps[:sampleCount], "y": rollDegree, "label": "Roll (deg)"}, {"x": timestamps[:sampleCount], "y": pitchDegree, "label": "Pitch (deg)"}]
+            if includeYaw:
+                lines.append({"x": timestamps[:sampleCount], "y": yawDegree, "label": "Yaw (deg)"})
+            plotPath = renderLinePlot(os.path.join(outputDir, "pose_plot.png"), lines, title=f"Orientation ({filterName.capitalize()} Filter)", xlabel="Time (s)", ylabel="Angle (deg)",
+                                      figsize=(10, 4), dpi=160, tightLayout=True)
 
 
     return {
         "time_s": timestamps[:sampleCount],
         "roll_deg": rollDegree,
         "pitch_deg": pitchDegree,
+        "yaw_deg": yawDegree if includeYaw else None,
+        "quaternion": quaternion,
+        "filter": filterName,
         "alpha": alpha,
-        "fs": sampleRate,
+        "fs": sampleRate if timeMode == "fixed" else dtReport["fs"],
+        "time_mode": timeMode,
+        "dt_report": dtReport,
         "gyro_unit": gyroUnit,
-        "csv_path": csvPath,
+        "csv_path": outputFile if outputFormat == "csv" else None,
+        "output_path": outputFile,
+        "output_format": outputFormat,
         "plot_path": plotPath,
+        "rejected_rows": loaded["rejected_rows"],
+        "samples": sampleCount,
+        "duration_s": float(timestamps[sampleCount - 1] - timestamps[0]),
+        "profile": stages.report(),
+    }
+
+
+# Helper function that returns the channels of the orientation table as (name, CSV format, dtype), yaw and quaternion only when asked for!
+def outputLayout(includeYaw: bool, quaternionOutput: bool) -> List[Tuple[str, str, str]]:
+    layout = [("time_s", ".6f", "<f8"), ("roll_deg", ".4f", "<f8"), ("pitch_deg", ".4f", "<f8")]
+    if includeYaw:
+        layout.append(("yaw_deg", ".4f", "<f8"))
+    if quaternionOutput:
+        layout += [(name, ".6f", "<f8") for name in ("qw", "qx", "qy", "qz")]
+    return layout
+
+# Helper function that lists the columns of outputLayout, in the same order!
+def outputColumns(timestamps, rollDegree, pitchDegree, yawDegree, quaternion, includeYaw: bool, quaternionOutput: bool) -> List[object]:
+    columns = [timestamps, rollDegree, pitchDegree]
+    if includeYaw:
+        columns.append(yawDegree)
+    if quaternionOutput:
+        columns += [quaternion[:, k] for k in range(4)]
+    return columns
+
+# Helper function that collects the settings stored in the header of the binary output formats!
+def poseMeta(csvPath: str, fs: Optional[float], timeMode: str, alpha: float, gyroUnit: str, filterName: str) -> Dict[str, object]:
+    return {"kind": "orientation", "source": csvPath, "fs": float(fs) if fs is not None else None, "time_mode": timeMode, "alpha": alpha, "gyro_unit": gyroUnit, "filter": filterName}
+
+
+# Out-of-core version of estimate_pose for recordings larger than memory: the file is read in chunks of chunkSize samples, the filter state
+# (angles, quaternion filter state, last timestamp) is carried from chunk to chunk and the CSV rows are written as they are computed, so the
+# peak memory depends on chunkSize and not on the file length. In 'timestamps' mode a first pass spills the positive timestamp steps to a
+# temporary file for the median step of the whole recording. The list engine and the quaternion filters write the same CSV as estimate_pose;
+# the numpy complementary filter agrees to about 1e-12 degrees (see combineIMUDataBatch). No angles are kept, so there is no plot!
+def estimatePoseChunked(csvPath: str, sampleRate: Optional[float] = None, gyroUnit: str = "rad", alpha: float = 0.98, outputDir: str = "outputs", plot: bool = False, useCache: bool = True, engine: str = "list", timeMode: str = "auto", gapFactor: float = 5.0, gapMode: str = "reset",
+                        filterName: str = "complementary", beta: float = 0.1, kp: float = 1.0, ki: float = 0.0, includeYaw: Optional[bool] = None, quaternionOutput: bool = False, profiler: Optional[StageProfiler] = None, chunkSize: int = 65536,
+                        outputFormat: str = "csv") -> Dict[str, object]:
+    stages = profilerOrNull(profiler)
+
+    # 1) Checking the arguments before anything is read!
+    if plot:
+        raise ValueError("The chunked mode keeps no angles to plot, run it with plot=False")
+    if outputFormat == "npz":
+        raise ValueError("The npz format holds whole arrays and cannot be written chunk by chunk, use 'bin' or 'csv'")
+    if chunkSize < 1:
+        raise ValueError(f"Chunk size must be a positive number of samples, got {chunkSize}")
+    if engine not in POSE_ENGINES:
+        raise ValueError(f"Unknown pose engine '{engine}', expected 'list' or 'numpy'")
+    if timeMode not in TIME_MODES:
+        raise ValueError(f"Unknown time mode '{timeMode}', expected one of {TIME_MODES}")
+    if timeMode == "auto":
+        timeMode = "fixed" if sampleRate else "timestamps"
+    if timeMode == "fixed" and (sampleRate is None or sampleRate <= 0):
+        raise ValueError("Empty data or fs <= 0. Check file and arguments.")
+    if includeYaw is None:
+        includeYaw = filterName != "complementary"
+    orientationFilter = createOrientationFilter(filterName, gyroUnit=gyroUnit, beta=beta, kp=kp, ki=ki) if filterName != "complementary" else None
+
+    # 2) 'timestamps' mode: nominal step = median of all increasing timestamp steps, found on disk!
+    nominalDt: Optional[float] = None
+    if timeMode == "timestamps":
+        checkGapOptions(gapFactor, gapMode)
+        with stages.stage("timing") as stage, SpillFile() as spill:
+            previous, sampleCount = None, 0
+            for channels, _ in iter_imu_chunks(csvPath, chunkSize, useCache=useCache):
+                t = channels["timestamp"]
+                if t.size:
+                    steps = np.diff(t) if previous is None else np.diff(t, prepend=previous)
+                    spill.append(steps[steps > 0.0])
+                    previous, sampleCount = t[-1], sampleCount + t.size
+            stage.samples = sampleCount
+            if sampleCount == 0:
+                raise ValueError("Empty data or fs <= 0. Check file and arguments.")
+            if spill.size == 0:
+                raise ValueError("Timestamps never increase, cannot derive dt from them (give a sampling rate instead)")
+            nominalDt = spilledMedian(spill)
+
+    # 3) Filtering chunk by chunk and appending the rows to the output (opened with the first samples, so an empty file leaves no output behind)!
+    layout = outputLayout(includeYaw, quaternionOutput)
+    outputFile = outputPath(outputDir, "orientation_output", outputFormat)
+    combine = combineIMUDataBatch if engine == "numpy" else combineIMUData
+    timing = {"max_dt": 0.0, "non_positive": 0, "gaps": 0, "gap_seconds": 0.0}
+    state, previous, firstTimestamp, sampleCount, rejectedRows = None, None, None, 0, 0
+    writer = None
+    try:
+        with stages.stage("stream") as stage:
+            for channels, rejected in iter_imu_chunks(csvPath, chunkSize, useCache=useCache):
+                rejectedRows += rejected
+                t = channels["timestamp"]
+                if t.size == 0:
+                    continue
+                columns = [channels[name] if engine == "numpy" else channels[name].tolist() for name in IMU_CHANNELS[1:]]
+
+                # 3.1) Steps of this chunk, continuing from the last timestamp of the previous one
+                steps = None
+                if timeMode == "timestamps":
+                    steps = chunkTimestampSteps(t, nominalDt, gapFactor, gapMode, previousTimestamp=previous)
+                    timing["max_dt"] = max(timing["max_dt"], steps["max_dt"]) if previous is not None else steps["max_dt"]
+                    for key in ("non_positive", "gaps", "gap_seconds"):
+                        timing[key] += steps[key]
+
+                # 3.2) Filtering with the carried state: angles for the complementary filter, the filter object's own state otherwise
+                quaternion = None
+                if orientationFilter is None:
+                    rollDegree, pitchDegree, yawDegree = combine(*columns, samplingRate=sampleRate, alpha=alpha, gyroUnit=gyroUnit, includeYAW=True, steps=steps, initialState=state)
+                    state = (rollDegree[-1], pitchDegree[-1], yawDegree[-1])
+                    if quaternionOutput:
+                        quaternion = eulerToQuaternion(rollDegree, pitchDegree, yawDegree)
+                else:
+                    dt, resets = (steps["dt"], steps["resets"]) if steps is not None else (1.0 / float(sampleRate), None)
+                    quaternion = orientationFilter.run(*columns, dt, resets)
+                    rollDegree, pitchDegree, yawDegree = quaternionToEuler(quaternion)
+
+                # 3.3) Appending the rows (the header knows the nominal rate in 'timestamps' mode, it is found before this pass)
+                if writer is None:
+                    os.makedirs(outputDir, exist_ok=True)
+                    writer = openTableWriter(outputFile, outputFormat, layout, poseMeta(csvPath, sampleRate if timeMode == "fixed" else 1.0 / nominalDt, timeMode, alpha, gyroUnit, filterName))
+                writer.write(outputColumns(t, rollDegree, pitchDegree, yawDegree, quaternion, includeYaw, quaternionOutput))
+                if firstTimestamp is None:
+                    firstTimestamp = float(t[0])
+                previous, sampleCount = float(t[-1]), sampleCount + t.size
+            stage.samples = sampleCount
+    finally:
+        if writer is not None:
+            writer.close()
+    if sampleCount == 0:
+        raise ValueError("Empty data or fs <= 0. Check file and arguments.")
+
+    # 4) Returning the same dict. as estimate_pose, without the angle arrays!
+    dtReport: Optional[Dict[str, object]] = None
+    if timeMode == "timestamps":
+        dtReport = {"nominal_dt": nominalDt, "fs": 1.0 / nominalDt, "max_dt": timing["max_dt"], "non_positive": timing["non_positive"], "gaps": timing["gaps"], "gap_seconds": timing["gap_seconds"], "gap_mode": gapMode}
+    return {
+        "time_s": None,
+        "roll_deg": None,
+        "pitch_deg": None,
+        "yaw_deg": None,
+        "quaternion": None,
+        "filter": filterName,
+        "alpha": alpha,
+        "fs": sampleRate if timeMode == "fixed" else dtReport["fs"],
+        "time_mode": timeMode,
+        "dt_report": dtReport,
+        "gyro_unit": gyroUnit,
+        "csv_path": outputFile if outputFormat == "csv" else None,
+        "output_path": outputFile,
+        "output_format": outputFormat,
+        "plot_path": None,
+        "rejected_rows": rejectedRows,
+        "samples": sampleCount,
+        "duration_s": previous - firstTimestamp,
+        "chunk_size": chunkSize,
+        "profile": stages.report(),
     }
+
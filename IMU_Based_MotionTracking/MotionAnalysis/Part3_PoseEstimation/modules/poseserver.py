@@ -0,0 +1,237 @@
+# poseserver.py: asyncio service that turns accel+gyro samples streamed by many devices (UDP or TCP) into live roll/pitch/yaw for subscribers.
+# Ingest formats: "line" is one 'device,timestamp,ax,ay,az,gx,gy,gz' text line per sample, "binary" is packed PACKET records (several per datagram allowed).
+# Subscribers connect to their own TCP port, send 'SUB <device>' (or 'SUB *') and receive 'device,timestamp,roll,pitch,yaw' lines!
+import asyncio
+import struct
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# Local Imports:
+from modules.orientation import ComplementaryFilter, quaternionFromEuler
+
+# Binary sample record: device id (uint32), timestamp in seconds (float64), ax, ay, az, gx, gy, gz (float32), little endian!
+PACKET = struct.Struct("<Id6f")
+INGEST_FORMATS = ("line", "binary")
+READ_BYTES = 65536
+LATENCY_WINDOW = 20000
+
+# Helper functions that encode one sample in the two ingest formats (used by the load generator)!
+def packSample(device: int, timestamp: float, xAccel: float, yAccel: float, zAccel: float, xGyro: float, yGyro: float, zGyro: float) -> bytes:
+    return PACKET.pack(device, timestamp, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro)
+
+def formatSampleLine(device, timestamp: float, xAccel: float, yAccel: float, zAccel: float, xGyro: float, yGyro: float, zGyro: float) -> bytes:
+    return f"{device},{timestamp:.6f},{xAccel!r},{yAccel!r},{zAccel!r},{xGyro!r},{yGyro!r},{zGyro!r}\n".encode("ascii")
+
+# Helper function that parses one ingest line into (device, timestamp, ax, ay, az, gx, gy, gz), raising ValueError on malformed lines!
+def parseSampleLine(line: bytes) -> Tuple[str, float, float, float, float, float, float, float]:
+    parts = line.split(b",")
+    if len(parts) != 8:
+        raise ValueError(f"Expected 8 fields, got {len(parts)}")
+    return (parts[0].strip().decode("ascii"),) + tuple(float(value) for value in parts[1:])
+
+# One device: its complementary filter (same math as combineIMUData, one sample at a time) and counters!
+class DeviceState:
+    __slots__ = ("filter", "lastTimestamp", "samples", "resets", "outOfOrder")
+
+    def __init__(self, alpha: float, gyroUnit: str):
+        self.filter = ComplementaryFilter(gyroUnit=gyroUnit, alpha=alpha)
+        self.lastTimestamp: Optional[float] = None
+        self.samples = 0
+        self.resets = 0
+        self.outOfOrder = 0
+
+# One subscriber: a bounded queue of pending messages. When the subscriber is slower than the devices the oldest messages are dropped,
+# so ingest never waits for a slow reader and the queued messages stay recent!
+class Subscriber:
+    def __init__(self, writer: asyncio.StreamWriter, device: Optional[str], queueSize: int):
+        self.writer = writer
+        self.device = device
+        self.queue: deque = deque(maxlen=queueSize)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def offer(self, receivedAt: float, message: bytes):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append((receivedAt, message))
+        self.ready.set()
+
+    # Writing everything that is queued in one go, then waiting for the socket to drain!
+    async def run(self, latencies: deque):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            pending = list(self.queue)
+            self.queue.clear()
+            self.writer.write(b"".join(message for _, message in pending))
+            now = time.perf_counter()
+            latencies.extend(now - receivedAt for receivedAt, _ in pending)
+            await self.writer.drain()
+
+
+class PoseServer:
+    def __init__(self, alpha: float = 0.98, gyroUnit: str = "rad", ingestFormat: str = "line", maxGapSeconds: float = 0.5, queueSize: int = 1024):
+        if ingestFormat not in INGEST_FORMATS:
+            raise ValueError(f"Unknown ingest format '{ingestFormat}', expected one of {INGEST_FORMATS}")
+        self.alpha = alpha
+        self.gyroUnit = gyroUnit
+        self.ingestFormat = ingestFormat
+        self.maxGapSeconds = maxGapSeconds
+        self.queueSize = queueSize
+        self.devices: Dict[str, DeviceState] = {}
+        self.subscribers: List[Subscriber] = []
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.samples = 0
+        self.malformed = 0
+        self.servers = []
+        self.transports = []
+
+    # 1) Updating one device with one sample and publishing its orientation:
+    def process(self, device: str, timestamp: float, xAccel: float, yAccel: float, zAccel: float, xGyro: float, yGyro: float, zGyro: float, receivedAt: float):
+        state = self.devices.get(device)
+        if state is None:
+            state = self.devices[device] = DeviceState(self.alpha, self.gyroUnit)
+
+        # 1.1) dt from the device's own timestamps: repeated/slightly older samples are dropped, and after a gap (or a clock that jumped
+        # back by more than a gap, i.e. a restarted device) the filter restarts from the accel tilt (yaw is kept)
+        orientationFilter = state.filter
+        if state.lastTimestamp is not None:
+            dt = timestamp - state.lastTimestamp
+            if -self.maxGapSeconds <= dt <= 0.0:
+                state.outOfOrder += 1
+                return
+            if abs(dt) > self.maxGapSeconds:
+                yawDegree = orientationFilter.state[6]
+                orientationFilter.initialize(xAccel, yAccel, zAccel)
+                orientationFilter.state[6] = yawDegree
+                orientationFilter.state[:4] = quaternionFromEuler(*orientationFilter.state[4:7].tolist())
+                state.resets += 1
+            else:
+                orientationFilter.update(xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, dt)
+        else:
+            orientationFilter.update(xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, 0.0)
+        state.lastTimestamp = timestamp
+        state.samples += 1
+        self.samples += 1
+
+        # 1.2) Publishing to the subscribers of this device (and of all devices)
+        if self.subscribers:
+            rollDegree, pitchDegree, yawDegree = orientationFilter.state[4:7].tolist()
+            message = f"{device},{timestamp:.6f},{rollDegree:.4f},{pitchDegree:.4f},{yawDegree:.4f}\n".encode("ascii")
+            for subscriber in self.subscribers:
+                if subscriber.device is None or subscriber.device == device:
+                    subscriber.offer(receivedAt, message)
+
+    # 2) Feeding raw ingest bytes, returns the incomplete tail that has to wait for more data (TCP)!
+    def feed(self, data: bytes, receivedAt: float) -> bytes:
+        if self.ingestFormat == "binary":
+            usable = len(data) - len(data) % PACKET.size
+            for device, *sample in PACKET.iter_unpack(data[:usable] if usable != len(data) else data):
+                self.process(str(device), *sample, receivedAt)
+            return data[usable:]
+
+        lines = data.split(b"\n")
+        for line in lines[:-1]:
+            if not line.strip():
+                continue
+            try:
+                sample = parseSampleLine(line)
+            except ValueError:
+                self.malformed += 1
+                continue
+            self.process(*sample, receivedAt)
+        return lines[-1]
+
+    # 3) TCP ingest: read, process, and yield to the loop between chunks so the subscriber writers keep up.
+    # Processing happens before the next read, so a device that sends faster than we process is slowed down by TCP flow control!
+    async def handleIngest(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tail = b""
+        try:
+            while True:
+                chunk = await reader.read(READ_BYTES)
+                if not chunk:
+                    break
+                tail = self.feed(tail + chunk, time.perf_counter())
+                await asyncio.sleep(0)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # 4) Subscriber connections: 'SUB <device>' or 'SUB *', then orientation lines until the client goes away!
+    async def handleSubscriber(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        request = (await reader.readline()).decode("ascii", "replace").split()
+        if len(request) != 2 or request[0].upper() != "SUB":
+            writer.write(b"ERR expected 'SUB <device>' or 'SUB *'\n")
+            writer.close()
+            return
+        subscriber = Subscriber(writer, None if request[1] == "*" else request[1], self.queueSize)
+        self.subscribers.append(subscriber)
+        sender = asyncio.ensure_future(subscriber.run(self.latencies))
+        closed = asyncio.ensure_future(reader.read())
+        try:
+            await asyncio.wait([sender, closed], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.subscribers.remove(subscriber)
+            sender.cancel()
+            closed.cancel()
+            writer.close()
+
+    # 5) Opening the listeners (a port of 0 or None skips that listener)!
+    async def start(self, host: str = "127.0.0.1", udpPort: Optional[int] = 9750, tcpPort: Optional[int] = 9751, subscribePort: Optional[int] = 9752):
+        loop = asyncio.get_running_loop()
+        if udpPort:
+            transport, _ = await loop.create_datagram_endpoint(lambda: _IngestDatagramProtocol(self), local_addr=(host, udpPort))
+            self.transports.append(transport)
+        if tcpPort:
+            self.servers.append(await asyncio.start_server(self.handleIngest, host, tcpPort))
+        if subscribePort:
+            self.servers.append(await asyncio.start_server(self.handleSubscriber, host, subscribePort))
+
+    def close(self):
+        for transport in self.transports:
+            transport.close()
+        for server in self.servers:
+            server.close()
+
+    # 6) Counters and publish latency (receive -> handed to the subscriber socket) over the last LATENCY_WINDOW messages!
+    def stats(self) -> Dict[str, object]:
+        latencies = sorted(self.latencies)
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000.0 if latencies else None
+        return {
+            "devices": len(self.devices),
+            "samples": self.samples,
+            "malformed": self.malformed,
+            "out_of_order": sum(state.outOfOrder for state in self.devices.values()),
+            "resets": sum(state.resets for state in self.devices.values()),
+            "subscribers": len(self.subscribers),
+            "dropped_messages": sum(subscriber.dropped for subscriber in self.subscribers),
+            "latency_p50_ms": percentile(0.50),
+            "latency_p99_ms": percentile(0.99),
+            "latency_max_ms": latencies[-1] * 1000.0 if latencies else None,
+        }
+
+    async def reportStats(self, interval: float):
+        lastSamples, lastTime = self.samples, time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            stats = self.stats()
+            rate = (stats["samples"] - lastSamples) / (now - lastTime)
+            lastSamples, lastTime = stats["samples"], now
+            latency = "-" if stats["latency_p99_ms"] is None else f"p50 {stats['latency_p50_ms']:.2f} ms, p99 {stats['latency_p99_ms']:.2f} ms, max {stats['latency_max_ms']:.2f} ms"
+            print(f"[poseserver] {stats['devices']} devices, {rate:.0f} samples/s, {stats['subscribers']} subscribers, dropped {stats['dropped_messages']}, out-of-order {stats['out_of_order']}, malformed {stats['malformed']}, latency {latency}", flush=True)
+
+
+# UDP ingest: every datagram holds one or more whole samples!
+class _IngestDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server: PoseServer):
+        self.server = server
+
+    def datagram_received(self, data: bytes, addr):
+        if self.server.ingestFormat == "line" and not data.endswith(b"\n"):
+            data += b"\n"
+        if self.server.feed(data, time.perf_counter()):
+            self.server.malformed += 1
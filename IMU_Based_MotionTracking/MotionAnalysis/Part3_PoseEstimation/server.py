@@ -0,0 +1,45 @@
+# server.py: Live pose estimation server, devices stream accel+gyro samples and subscribers receive roll/pitch/yaw.
+# python server.py --udp-port 9750 --tcp-port 9751 --sub-port 9752 --format line
+# python loadgen.py --devices 50 --rate 100 --duration 30          (local load generator, no hardware needed)
+import argparse
+import asyncio
+
+# Local Imports:
+from modules.poseserver import INGEST_FORMATS, PoseServer
+
+async def serve(args):
+    server = PoseServer(alpha=args.alpha, gyroUnit=args.gyro_unit, ingestFormat=args.format, maxGapSeconds=args.max_gap, queueSize=args.queue_size)
+    await server.start(args.host, args.udp_port, args.tcp_port, args.sub_port)
+    print(f"Pose server on {args.host}: UDP {args.udp_port or '-'}, TCP {args.tcp_port or '-'} ({args.format} samples), subscribers on TCP {args.sub_port or '-'}", flush=True)
+    try:
+        if args.stats_interval > 0:
+            await server.reportStats(args.stats_interval)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        server.close()
+
+def main():
+
+    # 1) Creating argument parser for command-line interface!
+    parser = argparse.ArgumentParser(description="Real-time pose estimation server")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--udp-port", type=int, default=9750, help="UDP ingest port, 0 to disable (default=9750)")
+    parser.add_argument("--tcp-port", type=int, default=9751, help="TCP ingest port, 0 to disable (default=9751)")
+    parser.add_argument("--sub-port", type=int, default=9752, help="TCP port for subscribers ('SUB <device>' or 'SUB *') (default=9752)")
+    parser.add_argument("--format", choices=INGEST_FORMATS, default="line", help="Ingest format: 'line' (device,timestamp,ax,ay,az,gx,gy,gz) or 'binary' (packed records)")
+    parser.add_argument("--gyro-unit", default="rad", help="Gyro unit: 'rad' or 'deg' (default: rad)")
+    parser.add_argument("--alpha", type=float, default=0.98, help="Complementary filter alpha (default=0.98)")
+    parser.add_argument("--max-gap", type=float, default=0.5, help="Seconds without samples after which a device restarts from its accel tilt (default=0.5)")
+    parser.add_argument("--queue-size", type=int, default=1024, help="Messages kept per subscriber before the oldest are dropped (default=1024)")
+    parser.add_argument("--stats-interval", type=float, default=5.0, help="Seconds between stats lines, 0 to disable (default=5)")
+    args = parser.parse_args()
+
+    # 2) Serving until interrupted!
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
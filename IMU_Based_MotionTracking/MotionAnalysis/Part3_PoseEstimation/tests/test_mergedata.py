@@ -0,0 +1,16 @@
+# test_mergedata.py: The merge stage against the committed merged recording.
+import os
+
+from imucommon.parts import MOTION_ANALYSIS_ROOT, POSE_ESTIMATION_PART, importPartModule
+
+mergedata = importPartModule(POSE_ESTIMATION_PART, "modules.mergedata")
+
+DATA_DIR = os.path.join(MOTION_ANALYSIS_ROOT, POSE_ESTIMATION_PART, "data")
+
+# The legacy row pairing reproduces data/mergedWalk.csv byte for byte
+def test_indexMergeMatchesBaseline(tmp_path):
+    outPath = str(tmp_path / "merged.csv")
+    report = mergedata.mergeStreams(os.path.join(DATA_DIR, "Accelerometer.csv"), os.path.join(DATA_DIR, "Gyroscope.csv"), outPath, method="index")
+    assert report["samples"] == 4160
+    with open(outPath, "rb") as produced, open(os.path.join(DATA_DIR, "mergedWalk.csv"), "rb") as baseline:
+        assert produced.read() == baseline.read()
@@ -0,0 +1,22 @@
+# test_poseEstimator.py: The chunked (out-of-core) estimate_pose against the in-memory run.
+import os
+
+import pytest
+
+from imucommon.parts import MOTION_ANALYSIS_ROOT, POSE_ESTIMATION_PART, importPartModule
+
+poseEstimator = importPartModule(POSE_ESTIMATION_PART, "modules.poseEstimator")
+
+MERGED_CSV = os.path.join(MOTION_ANALYSIS_ROOT, POSE_ESTIMATION_PART, "data", "mergedWalk.csv")
+
+@pytest.mark.parametrize("engine", ["list", "numpy"])
+@pytest.mark.parametrize("sampleRate", [100.0, None]) # fixed dt, or dt from the timestamps
+@pytest.mark.parametrize("filterName", ["complementary", "madgwick"])
+@pytest.mark.parametrize("chunkSize", [97, 1000])
+def test_chunkedMatchesInMemory(tmp_path, engine, sampleRate, filterName, chunkSize):
+    options = dict(sampleRate=sampleRate, engine=engine, filterName=filterName, plot=False, useCache=False)
+    expected = poseEstimator.estimate_pose(MERGED_CSV, outputDir=str(tmp_path / "memory"), **options)
+    chunked = poseEstimator.estimate_pose(MERGED_CSV, outputDir=str(tmp_path / "chunked"), chunkSize=chunkSize, **options)
+    assert chunked["samples"] == expected["samples"] == 4160
+    with open(chunked["output_path"], "rb") as produced, open(expected["output_path"], "rb") as reference:
+        assert produced.read() == reference.read()
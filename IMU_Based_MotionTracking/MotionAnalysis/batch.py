@@ -0,0 +1,211 @@
+# batch.py: Runs the step counter (Part 2) and pose estimation (Part 3) over many recordings in a process pool.
+# python batch.py --steps "Part2_StepCounter/data/*.csv" --pose "Part3_PoseEstimation/data/merged*.csv" --workers 8 --out batch_outputs
+import argparse
+import csv
+import glob
+import hashlib
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+# Local Imports:
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from imucommon.parts import POSE_ESTIMATION_PART, STEP_COUNTER_PART, importPartModule
+from imucommon.profiling import PROFILE_FORMATS, StageProfiler, writeProfile
+from imucommon.resultfiles import OUTPUT_FORMATS, outputPath
+
+PIPELINES = ("steps", "pose")
+SUMMARY_FIELDS = ["file", "pipeline", "status", "samples", "steps", "cadence_spm", "duration_s", "step_time_cv", "stride_time_cv", "asymmetry", "runtime_s", "output_dir", "error"]
+
+# Helper function that gives every recording its own output folder: file name plus a short hash of its full path, so equal names never collide!
+def recordingOutputDir(outRoot: str, pipeline: str, csvPath: str) -> str:
+    absolutePath = os.path.abspath(csvPath)
+    stem = os.path.splitext(os.path.basename(absolutePath))[0]
+    return os.path.join(outRoot, pipeline, f"{stem}-{hashlib.sha1(absolutePath.encode('utf-8')).hexdigest()[:8]}")
+
+# 1) Running one recording, inside a worker process:
+def runTask(task: Dict[str, object]) -> Dict[str, object]:
+    row: Dict[str, object] = {"id": task["id"], "file": task["file"], "pipeline": task["pipeline"], "output_dir": task["output_dir"], "status": "ok", "error": ""}
+    start = time.perf_counter()
+    profiler = StageProfiler(enabled=task["profile"] is not None, traceMemory=task["profile"] == "memory", label=f"{task['pipeline']}:{task['file']}")
+    try:
+        os.makedirs(task["output_dir"], exist_ok=True)
+
+        # 1.1) Step counter: processFile, then steps.csv (or .npz/.bin) into the recording's folder (written while counting in the chunked mode)
+        if task["pipeline"] == "steps":
+            stepcounter = importPartModule(STEP_COUNTER_PART, "modules.stepcounter")
+            stepsPath = outputPath(task["output_dir"], "steps", task["out_format"])
+            result = stepcounter.processFile(csvPath=task["file"], samplingFrequency=task["fs"], thresholdMode=task["threshold"], sensitivityFactor=task["k_auto"], minGapMiliseconds=task["min_gap_ms"], filterEngine=task["engine"], profiler=profiler, peakMode=task["peak_mode"],
+                                             chunkSize=task["chunk_samples"], stepsPath=stepsPath if task["chunk_samples"] else None, stepsFormat=task["out_format"])
+            if not task["chunk_samples"]:
+                with profiler.stage("save_steps", samples=result["steps"]):
+                    stepcounter.saveSteps(result["peaks"], task["fs"], stepsPath, task["out_format"],
+                                          stepcounter.stepsMeta(task["file"], task["fs"], task["threshold"], task["k_auto"], task["min_gap_ms"], task["peak_mode"]), result["gait"])
+            row.update(samples=result["samples"], steps=result["steps"], cadence_spm=result["cadence_spm"], duration_s=result["duration_s"])
+            gait = result["gait"]["summary"]
+            row.update(step_time_cv=gait["step_time_s_cv"], stride_time_cv=gait["stride_time_s_cv"], asymmetry=gait["asymmetry_mean"])
+
+        # 1.2) Pose estimation: estimate_pose writes its CSV (and plot) into the recording's folder
+        else:
+            poseEstimator = importPartModule(POSE_ESTIMATION_PART, "modules.poseEstimator")
+            result = poseEstimator.estimate_pose(csvPath=task["file"], sampleRate=task["fs"], gyroUnit=task["gyro_unit"], alpha=task["alpha"], outputDir=task["output_dir"], plot=task["plot"] and not task["chunk_samples"], engine=task["engine"], filterName=task["pose_filter"], profiler=profiler,
+                                                 chunkSize=task["chunk_samples"], outputFormat=task["out_format"])
+            row.update(samples=result["samples"], duration_s=result["duration_s"])
+    except Exception as error:
+        row.update(status="error", error=f"{type(error).__name__}: {error}")
+        # The traceback goes next to the outputs; if that folder is not writable either, the error stays in the summary row only
+        try:
+            with open(os.path.join(task["output_dir"], "error.txt"), "w") as file:
+                file.write(traceback.format_exc())
+        except OSError as writeError:
+            row["error"] += f" (error.txt not written: {type(writeError).__name__}: {writeError})"
+    row["runtime_s"] = time.perf_counter() - start
+    profiler.close()
+    row["profile"] = profiler.report()
+    return row
+
+def runChunk(tasks: List[Dict[str, object]]) -> List[Dict[str, object]]:
+    return [runTask(task) for task in tasks]
+
+# 2) Fanning the tasks out over a process pool. If a worker dies (e.g. killed or crashed), the pool breaks:
+# the unfinished tasks are retried one by one, and a task that breaks the pool on its own is reported as 'crashed'.
+def runBatch(tasks: List[Dict[str, object]], workers: int, chunkSize: int) -> List[Dict[str, object]]:
+    results: Dict[int, Dict[str, object]] = {}
+    pending = [tasks[i:i + chunkSize] for i in range(0, len(tasks), max(1, chunkSize))]
+    while pending:
+        failed: List[Dict[str, object]] = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(runChunk, chunk): chunk for chunk in pending}
+            for future in as_completed(futures):
+                try:
+                    for row in future.result():
+                        results[row["id"]] = row
+                except BrokenProcessPool:
+                    failed.extend(futures[future])
+        if not failed:
+            break
+
+        # 2.1) Without progress, the first unfinished task is run alone in its own process to find out whether it is the one crashing
+        if len(failed) == sum(len(chunk) for chunk in pending):
+            suspect, failed = failed[0], failed[1:]
+            try:
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    results[suspect["id"]] = pool.submit(runTask, suspect).result()
+            except BrokenProcessPool:
+                results[suspect["id"]] = {"id": suspect["id"], "file": suspect["file"], "pipeline": suspect["pipeline"], "output_dir": suspect["output_dir"], "status": "crashed", "error": "worker process died", "runtime_s": None}
+        pending = [[task] for task in failed]
+    return [results[task["id"]] for task in tasks]
+
+# 3) Collecting the recordings from glob patterns and an optional manifest CSV (columns: path, pipeline, fs):
+def collectTasks(args) -> List[Dict[str, object]]:
+    entries = []
+    for pipeline, patterns in (("steps", args.steps), ("pose", args.pose)):
+        for pattern in patterns or []:
+            entries.extend((path, pipeline, None) for path in sorted(glob.glob(pattern, recursive=True)))
+    if args.manifest:
+        with open(args.manifest, "r", newline="") as file:
+            for record in csv.DictReader(file):
+                pipeline = (record.get("pipeline") or "steps").strip()
+                if pipeline not in PIPELINES:
+                    raise ValueError(f"Unknown pipeline '{pipeline}' in {args.manifest}, expected one of {PIPELINES}")
+                fs = record.get("fs")
+                entries.append((record["path"].strip(), pipeline, (int(fs) if pipeline == "steps" else float(fs)) if fs else None))
+
+    tasks, seen = [], set()
+    for path, pipeline, fs in entries:
+        if (os.path.abspath(path), pipeline) in seen or path.endswith(".imucache"):
+            continue
+        seen.add((os.path.abspath(path), pipeline))
+        tasks.append({
+            "id": len(tasks),
+            "file": path,
+            "pipeline": pipeline,
+            "output_dir": recordingOutputDir(args.out, pipeline, path),
+            "fs": fs if fs is not None else (args.fs if pipeline == "steps" else args.pose_fs),
+            "threshold": args.threshold,
+            "k_auto": args.k_auto,
+            "min_gap_ms": args.min_gap_ms,
+            "peak_mode": args.peak_mode,
+            "engine": args.engine,
+            "gyro_unit": args.gyro_unit,
+            "alpha": args.alpha,
+            "pose_filter": args.pose_filter,
+            "plot": args.plot,
+            "chunk_samples": args.chunk_samples,
+            "out_format": args.out_format,
+            "profile": None if not args.profile else ("time" if args.profile_no_memory else "memory"),
+        })
+    return tasks
+
+# 4) Writing the summary table as CSV and printing it!
+def writeSummary(rows: List[Dict[str, object]], outRoot: str) -> str:
+    summaryPath = os.path.join(outRoot, "summary.csv")
+    with open(summaryPath, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+    def cell(value, fmt):
+        return format(value, fmt) if isinstance(value, (int, float)) else "-"
+
+    print(f"\n{'File':<40} {'Pipeline':<8} {'Status':<8} {'Steps':>6} {'Cadence':>8} {'Duration':>9} {'Runtime':>8}")
+    for row in rows:
+        print(f"{os.path.basename(str(row['file']))[:40]:<40} {row['pipeline']:<8} {row['status']:<8} {cell(row.get('steps'), 'd'):>6} {cell(row.get('cadence_spm'), '.1f'):>8} {cell(row.get('duration_s'), '.1f'):>9} {cell(row.get('runtime_s'), '.2f'):>8}")
+    return summaryPath
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Batch runner for the step counter and pose estimation")
+    ap.add_argument("--steps", action="append", help="Glob of recordings for the step counter (repeatable)")
+    ap.add_argument("--pose", action="append", help="Glob of merged IMU recordings for pose estimation (repeatable)")
+    ap.add_argument("--manifest", help="CSV with a 'path' column and optional 'pipeline' (steps/pose) and 'fs' columns")
+    ap.add_argument("--out", default="batch_outputs", help="Root output folder (default: batch_outputs)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: all cores)")
+    ap.add_argument("--chunksize", type=int, default=1, help="Recordings handed to a worker at once (default=1)")
+    ap.add_argument("--chunk-samples", type=int, default=None, metavar="N", help="Out-of-core mode for recordings larger than memory: every worker processes N samples at a time (no pose plots)")
+    ap.add_argument("--fs", type=int, default=50, help="Step counter sampling rate (Hz)")
+    ap.add_argument("--threshold", default="auto", help="Step threshold value or 'auto'")
+    ap.add_argument("--k-auto", type=float, default=0.8, help="Multiplier for auto threshold (default=0.8)")
+    ap.add_argument("--min-gap-ms", type=int, default=350, help="Minimum gap between peaks in ms (default=350)")
+    ap.add_argument("--peak-mode", default="refractory", help="Close step peaks: 'refractory' (first wins) or 'merge' (strongest wins)")
+    ap.add_argument("--engine", choices=("list", "numpy"), default="numpy", help="Filter engine of both pipelines: 'list' or 'numpy' (default: numpy)")
+    ap.add_argument("--pose-fs", type=float, default=None, help="Pose estimation sampling rate (Hz). If omitted, dt is taken from each recording's timestamps")
+    ap.add_argument("--gyro-unit", default="rad", help="Gyro unit: 'rad' or 'deg' (default: rad)")
+    ap.add_argument("--alpha", type=float, default=0.98, help="Complementary filter alpha (default=0.98)")
+    ap.add_argument("--pose-filter", default="complementary", help="Orientation filter: 'complementary', 'madgwick' or 'mahony' (default: complementary)")
+    ap.add_argument("--plot", action="store_true", help="Also save pose_plot.png for every pose recording")
+    ap.add_argument("--out-format", choices=OUTPUT_FORMATS, default="csv", help="Format of steps/orientation_output files: 'csv' (default), 'npz' or 'bin'")
+    ap.add_argument("--profile", action="store_true", help="Record per-stage timings of every recording into <out>/profile.json (or profile.trace.json)")
+    ap.add_argument("--profile-format", choices=PROFILE_FORMATS, default="json", help="Profile file format: 'json' or 'chrome' (one trace row per recording)")
+    ap.add_argument("--profile-no-memory", action="store_true", help="Skip allocation tracking (tracemalloc) while profiling")
+    args = ap.parse_args(argv)
+    if args.chunk_samples and args.out_format == "npz":
+        ap.error("--out-format npz needs the whole recording, use csv or bin with --chunk-samples")
+
+    tasks = collectTasks(args)
+    if not tasks:
+        ap.error("no recordings matched --steps/--pose/--manifest")
+
+    start = time.perf_counter()
+    rows = runBatch(tasks, max(1, args.workers or 1), max(1, args.chunksize))
+    os.makedirs(args.out, exist_ok=True)
+    summaryPath = writeSummary(rows, args.out)
+    if args.profile:
+        profileName = "profile.trace.json" if args.profile_format == "chrome" else "profile.json"
+        writeProfile(os.path.join(args.out, profileName), [row.get("profile") for row in rows], args.profile_format)
+    failures = sum(1 for row in rows if row["status"] != "ok")
+
+    print("\n********** Batch Summary **********")
+    print(f"Recordings : {len(rows)} ({failures} failed)")
+    print(f"Workers    : {args.workers}")
+    print(f"Wall time  : {time.perf_counter() - start:.2f} s")
+    print(f"Summary    : {summaryPath}")
+    if args.profile:
+        print(f"Profile    : {os.path.join(args.out, profileName)}")
+    print("===================================\n")
+
+if __name__ == "__main__":
+    main()
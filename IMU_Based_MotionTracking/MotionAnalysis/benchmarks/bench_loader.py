@@ -0,0 +1,107 @@
+# bench_loader.py: Compares the shared columnar CSV loader against the original per-row csv.reader loaders on a large synthetic Phyphox recording.
+# python benchmarks/bench_loader.py --rows 1000000
+import argparse
+import csv
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Local Imports:
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from imucommon.columnar import findAxisColumns, readCsvColumns, readCsvHeader, vectorMagnitude
+
+# Reference implementation: per-row loop of the original Part2 loadMagnitude!
+def loadMagnitudePerRow(csvPath):
+    magnitudes = []
+    with open(csvPath, "r", newline="") as csvFile:
+        csvReader = csv.reader(csvFile)
+        normalizedHeaders = [h.strip().lower() for h in next(csvReader)]
+        xColumnIndex, yColumnIndex, zColumnIndex = findAxisColumns(normalizedHeaders)
+        for row in csvReader:
+            try:
+                xAcceleration = float(row[xColumnIndex]); yAcceleration = float(row[yColumnIndex]); zAcceleration = float(row[zColumnIndex])
+                magnitudes.append(math.sqrt(xAcceleration*xAcceleration + yAcceleration*yAcceleration + zAcceleration*zAcceleration))
+            except Exception:
+                continue
+    return magnitudes
+
+# Reference implementation: per-row loop of the original Part3 load_imu!
+def loadImuPerRow(file_path):
+    columns = [[], [], [], [], [], [], []]
+    with open(file_path, "r") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if not row:
+                continue
+            try:
+                for k in range(7):
+                    columns[k].append(float(row[k]))
+            except ValueError:
+                continue
+    return columns
+
+# Writing a synthetic recording with Phyphox formatting ('%.9E' values under quoted headers):
+def writeSyntheticCsv(path, rows, headers, seed=0):
+    rng = np.random.default_rng(seed)
+    rowFormat = ",".join(["%.9E"] * len(headers)) + "\n"
+    with open(path, "w") as file:
+        file.write(",".join(f'"{h}"' for h in headers) + "\n")
+        for start in range(0, rows, 100000):
+            count = min(100000, rows - start)
+            block = rng.normal(0.0, 4.0, (count, len(headers)))
+            block[:, 0] = (start + np.arange(count)) * 0.01
+            file.write((rowFormat * count) % tuple(block.ravel()))
+
+def timeIt(function, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    ap = argparse.ArgumentParser(description="Columnar loader benchmark")
+    ap.add_argument("--rows", type=int, default=1000000, help="Rows in the synthetic files")
+    ap.add_argument("--workers", type=int, default=None, help="Parser processes (default: all cores for large files)")
+    ap.add_argument("--repeats", type=int, default=3, help="Timing repeats, best one is reported")
+    ap.add_argument("--target", type=float, default=10.0, help="Required speedup over the per-row loaders")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        accelPath = os.path.join(folder, "walking.csv")
+        imuPath = os.path.join(folder, "merged.csv")
+        writeSyntheticCsv(accelPath, args.rows, ["Time (s)", "Acceleration x (m/s^2)", "Acceleration y (m/s^2)", "Acceleration z (m/s^2)", "Absolute acceleration (m/s^2)"])
+        writeSyntheticCsv(imuPath, args.rows, ["timestamp", "ax", "ay", "az", "gx", "gy", "gz"], seed=1)
+
+        # 1) Accelerometer magnitude (Part2)
+        def loadMagnitudeColumnar():
+            headers, _ = readCsvHeader(accelPath)
+            table = readCsvColumns(accelPath, usecols=findAxisColumns([h.lower() for h in headers]), workers=args.workers)
+            return vectorMagnitude(*table["columns"])
+        rowTime, rowResult = timeIt(lambda: loadMagnitudePerRow(accelPath), 1)
+        columnTime, columnResult = timeIt(loadMagnitudeColumnar, args.repeats)
+        assert np.array_equal(np.asarray(rowResult), columnResult)
+
+        # 2) Seven channel IMU table (Part3)
+        imuRowTime, imuRowResult = timeIt(lambda: loadImuPerRow(imuPath), 1)
+        imuColumnTime, imuColumnResult = timeIt(lambda: readCsvColumns(imuPath, usecols=range(7), workers=args.workers), args.repeats)
+        assert np.array_equal(np.asarray(imuRowResult), imuColumnResult["columns"])
+
+    print(f"\n********** Loader Benchmark ({args.rows} rows, {os.cpu_count()} cores) **********")
+    speedups = []
+    for name, before, after in (("loadMagnitude", rowTime, columnTime), ("load_imu", imuRowTime, imuColumnTime)):
+        speedups.append(before / after)
+        print(f"{name:<14}: per-row {before:7.3f} s | columnar {after:7.3f} s | {args.rows / after / 1e6:6.2f} M rows/s | x{before / after:.1f}")
+    passed = min(speedups) >= args.target
+    print(f"Target x{args.target:.0f}     : {'PASS' if passed else 'FAIL'}")
+    print("========================================\n")
+    sys.exit(0 if passed else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# bench_startup.py: Startup time of the non-plot paths (and whether they load matplotlib), and render time of a long signal through imucommon.plotting.
+# python benchmarks/bench_startup.py --repeats 5 --samples 10000000
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Local Imports:
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+from imucommon.parts import POSE_ESTIMATION_PART, STEP_COUNTER_PART
+from imucommon.plotting import renderLinePlot
+
+# Child process body: runs one case and reports whether matplotlib got imported!
+CHILD = """
+import json, runpy, sys, contextlib, io
+case = json.loads(sys.argv[1])
+sys.path.insert(0, case["cwd"])
+sys.argv = [case["script"] or "-"] + case["args"]
+with contextlib.redirect_stdout(io.StringIO()):
+    if case["script"]:
+        runpy.run_path(case["script"], run_name="__main__")
+    else:
+        exec(case["code"])
+print(json.dumps({"matplotlib": "matplotlib" in sys.modules}))
+"""
+
+# Cases: name, working directory, script (or code), arguments, whether matplotlib is expected!
+def startupCases():
+    return [
+        ("import matplotlib.pyplot (reference)", ROOT, None, "import matplotlib.pyplot", [], True),
+        ("import modules.poseEstimator", POSE_ESTIMATION_PART, None, "import modules.poseEstimator", [], False),
+        ("Part2 main.py (no --plot)", STEP_COUNTER_PART, "main.py", None, ["--file", "data/walking.csv", "--fs", "100"], False),
+        ("Part3 main.py --no-plot", POSE_ESTIMATION_PART, "main.py", None, ["--file", "data/mergedWalk.csv", "--fs", "100", "--no-plot"], False),
+    ]
+
+def runCase(cwd, script, code, args, repeats):
+    case = json.dumps({"cwd": cwd, "script": script, "code": code, "args": args})
+    timings, report = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", CHILD, case], cwd=cwd, capture_output=True, text=True, check=True)
+        timings.append(time.perf_counter() - start)
+        report = json.loads(completed.stdout.strip().splitlines()[-1])
+    return float(np.median(timings)), report["matplotlib"]
+
+def main():
+    ap = argparse.ArgumentParser(description="Startup and plotting benchmark")
+    ap.add_argument("--repeats", type=int, default=5, help="Runs per startup case (median is reported)")
+    ap.add_argument("--samples", type=int, default=10_000_000, help="Samples in the render benchmark")
+    ap.add_argument("--full", action="store_true", help="Also render the signal without decimation (slow)")
+    args = ap.parse_args()
+
+    # 1) Startup cases, each in a fresh interpreter!
+    failed = False
+    print(f"{'Case':<40} {'Median (s)':>10} {'matplotlib':>11}")
+    for name, cwd, script, code, caseArgs, expected in startupCases():
+        seconds, loaded = runCase(cwd, script, code, caseArgs, args.repeats)
+        flag = "" if loaded == expected else "  <-- unexpected"
+        failed = failed or loaded != expected
+        print(f"{name:<40} {seconds:>10.3f} {'loaded' if loaded else 'not loaded':>11}{flag}")
+
+    # 2) Rendering a long noisy signal (the first render also pays the matplotlib import)!
+    rng = np.random.default_rng(0)
+    signal = np.cumsum(rng.normal(0.0, 1.0, args.samples))
+    with tempfile.TemporaryDirectory() as folder:
+        renderLinePlot(os.path.join(folder, "warmup.png"), [{"y": signal[:1000]}], legend=False)
+        for decimate in ((True, False) if args.full else (True,)):
+            start = time.perf_counter()
+            renderLinePlot(os.path.join(folder, "signal.png"), [{"y": signal, "label": "signal", "linewidth": 1}], figsize=(10, 4), dpi=160, decimate=decimate)
+            print(f"Render {args.samples} samples ({'min/max decimated' if decimate else 'full'}): {time.perf_counter() - start:.2f} s")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+# run_benchmarks.py: Benchmark suite for the three pipelines on synthetic recordings. Every case runs in its own process and reports
+# its best time, throughput (samples/s) and peak RSS; results go to a JSON file and are compared with a stored baseline.
+# python benchmarks/run_benchmarks.py --samples 1000000                      (exit code 1 when a case regresses beyond --threshold)
+# python benchmarks/run_benchmarks.py --samples 1000000 --update-baseline    (stores the current results as the baseline)
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Local Imports:
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+from imucommon.parts import POSE_ESTIMATION_PART, STEP_COUNTER_PART, MOTION_ANALYSIS_ROOT, importPartModule
+from imucommon.resultfiles import outputPath, writeTable
+from synthetic import expectedSteps, writeAccelCsv, writeImuCsv, writeSensorCsvs
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results.json")
+DATA_VERSION = 1
+
+# Every timing covers at least this long: faster cases are called in a loop and timed per call, so sub-millisecond cases do not swing!
+MIN_TIMED_SECONDS = 0.1
+
+# Settings of the synthetic data a baseline is only comparable with!
+BASELINE_CONFIG_KEYS = ("samples", "fs", "options")
+
+# Helper function that returns the best wall time per call of 'repeats' timings (each one at least MIN_TIMED_SECONDS) and the last result!
+def bestOf(function: Callable[[], object], repeats: int) -> Tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        calls, start = 0, time.perf_counter()
+        while True:
+            result = function()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_TIMED_SECONDS:
+                break
+        best = min(best, elapsed / calls)
+    return best, result
+
+# Peak resident set size of this process in MB. On Linux VmHWM is used, because ru_maxrss keeps the high-water mark of the parent
+# the process was forked from; None where neither is available (Windows)!
+def peakRssMb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxRss / (1024.0 * 1024.0) if sys.platform == "darwin" else maxRss / 1024.0
+
+# 1) Cases: each one prepares its inputs (not timed) and returns a function to time. 'paths' holds the synthetic files! Cases that do not process
+# the whole synthetic recording return (function, samples) with the number of samples one call processes instead!
+def partFunction(part: str, moduleName: str, name: str):
+    return getattr(importPartModule(part, moduleName), name)
+
+def caseLoadMagnitude(paths, fs, cached: bool):
+    loadMagnitude = partFunction(STEP_COUNTER_PART, "modules.dataloader", "loadMagnitude")
+    if cached:
+        loadMagnitude(paths["accel"], asArray=True, useCache=True)
+    return lambda: loadMagnitude(paths["accel"], asArray=True, useCache=cached)
+
+def casePreprocessSteps(paths, fs, engine: str):
+    magnitude = partFunction(STEP_COUNTER_PART, "modules.dataloader", "loadMagnitude")(paths["accel"], asArray=engine == "numpy")
+    preprocessSteps = partFunction(STEP_COUNTER_PART, "modules.filters", "preprocessSteps")
+    return lambda: preprocessSteps(magnitude, fs, engine=engine)
+
+def casePeaks(paths, fs, merge: bool, vectorized: bool = False):
+    magnitude = partFunction(STEP_COUNTER_PART, "modules.dataloader", "loadMagnitude")(paths["accel"], asArray=True)
+    signal = partFunction(STEP_COUNTER_PART, "modules.filters", "preprocessSteps")(magnitude, fs, engine="numpy")
+    peaks = importPartModule(STEP_COUNTER_PART, "modules.peaks")
+    threshold = peaks.dynamicTreshold(signal, 0.8)
+    if vectorized:
+        return lambda: peaks.findPeaks(signal, threshold, int(0.35 * fs), mode="merge" if merge else "refractory")
+    signal = signal.tolist()
+    detect = peaks.peakDetectionWithMerge if merge else peaks.peakDetection
+    return lambda: detect(signal, threshold, int(0.35 * fs))
+
+# Windowed cadence straight from the magnitude (modules/cadence.py), the alternative to the filter + threshold + peak cases above!
+def caseCadence(paths, fs, method: str):
+    magnitude = partFunction(STEP_COUNTER_PART, "modules.dataloader", "loadMagnitude")(paths["accel"], asArray=True)
+    windowedCadence = partFunction(STEP_COUNTER_PART, "modules.cadence", "windowedCadence")
+    return lambda: windowedCadence(magnitude, fs, method)
+
+# Gait metrics (modules/gait.py) over 2M synthetic steps (~0.55 s apart with jitter and a pause every 500 steps), in one vectorized
+# call or fed to the incremental tracker 4096 steps at a time!
+def caseGait(paths, fs, incremental: bool):
+    gait = importPartModule(STEP_COUNTER_PART, "modules.gait")
+    rng = np.random.default_rng(7)
+    intervals = np.rint(rng.normal(0.55, 0.04, 2_000_000) * fs).astype(np.int64)
+    intervals[::500] += int(5 * fs)
+    peaks = np.cumsum(intervals)
+    amplitudes = rng.normal(3.0, 0.5, peaks.size)
+    if not incremental:
+        return (lambda: gait.gaitMetrics(peaks, amplitudes, fs)), peaks.size
+    def run():
+        tracker = gait.GaitTracker(fs)
+        for start in range(0, peaks.size, 4096):
+            tracker.update(peaks[start:start + 4096], amplitudes[start:start + 4096])
+        return tracker.summary()
+    return run, peaks.size
+
+def caseThreshold(paths, fs, windowSeconds: Optional[float]):
+    magnitude = partFunction(STEP_COUNTER_PART, "modules.dataloader", "loadMagnitude")(paths["accel"], asArray=True)
+    signal = partFunction(STEP_COUNTER_PART, "modules.filters", "preprocessSteps")(magnitude, fs, engine="numpy").tolist()
+    peaks = importPartModule(STEP_COUNTER_PART, "modules.peaks")
+    if windowSeconds is None:
+        return lambda: peaks.dynamicTreshold(signal, 0.8)
+    return lambda: peaks.windowedThresholds(signal, int(windowSeconds * fs), 0.8)
+
+def caseCombine(paths, fs, engine: str):
+    loaded = partFunction(POSE_ESTIMATION_PART, "modules.dataloader", "load_imu_columns")(paths["imu"])
+    filterModule = importPartModule(POSE_ESTIMATION_PART, "modules.filter")
+    channels = [loaded[name] if engine == "numpy" else loaded[name].tolist() for name in ("ax", "ay", "az", "gx", "gy", "gz")]
+    combine = filterModule.combineIMUDataBatch if engine == "numpy" else filterModule.combineIMUData
+    return lambda: combine(*channels, samplingRate=fs, includeYAW=True)
+
+def caseWriteOrientation(paths, fs, workDir, fmt: str):
+    loaded = partFunction(POSE_ESTIMATION_PART, "modules.dataloader", "load_imu_columns")(paths["imu"])
+    channels = [loaded[name] for name in ("ax", "ay", "az", "gx", "gy", "gz")]
+    rollDegree, pitchDegree, yawDegree = importPartModule(POSE_ESTIMATION_PART, "modules.filter").combineIMUDataBatch(*channels, samplingRate=fs, includeYAW=True)
+    poseEstimator = importPartModule(POSE_ESTIMATION_PART, "modules.poseEstimator")
+    columns = poseEstimator.outputColumns(loaded["timestamp"], rollDegree, pitchDegree, yawDegree, None, True, False)
+    path = outputPath(workDir, "orientation_output", fmt)
+    return lambda: writeTable(path, fmt, poseEstimator.outputLayout(True, False), columns)
+
+def caseMerge(paths, fs, workDir):
+    mergeStreams = partFunction(POSE_ESTIMATION_PART, "modules.mergedata", "mergeStreams")
+    return lambda: mergeStreams(paths["sensor_accel"], paths["sensor_gyro"], os.path.join(workDir, "merged.csv"), rate=fs, method="linear")
+
+# Recording store (imucommon/recstore.py): the merged recording is ingested into a store in the scratch folder (not timed), then 5 minutes
+# of it are read by time range, or summarized from the index alone. Compare with loadMagnitude_csv / _cache, which read everything!
+def caseStore(paths, fs, workDir, summary: bool):
+    from imucommon.recstore import ingestRecording, loadStoreColumns, summarize
+    root = os.path.join(workDir, "store")
+    ingestRecording(paths["imu"], "bench", "merged", root=root)
+    uri = "store://bench/merged?start=1800&end=2100"
+    if summary:
+        return (lambda: summarize(uri, root=root)), summarize(uri, root=root)["rows"]
+    return (lambda: loadStoreColumns(uri, root=root)), loadStoreColumns(uri, root=root)["rows"]
+
+def caseSweepSteps(paths, fs, workers: int):
+    sys.path.insert(0, MOTION_ANALYSIS_ROOT)
+    from sweep import sweepSteps
+    grid = {"k_auto": [round(0.4 + 0.1 * i, 1) for i in range(10)], "min_gap_ms": list(range(250, 500, 25))}
+    return lambda: sweepSteps([paths["accel"]], grid, samplingFrequency=int(fs), workers=workers)
+
+# End-to-end cases run the real main.py in a subprocess from a scratch folder (its outputs/ lands there). The wrapper reports the
+# peak RSS of that subprocess on its last stdout line!
+MAIN_WRAPPER = """
+import runpy, sys, contextlib, io, json
+sys.path.insert(0, {benchDir!r})
+from run_benchmarks import peakRssMb
+sys.argv = sys.argv[1:]
+sys.path.insert(0, __import__("os").path.dirname(sys.argv[0]))
+with contextlib.redirect_stdout(io.StringIO()):
+    runpy.run_path(sys.argv[0], run_name="__main__")
+print(json.dumps(peakRssMb()))
+"""
+
+def mainCommand(part: str, arguments: List[str]) -> List[str]:
+    return [sys.executable, "-c", MAIN_WRAPPER.format(benchDir=BENCH_DIR), os.path.join(MOTION_ANALYSIS_ROOT, part, "main.py")] + arguments
+
+def caseMain(paths, fs, workDir, pipeline: str, engine: str, chunkSize: Optional[int] = None, extra: Optional[List[str]] = None):
+    chunked = (["--chunk-size", str(chunkSize)] if chunkSize else []) + (extra or [])
+    if pipeline == "steps":
+        command = mainCommand(STEP_COUNTER_PART, ["--file", paths["accel"], "--fs", str(int(fs)), "--engine", engine] + chunked)
+    else:
+        command = mainCommand(POSE_ESTIMATION_PART, ["--file", paths["imu"], "--fs", str(fs), "--engine", engine, "--no-plot"] + chunked)
+    def run():
+        completed = subprocess.run(command, cwd=workDir, check=True, capture_output=True, text=True)
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+    return run
+
+# Fused steps + pose over the merged recording (fused.py), to compare with the two part2/part3 main cases run back to back!
+def caseFusedMain(paths, fs, workDir):
+    command = [sys.executable, "-c", MAIN_WRAPPER.format(benchDir=BENCH_DIR), os.path.join(MOTION_ANALYSIS_ROOT, "fused.py"), "--file", paths["imu"], "--fs", str(fs)]
+    def run():
+        completed = subprocess.run(command, cwd=workDir, check=True, capture_output=True, text=True)
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+    return run
+
+CASES = {
+    "loadMagnitude_csv": lambda p, fs, w: caseLoadMagnitude(p, fs, cached=False),
+    "loadMagnitude_cache": lambda p, fs, w: caseLoadMagnitude(p, fs, cached=True),
+    "preprocessSteps_list": lambda p, fs, w: casePreprocessSteps(p, fs, "list"),
+    "preprocessSteps_numpy": lambda p, fs, w: casePreprocessSteps(p, fs, "numpy"),
+    "dynamicTreshold": lambda p, fs, w: caseThreshold(p, fs, None),
+    "windowedThresholds": lambda p, fs, w: caseThreshold(p, fs, 5.0),
+    "peakDetection": lambda p, fs, w: casePeaks(p, fs, merge=False),
+    "peakDetectionWithMerge": lambda p, fs, w: casePeaks(p, fs, merge=True),
+    "findPeaks_refractory": lambda p, fs, w: casePeaks(p, fs, merge=False, vectorized=True),
+    "findPeaks_merge": lambda p, fs, w: casePeaks(p, fs, merge=True, vectorized=True),
+    "combineIMUData_list": lambda p, fs, w: caseCombine(p, fs, "list"),
+    "combineIMUData_numpy": lambda p, fs, w: caseCombine(p, fs, "numpy"),
+    "writeOrientation_csv": lambda p, fs, w: caseWriteOrientation(p, fs, w, "csv"),
+    "writeOrientation_npz": lambda p, fs, w: caseWriteOrientation(p, fs, w, "npz"),
+    "writeOrientation_bin": lambda p, fs, w: caseWriteOrientation(p, fs, w, "bin"),
+    "mergeStreams": lambda p, fs, w: caseMerge(p, fs, w),
+    "windowedCadence_spectrum": lambda p, fs, w: caseCadence(p, fs, "spectrum"),
+    "windowedCadence_autocorr": lambda p, fs, w: caseCadence(p, fs, "autocorr"),
+    "storeRange_5min": lambda p, fs, w: caseStore(p, fs, w, summary=False),
+    "storeSummary_5min": lambda p, fs, w: caseStore(p, fs, w, summary=True),
+    "gaitMetrics_2M": lambda p, fs, w: caseGait(p, fs, incremental=False),
+    "gaitTracker_2M": lambda p, fs, w: caseGait(p, fs, incremental=True),
+    "sweepSteps_100": lambda p, fs, w: caseSweepSteps(p, fs, workers=1),
+    "part2_main_list": lambda p, fs, w: caseMain(p, fs, w, "steps", "list"),
+    "part2_main_numpy": lambda p, fs, w: caseMain(p, fs, w, "steps", "numpy"),
+    "part2_main_chunked": lambda p, fs, w: caseMain(p, fs, w, "steps", "numpy", chunkSize=65536),
+    "part2_main_cadence": lambda p, fs, w: caseMain(p, fs, w, "steps", "numpy", extra=["--cadence", "spectrum", "--cadence-only"]),
+    "part3_main_list": lambda p, fs, w: caseMain(p, fs, w, "pose", "list"),
+    "part3_main_numpy": lambda p, fs, w: caseMain(p, fs, w, "pose", "numpy"),
+    "part3_main_chunked": lambda p, fs, w: caseMain(p, fs, w, "pose", "numpy", chunkSize=65536),
+    "fused_main_numpy": lambda p, fs, w: caseFusedMain(p, fs, w),
+}
+
+# 2) Child process: runs one case and prints its measurements as JSON!
+def runChild(caseName: str, paths: Dict[str, str], fs: float, samples: int, repeats: int) -> Dict[str, object]:
+    build = CASES[caseName]
+    with tempfile.TemporaryDirectory() as workDir:
+        function = build(paths, fs, workDir)
+        if isinstance(function, tuple):
+            function, samples = function
+        seconds, result = bestOf(function, repeats)
+    endToEnd = "_main_" in caseName # the main.py / fused.py cases return the peak RSS of the script's own process
+    return {"seconds": seconds, "samples": samples, "samples_per_s": samples / seconds if seconds > 0 else None, "peak_rss_mb": result if endToEnd else peakRssMb()}
+
+# 3) Synthetic data, written once per size/options and reused while its meta file matches!
+def prepareData(dataDir: str, samples: int, fs: float, options: Dict[str, object]) -> Dict[str, str]:
+    os.makedirs(dataDir, exist_ok=True)
+    paths = {name: os.path.join(dataDir, fileName) for name, fileName in (("accel", "walking.csv"), ("imu", "merged.csv"), ("sensor_accel", "Accelerometer.csv"), ("sensor_gyro", "Gyroscope.csv"))}
+    meta = {"version": DATA_VERSION, "samples": samples, "fs": fs, "options": options}
+    metaPath = os.path.join(dataDir, "meta.json")
+    if os.path.exists(metaPath) and all(os.path.exists(path) for path in paths.values()):
+        with open(metaPath) as file:
+            if json.load(file) == meta:
+                return paths
+    print(f"Writing synthetic recordings ({samples} samples) to {dataDir} ...", flush=True)
+    writeAccelCsv(paths["accel"], samples, fs=fs, **options)
+    writeImuCsv(paths["imu"], samples, fs=fs, **options)
+    writeSensorCsvs(paths["sensor_accel"], paths["sensor_gyro"], samples, fs=fs, **options)
+    with open(metaPath, "w") as file:
+        json.dump(meta, file)
+    return paths
+
+# 4) Comparing with the baseline: slower throughput or larger peak RSS than allowed is a regression! A baseline recorded on other synthetic
+# data (size, rate or options) is not compared at all!
+def compareWithBaseline(results: Dict[str, Dict[str, object]], baseline: Dict[str, object], threshold: float, rssThreshold: float, meta: Dict[str, object]) -> List[str]:
+    regressions = []
+    baselineMeta = baseline.get("meta", {})
+    different = [key for key in BASELINE_CONFIG_KEYS if baselineMeta.get(key) != meta[key]]
+    if different:
+        print(f"Baseline not compared, it was recorded with other {', '.join(different)} ({', '.join(f'{key}={baselineMeta.get(key)}' for key in different)})")
+        for current in results.values():
+            current["baseline"] = None
+        return regressions
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None or previous.get("samples") != current["samples"]:
+            current["baseline"] = None
+            continue
+        speed = current["samples_per_s"] / previous["samples_per_s"]
+        current["baseline"] = {"samples_per_s": previous["samples_per_s"], "peak_rss_mb": previous.get("peak_rss_mb"), "speed_ratio": speed}
+        if speed < 1.0 - threshold:
+            regressions.append(f"{name}: throughput {speed:.2f}x of baseline")
+        if current["peak_rss_mb"] and previous.get("peak_rss_mb") and current["peak_rss_mb"] > previous["peak_rss_mb"] * (1.0 + rssThreshold):
+            regressions.append(f"{name}: peak RSS {current['peak_rss_mb']:.0f} MB vs {previous['peak_rss_mb']:.0f} MB")
+    return regressions
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Benchmark suite for the step counter and pose estimation pipelines")
+    ap.add_argument("--samples", type=int, default=1_000_000, help="Samples per synthetic recording (default=1000000, up to 100M)")
+    ap.add_argument("--fs", type=float, default=100.0, help="Sampling rate of the synthetic recordings (default=100)")
+    ap.add_argument("--activity", choices=("standing", "walking", "running"), default="walking", help="Synthetic activity (default: walking)")
+    ap.add_argument("--cadence", type=float, default=None, help="Steps per minute (default: preset of the activity)")
+    ap.add_argument("--roll", type=float, default=80.0, help="Device roll against gravity in degrees (default=80)")
+    ap.add_argument("--pitch", type=float, default=-5.0, help="Device pitch against gravity in degrees (default=-5)")
+    ap.add_argument("--noise", type=float, default=0.3, help="Accelerometer noise std in m/s^2 (default=0.3)")
+    ap.add_argument("--drift", type=float, default=0.002, help="Gyro bias in rad/s (default=0.002)")
+    ap.add_argument("--dropouts", type=float, default=0.0, help="Fraction of lost samples, in bursts (default=0)")
+    ap.add_argument("--cases", nargs="+", choices=sorted(CASES), default=None, help="Cases to run (default: all)")
+    ap.add_argument("--repeats", type=int, default=3, help="Timing repeats per case, best one counts (default=3)")
+    ap.add_argument("--data-dir", default=None, help="Folder for the synthetic recordings, reused between runs (default: temporary)")
+    ap.add_argument("--output", default=RESULTS_PATH, help="Results JSON (default: benchmarks/results.json)")
+    ap.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON to compare with (default: benchmarks/baseline.json)")
+    ap.add_argument("--threshold", type=float, default=0.25, help="Allowed throughput loss against the baseline (default=0.25)")
+    ap.add_argument("--rss-threshold", type=float, default=0.25, help="Allowed peak RSS growth against the baseline (default=0.25)")
+    ap.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline instead of comparing")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--paths", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(runChild(args.child, json.loads(args.paths), args.fs, args.samples, args.repeats)))
+        return
+
+    options = {"activity": args.activity, "cadenceSpm": args.cadence, "rollDegree": args.roll, "pitchDegree": args.pitch, "accelNoise": args.noise, "gyroDrift": args.drift, "dropoutRate": args.dropouts}
+    temporary = None if args.data_dir else tempfile.TemporaryDirectory()
+    try:
+        paths = prepareData(args.data_dir or temporary.name, args.samples, args.fs, options)
+
+        # 5) Every case in a fresh interpreter, so imports and peak RSS do not leak between cases!
+        results: Dict[str, Dict[str, object]] = {}
+        print(f"\n{'Case':<24} {'Best (s)':>9} {'Samples/s':>12} {'Peak RSS':>10}")
+        for name in args.cases or list(CASES):
+            command = [sys.executable, os.path.abspath(__file__), "--child", name, "--paths", json.dumps(paths), "--fs", str(args.fs), "--samples", str(args.samples), "--repeats", str(args.repeats)]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"{name:<24} FAILED\n{completed.stderr}")
+                results[name] = {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+                continue
+            results[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+            rss = results[name]["peak_rss_mb"]
+            print(f"{name:<24} {results[name]['seconds']:>9.3f} {results[name]['samples_per_s']:>12,.0f} {('-' if rss is None else f'{rss:.0f} MB'):>10}", flush=True)
+    finally:
+        if temporary is not None:
+            temporary.cleanup()
+
+    # 6) Writing the results, then comparing with (or replacing) the baseline!
+    succeeded = {name: result for name, result in results.items() if "error" not in result}
+    report = {
+        "meta": {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                 "samples": args.samples, "fs": args.fs, "options": options, "expected_steps": expectedSteps(args.samples, args.fs, args.activity, args.cadence)},
+        "results": results,
+    }
+    regressions: List[str] = []
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump({"meta": report["meta"], "results": succeeded}, file, indent=2)
+        print(f"\nBaseline written: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = compareWithBaseline(succeeded, json.load(file), args.threshold, args.rss_threshold, report["meta"])
+    report["regressions"] = regressions
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written: {args.output}")
+
+    failures = [name for name, result in results.items() if "error" in result]
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    sys.exit(1 if regressions or failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# synthetic.py: Synthetic IMU recordings for the benchmarks (walking/running at a chosen cadence, device orientation, noise, gyro drift, dropouts).
+# Recordings are generated block by block from the sample index, so files of 100M+ samples can be written without holding them in memory!
+from math import pi
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+GRAVITY = 9.81
+
+# Activity presets: steps per minute and vertical acceleration amplitude (m/s^2)!
+ACTIVITIES = {
+    "standing": {"cadence_spm": 0.0, "amplitude": 0.0},
+    "walking": {"cadence_spm": 110.0, "amplitude": 3.0},
+    "running": {"cadence_spm": 170.0, "amplitude": 9.0},
+}
+
+# Phyphox style headers of the recordings in the data/ folders!
+ACCEL_HEADERS = ["Time (s)", "Acceleration x (m/s^2)", "Acceleration y (m/s^2)", "Acceleration z (m/s^2)", "Absolute acceleration (m/s^2)"]
+SENSOR_ACCEL_HEADERS = ["Time (s)", "X (m/s^2)", "Y (m/s^2)", "Z (m/s^2)"]
+SENSOR_GYRO_HEADERS = ["Time (s)", "X (rad/s)", "Y (rad/s)", "Z (rad/s)"]
+IMU_HEADERS = ["timestamp", "ax", "ay", "az", "gx", "gy", "gz"]
+
+def stepFrequency(activity: str = "walking", cadenceSpm: Optional[float] = None) -> float:
+    if activity not in ACTIVITIES:
+        raise ValueError(f"Unknown activity '{activity}', expected one of {tuple(ACTIVITIES)}")
+    return (ACTIVITIES[activity]["cadence_spm"] if cadenceSpm is None else cadenceSpm) / 60.0
+
+# Number of steps in a recording (one step per vertical acceleration cycle), the ground truth for step counting!
+def expectedSteps(samples: int, fs: float = 100.0, activity: str = "walking", cadenceSpm: Optional[float] = None) -> int:
+    return int(samples / fs * stepFrequency(activity, cadenceSpm))
+
+# Main function: yields blocks {"timestamp", "ax", "ay", "az", "gx", "gy", "gz"} of up to blockSize samples.
+# The device sits at a fixed roll/pitch and sways in roll once per stride; the world frame signal is gravity plus a vertical step
+# wave and a forward surge. dropoutRate is the fraction of samples lost, in bursts of dropoutBurst samples!
+def syntheticBlocks(samples: int, fs: float = 100.0, activity: str = "walking", cadenceSpm: Optional[float] = None, rollDegree: float = 80.0, pitchDegree: float = -5.0,
+                    swayDegree: float = 5.0, accelNoise: float = 0.3, gyroNoise: float = 0.02, gyroDrift: float = 0.002, jitterSeconds: float = 0.0,
+                    dropoutRate: float = 0.0, dropoutBurst: int = 5, seed: int = 0, blockSize: int = 1_000_000) -> Iterator[Dict[str, np.ndarray]]:
+    frequency = stepFrequency(activity, cadenceSpm)
+    amplitude = ACTIVITIES[activity]["amplitude"] if frequency > 0.0 else 0.0
+    pitch = pitchDegree * pi / 180.0
+    for blockIndex, start in enumerate(range(0, samples, blockSize)):
+        rng = np.random.default_rng([seed, blockIndex])
+        count = min(blockSize, samples - start)
+        t = (start + np.arange(count)) / fs
+
+        # 1) Motion: step wave (vertical), surge (forward) and the roll sway with its rate
+        stepPhase = 2.0 * pi * frequency * t
+        vertical = amplitude * (np.sin(stepPhase) + 0.3 * np.sin(2.0 * stepPhase))
+        forward = 0.3 * amplitude * np.cos(stepPhase)
+        roll = (rollDegree + swayDegree * np.sin(0.5 * stepPhase)) * (pi / 180.0)
+        rollRate = (swayDegree * pi / 180.0) * (pi * frequency) * np.cos(0.5 * stepPhase)
+
+        # 2) World to sensor frame: R^T (forward, 0, g + vertical) for roll(t) and a fixed pitch
+        sinRoll, cosRoll = np.sin(roll), np.cos(roll)
+        up = GRAVITY + vertical
+        block = {
+            "timestamp": t + (rng.normal(0.0, jitterSeconds, count) if jitterSeconds > 0.0 else 0.0),
+            "ax": -np.sin(pitch) * up + np.cos(pitch) * forward,
+            "ay": sinRoll * (np.cos(pitch) * up + np.sin(pitch) * forward),
+            "az": cosRoll * (np.cos(pitch) * up + np.sin(pitch) * forward),
+            "gx": rollRate + gyroDrift,
+            "gy": np.full(count, gyroDrift),
+            "gz": np.full(count, gyroDrift),
+        }
+
+        # 3) Sensor noise
+        for name in ("ax", "ay", "az"):
+            block[name] += rng.normal(0.0, accelNoise, count)
+        for name in ("gx", "gy", "gz"):
+            block[name] += rng.normal(0.0, gyroNoise, count)
+
+        # 4) Dropouts: bursts of lost samples
+        if dropoutRate > 0.0:
+            starts = (rng.random(count) < dropoutRate / max(1, dropoutBurst)).astype(np.int8)
+            lost = np.convolve(starts, np.ones(max(1, dropoutBurst), dtype=np.int8))[:count] > 0
+            block = {name: values[~lost] for name, values in block.items()}
+        yield block
+
+def syntheticRecording(samples: int, **options) -> Dict[str, np.ndarray]:
+    blocks = list(syntheticBlocks(samples, **options))
+    return {name: np.concatenate([block[name] for block in blocks]) for name in IMU_HEADERS}
+
+# Writers: Part 2 accelerometer export, Part 3 merged table, and the two separate Part 3 sensor exports (gyro clock offset by gyroOffset)!
+def writeRows(path: str, headers, blocks, columns, quoted: bool = True, timeOffset: float = 0.0) -> int:
+    rows = 0
+    rowFormat = ",".join(["%.9E"] * len(columns)) + "\n"
+    with open(path, "w", newline="") as file:
+        file.write(",".join(f'"{h}"' if quoted else h for h in headers) + "\n")
+        for block in blocks:
+            table = np.column_stack([block["timestamp"] + timeOffset if name == "timestamp" else (np.sqrt(block["ax"]**2 + block["ay"]**2 + block["az"]**2) if name == "abs" else block[name]) for name in columns])
+            file.write((rowFormat * len(table)) % tuple(table.ravel()))
+            rows += len(table)
+    return rows
+
+def writeAccelCsv(path: str, samples: int, **options) -> int:
+    return writeRows(path, ACCEL_HEADERS, syntheticBlocks(samples, **options), ["timestamp", "ax", "ay", "az", "abs"])
+
+def writeImuCsv(path: str, samples: int, **options) -> int:
+    return writeRows(path, IMU_HEADERS, syntheticBlocks(samples, **options), IMU_HEADERS, quoted=False)
+
+def writeSensorCsvs(accelPath: str, gyroPath: str, samples: int, gyroOffset: float = 0.004, **options) -> int:
+    writeRows(accelPath, SENSOR_ACCEL_HEADERS, syntheticBlocks(samples, **options), ["timestamp", "ax", "ay", "az"])
+    return writeRows(gyroPath, SENSOR_GYRO_HEADERS, syntheticBlocks(samples, **options), ["timestamp", "gx", "gy", "gz"], timeOffset=gyroOffset)
@@ -0,0 +1,11 @@
+# conftest.py: Shared pytest setup. This folder is on sys.path for the tests, so 'imucommon' and 'benchmarks' import directly,
+# and the Part modules are imported through importPartModule (Part2 and Part3 both call their package 'modules')!
+import numpy as np
+import pytest
+
+# Helper fixture: a short noisy walking-like magnitude with twin peaks, small enough for the per-sample reference implementations!
+@pytest.fixture
+def stepSignal() -> np.ndarray:
+    rng = np.random.default_rng(7)
+    t = np.arange(3000) / 100.0
+    return 9.81 + 2.0 * np.sin(2 * np.pi * 1.8 * t) + 0.8 * np.sin(2 * np.pi * 5.4 * t) + rng.normal(0.0, 0.3, t.size)
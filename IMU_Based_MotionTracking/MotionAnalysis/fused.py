@@ -0,0 +1,177 @@
+# fused.py: Steps and pose from one merged IMU recording (timestamp, ax, ay, az, gx, gy, gz) in a single pass over one load. The file is parsed
+# (or its .imucache mapped) once, the step counter runs on the magnitude of the same accelerometer arrays the orientation filter reads (no
+# copies), and every step is annotated with the roll/pitch at that sample. Replaces running the Part 2 and Part 3 main.py back to back.
+# python fused.py --file Part3_PoseEstimation/data/mergedWalk.csv --fs 100
+# python fused.py --file Part3_PoseEstimation/data/mergedWalk.csv --orientation --out-format bin      (also the full orientation table)
+import argparse
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Local Imports:
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from imucommon.columnar import vectorMagnitude
+from imucommon.parts import POSE_ESTIMATION_PART, STEP_COUNTER_PART, importPartModule
+from imucommon.profiling import PROFILE_FORMATS, StageProfiler, profilerOrNull, writeProfile
+from imucommon.resultfiles import OUTPUT_FORMATS, checkOutputFormat, outputPath, writeTable
+
+# Helper function that returns the channels of the steps table: the step, its time and the orientation at it (yaw only when asked for)!
+def stepPoseLayout(includeYaw: bool) -> List[Tuple[str, str, str]]:
+    layout = [("step_index", "d", "<i8"), ("time_s", ".3f", "<f8"), ("roll_deg", ".4f", "<f8"), ("pitch_deg", ".4f", "<f8")]
+    if includeYaw:
+        layout.append(("yaw_deg", ".4f", "<f8"))
+    return layout
+
+# Main function: step detection and orientation of one merged recording, steps annotated with roll/pitch (and yaw) written to
+# '<outputDir>/steps_pose.<ext>', the full orientation table only with orientationOutput. The step counter uses the numpy engine,
+# with the sampling rate rounded to whole Hz like the Part 2 --fs; without sampleRate both take it from the timestamps!
+def runFused(csvPath: str, sampleRate: Optional[float] = None, thresholdMode: str | float = "auto", sensitivityFactor: float = 0.8, minGapMiliseconds: int = 350, peakMode: str = "refractory",
+             alpha: float = 0.98, gyroUnit: str = "rad", filterName: str = "complementary", beta: float = 0.1, kp: float = 1.0, ki: float = 0.0, includeYaw: Optional[bool] = None,
+             timeMode: str = "auto", gapFactor: float = 5.0, gapMode: str = "reset", outputDir: str = "fused_outputs", outputFormat: str = "csv", orientationOutput: bool = False,
+             useCache: bool = True, profiler: Optional[StageProfiler] = None) -> Dict[str, object]:
+    dataloader = importPartModule(POSE_ESTIMATION_PART, "modules.dataloader")
+    poseFilter = importPartModule(POSE_ESTIMATION_PART, "modules.filter")
+    orientation = importPartModule(POSE_ESTIMATION_PART, "modules.orientation")
+    poseEstimator = importPartModule(POSE_ESTIMATION_PART, "modules.poseEstimator")
+    stepcounter = importPartModule(STEP_COUNTER_PART, "modules.stepcounter")
+    checkOutputFormat(outputFormat)
+    if peakMode not in importPartModule(STEP_COUNTER_PART, "modules.peaks").PEAK_MODES:
+        raise ValueError(f"Unknown peak mode '{peakMode}'")
+    if timeMode not in poseFilter.TIME_MODES:
+        raise ValueError(f"Unknown time mode '{timeMode}', expected one of {poseFilter.TIME_MODES}")
+    stages = profilerOrNull(profiler)
+
+    # 1) Loading every channel once, as float64 views into the mapped cache (or the parsed table)
+    with stages.stage("load") as stage:
+        loaded = dataloader.load_imu_columns(csvPath, useCache=useCache)
+        timestamps, xAccel, yAccel, zAccel, xGyro, yGyro, zGyro = [loaded[name] for name in dataloader.IMU_CHANNELS]
+        sampleCount = stage.samples = len(timestamps)
+    if timeMode == "auto":
+        timeMode = "fixed" if sampleRate else "timestamps"
+    if sampleCount == 0 or (timeMode == "fixed" and (sampleRate is None or sampleRate <= 0)):
+        raise ValueError("Empty data or fs <= 0. Check file and arguments.")
+
+    # 2) Sample spacing from the timestamps, shared by the orientation filter and the step counter's rate
+    steps = None
+    with stages.stage("timing", samples=sampleCount):
+        if timeMode == "timestamps":
+            steps = poseFilter.timestampSteps(timestamps, gapFactor, gapMode)
+        fs = float(sampleRate) if timeMode == "fixed" else float(steps["fs"])
+        stepRate = max(1, int(round(fs)))
+
+    # 3) Steps: magnitude of the accelerometer arrays, then the Part 2 filter, threshold and peaks
+    with stages.stage("magnitude", samples=sampleCount):
+        magnitude = vectorMagnitude(xAccel, yAccel, zAccel)
+    detected = stepcounter.detectSteps(magnitude, stepRate, thresholdMode, sensitivityFactor, minGapMiliseconds, "numpy", stages, peakMode)
+    del magnitude, detected["signal"], detected["threshold_series"] # only the peaks are needed from here on, freed before the pose buffers
+
+    # 4) Pose: the orientation filter on the same arrays
+    with stages.stage("pose", samples=sampleCount):
+        quaternion = None
+        if includeYaw is None:
+            includeYaw = filterName != "complementary"
+        if filterName == "complementary":
+            angles = poseFilter.combineIMUDataBatch(xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, samplingRate=sampleRate, alpha=alpha, gyroUnit=gyroUnit, includeYAW=includeYaw, steps=steps)
+            rollDegree, pitchDegree, yawDegree = angles if includeYaw else (angles[0], angles[1], None)
+        else:
+            orientationFilter = orientation.createOrientationFilter(filterName, gyroUnit=gyroUnit, beta=beta, kp=kp, ki=ki)
+            dt, resets = (steps["dt"], steps["resets"]) if steps is not None else (1.0 / float(sampleRate), None)
+            quaternion = orientationFilter.run(xAccel, yAccel, zAccel, xGyro, yGyro, zGyro, dt, resets)
+            rollDegree, pitchDegree, yawDegree = orientation.quaternionToEuler(quaternion)
+
+    # 5) Steps annotated with the orientation at each step, and the full orientation table when asked for
+    peaks = np.asarray(detected["peaks"], dtype=np.int64)
+    stepPose = {"time_s": timestamps[peaks], "roll_deg": rollDegree[peaks], "pitch_deg": pitchDegree[peaks], "yaw_deg": yawDegree[peaks] if includeYaw else None}
+    with stages.stage("output", samples=sampleCount if orientationOutput else len(peaks)):
+        os.makedirs(outputDir, exist_ok=True)
+        columns = [peaks, stepPose["time_s"], stepPose["roll_deg"], stepPose["pitch_deg"]] + ([stepPose["yaw_deg"]] if includeYaw else [])
+        meta = {"kind": "steps_pose", "source": csvPath, "fs": fs, "time_mode": timeMode, "threshold_mode": str(thresholdMode), "k_auto": sensitivityFactor, "min_gap_ms": minGapMiliseconds,
+                "peak_mode": peakMode, "alpha": alpha, "gyro_unit": gyroUnit, "filter": filterName}
+        stepsPath = writeTable(outputPath(outputDir, "steps_pose", outputFormat), outputFormat, stepPoseLayout(includeYaw), columns, meta)
+        orientationPath = None
+        if orientationOutput:
+            orientationPath = writeTable(outputPath(outputDir, "orientation_output", outputFormat), outputFormat, poseEstimator.outputLayout(includeYaw, False),
+                                         poseEstimator.outputColumns(timestamps, rollDegree, pitchDegree, yawDegree, quaternion, includeYaw, False),
+                                         poseEstimator.poseMeta(csvPath, fs, timeMode, alpha, gyroUnit, filterName))
+
+    durationSeconds = float(timestamps[sampleCount - 1] - timestamps[0])
+    _, cadenceSPM = stepcounter.walkingRate(sampleCount, len(peaks), stepRate)
+    return {
+        "peaks": detected["peaks"],
+        "steps": detected["steps"],
+        "step_time_s": stepPose["time_s"],
+        "step_roll_deg": stepPose["roll_deg"],
+        "step_pitch_deg": stepPose["pitch_deg"],
+        "step_yaw_deg": stepPose["yaw_deg"],
+        "threshold": detected["threshold"],
+        "cadence_spm": cadenceSPM,
+        "fs": fs,
+        "step_fs": stepRate,
+        "time_mode": timeMode,
+        "filter": filterName,
+        "alpha": alpha,
+        "steps_path": stepsPath,
+        "orientation_path": orientationPath,
+        "rejected_rows": loaded["rejected_rows"],
+        "samples": sampleCount,
+        "duration_s": durationSeconds,
+        "profile": stages.report(),
+    }
+
+def main(argv: Optional[List[str]] = None):
+    orientation = importPartModule(POSE_ESTIMATION_PART, "modules.orientation")
+    poseFilter = importPartModule(POSE_ESTIMATION_PART, "modules.filter")
+    peaks = importPartModule(STEP_COUNTER_PART, "modules.peaks")
+    ap = argparse.ArgumentParser(description="Fused step counter and pose estimation over one merged IMU recording")
+    ap.add_argument("--file", required=True, help="Path to merged IMU CSV (e.g., Part3_PoseEstimation/data/mergedWalk.csv)")
+    ap.add_argument("--fs", type=float, default=None, help="Sampling rate in Hz. If omitted, it is taken from the timestamps")
+    ap.add_argument("--threshold", default="auto", help="Step threshold value, 'auto' or 'window:<seconds>'")
+    ap.add_argument("--k-auto", type=float, default=0.8, help="Multiplier for auto threshold (default=0.8)")
+    ap.add_argument("--min-gap-ms", type=int, default=350, help="Minimum gap between peaks in ms (default=350)")
+    ap.add_argument("--peak-mode", choices=peaks.PEAK_MODES, default="refractory", help="Close peaks: 'refractory' (first peak wins) or 'merge' (strongest peak wins)")
+    ap.add_argument("--time-mode", choices=poseFilter.TIME_MODES, default="auto", help="'fixed' (dt = 1/fs), 'timestamps' or 'auto' (timestamps when --fs is omitted)")
+    ap.add_argument("--gap-factor", type=float, default=5.0, help="A timestamp step longer than this many median steps is a dropped-packet gap (default=5)")
+    ap.add_argument("--gap-mode", choices=poseFilter.GAP_MODES, default="reset", help="Gap handling of the orientation filter: 'reset', 'hold' or 'nominal'")
+    ap.add_argument("--gyro-unit", default="rad", help="Gyro unit: 'rad' or 'deg' (default: rad)")
+    ap.add_argument("--alpha", type=float, default=0.98, help="Complementary filter alpha (default=0.98)")
+    ap.add_argument("--filter", choices=orientation.ORIENTATION_FILTERS, default="complementary", help="Orientation filter: 'complementary', 'madgwick' or 'mahony'")
+    ap.add_argument("--beta", type=float, default=0.1, help="Madgwick gain (default=0.1)")
+    ap.add_argument("--kp", type=float, default=1.0, help="Mahony proportional gain (default=1.0)")
+    ap.add_argument("--ki", type=float, default=0.0, help="Mahony integral gain (default=0.0)")
+    ap.add_argument("--yaw", action="store_true", help="Also annotate the steps with yaw (always on for the quaternion filters)")
+    ap.add_argument("--orientation", action="store_true", help="Also write the full orientation table (orientation_output), like Part 3")
+    ap.add_argument("--out", default="fused_outputs", help="Output folder (default: fused_outputs)")
+    ap.add_argument("--out-format", choices=OUTPUT_FORMATS, default="csv", help="Format of steps_pose and orientation_output: 'csv' (default), 'npz' or 'bin'")
+    ap.add_argument("--no-cache", action="store_true", help="Always parse the CSV instead of using its binary .imucache sidecar")
+    ap.add_argument("--profile", default=None, metavar="PATH", help="Write per-stage wall/CPU time, sample counts and allocation peaks to PATH")
+    ap.add_argument("--profile-format", choices=PROFILE_FORMATS, default="json", help="Profile file format: 'json' or 'chrome'")
+    ap.add_argument("--profile-no-memory", action="store_true", help="Skip allocation tracking (tracemalloc) while profiling")
+    args = ap.parse_args(argv)
+    profiler = StageProfiler(traceMemory=not args.profile_no_memory, label=args.file) if args.profile else None
+
+    result = runFused(args.file, sampleRate=args.fs, thresholdMode=args.threshold, sensitivityFactor=args.k_auto, minGapMiliseconds=args.min_gap_ms, peakMode=args.peak_mode,
+                      alpha=args.alpha, gyroUnit=args.gyro_unit, filterName=args.filter, beta=args.beta, kp=args.kp, ki=args.ki, includeYaw=True if args.yaw else None,
+                      timeMode=args.time_mode, gapFactor=args.gap_factor, gapMode=args.gap_mode, outputDir=args.out, outputFormat=args.out_format, orientationOutput=args.orientation,
+                      useCache=not args.no_cache, profiler=profiler)
+
+    print("\n********** Fused Steps + Pose Summary **********")
+    print(f"File              : {args.file}")
+    print(f"Sampling Rate (fs): {result['fs']:.3f} Hz ({result['time_mode']}, steps at {result['step_fs']} Hz)")
+    print(f"Steps Detected    : {result['steps']}")
+    print(f"Mean Cadence      : {result['cadence_spm']:.1f} steps/min" if result["cadence_spm"] is not None else "Mean Cadence      : -")
+    if result["steps"]:
+        print(f"Roll at steps     : mean {np.mean(result['step_roll_deg']):.2f} deg, range {np.min(result['step_roll_deg']):.2f} .. {np.max(result['step_roll_deg']):.2f}")
+        print(f"Pitch at steps    : mean {np.mean(result['step_pitch_deg']):.2f} deg, range {np.min(result['step_pitch_deg']):.2f} .. {np.max(result['step_pitch_deg']):.2f}")
+    print(f"Rejected rows     : {result['rejected_rows']}")
+    print(f"Steps + pose      : {result['steps_path']}")
+    if result["orientation_path"]:
+        print(f"Orientation       : {result['orientation_path']}")
+    print("================================================\n")
+    if args.profile:
+        profiler.close()
+        print(f" Saved profile: {writeProfile(args.profile, [profiler.report()], args.profile_format)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# activity.py: Windowed activity recognition (standing, sitting, walking, running) from the acceleration magnitude. Every window is described by
+# the statistics Part 1 prints per activity (mean, std, max, min, see inspect_data.compute_stats) and labelled by a Gaussian naive Bayes model
+# that is trained offline on the labelled Part 1 recordings (Part1_FeatureAnalysis/train_activity.py) and stored as JSON next to this file!
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+ACTIVITY_FEATURES = ("mean", "log_std", "max", "min")
+STATIONARY_ACTIVITIES = ("standing", "sitting")
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "activity_model.json")
+DEFAULT_WINDOW_SECONDS = 2.0
+MODEL_VERSION = 1
+
+# Windows are reduced in blocks of at most this many values (windows x window length), so millions of windows need bounded memory!
+WINDOW_BLOCK_VALUES = 1 << 22
+STD_FLOOR = 1e-6
+VARIANCE_FLOOR = 1e-4
+
+# Helper function that converts a window length in seconds to samples (at least 2)!
+def windowSamples(seconds: float, samplingFrequency: Optional[float]) -> int:
+    return max(2, int(round(seconds * (samplingFrequency if samplingFrequency and samplingFrequency > 0 else 50))))
+
+# 1) Statistics of every window of windowSize samples, windows start every step samples (default: no overlap), as a (windows x 4) array
+# of mean, std (population, like compute_stats), max and min:
+def windowStats(signal: Sequence[float], windowSize: int, step: Optional[int] = None) -> np.ndarray:
+    signal = np.asarray(signal, dtype=np.float64)
+    step = int(step) if step else int(windowSize)
+    if windowSize < 2 or step < 1:
+        raise ValueError(f"Window size must be >= 2 samples and step >= 1, got {windowSize} and {step}")
+    if signal.size < windowSize:
+        return np.empty((0, 4))
+    windows = sliding_window_view(signal, windowSize)[::step] # strided view, nothing is copied here
+    stats = np.empty((windows.shape[0], 4))
+    blockWindows = max(1, WINDOW_BLOCK_VALUES // windowSize)
+    for start in range(0, windows.shape[0], blockWindows):
+        block = windows[start:start + blockWindows]
+        stats[start:start + blockWindows, 0] = block.mean(axis=1)
+        stats[start:start + blockWindows, 1] = block.std(axis=1)
+        stats[start:start + blockWindows, 2] = block.max(axis=1)
+        stats[start:start + blockWindows, 3] = block.min(axis=1)
+    return stats
+
+# Helper function that turns window statistics into the model features (the std spans orders of magnitude, so its logarithm is used)!
+def activityFeatures(stats: np.ndarray) -> np.ndarray:
+    features = np.array(stats, dtype=np.float64, copy=True)
+    features[:, 1] = np.log(np.maximum(features[:, 1], STD_FLOOR))
+    return features
+
+# 2) Training: per-class feature means and variances from {activity: (windows x features)}, with uniform priors (the recordings have arbitrary lengths):
+def trainModel(featureSets: Dict[str, np.ndarray], windowSeconds: float = DEFAULT_WINDOW_SECONDS, stationary: Sequence[str] = STATIONARY_ACTIVITIES) -> Dict[str, object]:
+    classes = [label for label, features in featureSets.items() if len(features)]
+    if len(classes) < 2:
+        raise ValueError(f"Training needs windows of at least two activities, got {classes}")
+    means = np.array([featureSets[label].mean(axis=0) for label in classes])
+    variances = np.array([featureSets[label].var(axis=0) for label in classes]) + VARIANCE_FLOOR
+    return {
+        "version": MODEL_VERSION,
+        "kind": "gaussian_naive_bayes",
+        "features": list(ACTIVITY_FEATURES),
+        "classes": classes,
+        "stationary": [label for label in classes if label in stationary],
+        "window_s": windowSeconds,
+        "means": means.tolist(),
+        "variances": variances.tolist(),
+        "log_priors": np.full(len(classes), -np.log(len(classes))).tolist(),
+        "windows": {label: int(len(featureSets[label])) for label in classes},
+    }
+
+# 3) Classification of a (windows x features) array, returns the class index of every window. The Gaussian log-likelihoods of all windows
+# and classes come from two matrix products (sum((x - mu)² / var) = x² . 1/var - 2 x . mu/var + sum(mu² / var)):
+def classifyWindows(model: Dict[str, object], features: np.ndarray) -> np.ndarray:
+    if len(features) == 0:
+        return np.empty(0, dtype=np.int64)
+    means, variances = np.asarray(model["means"]), np.asarray(model["variances"])
+    inverse = 1.0 / variances
+    constant = np.asarray(model["log_priors"]) - 0.5 * (np.log(2.0 * np.pi * variances).sum(axis=1) + (means * means * inverse).sum(axis=1))
+    logLikelihood = -0.5 * ((features * features) @ inverse.T) + features @ (means * inverse).T + constant
+    return np.argmax(logLikelihood, axis=1)
+
+# Helper function that merges consecutive windows with the same label into (start sample, stop sample, label index) segments!
+def labelSegments(labels: np.ndarray, windowSize: int, sampleCount: int) -> List[Tuple[int, int, int]]:
+    if len(labels) == 0:
+        return []
+    changes = np.flatnonzero(np.diff(labels)) + 1
+    starts = np.concatenate(([0], changes)) * windowSize
+    stops = np.append(starts[1:], sampleCount) # the samples after the last full window belong to its segment
+    return [(int(start), int(stop), int(labels[start // windowSize])) for start, stop in zip(starts, stops)]
+
+# 4) Main function: segmenting a recording's magnitude into labelled windows of the model's length, with the moving segments (not standing
+# or sitting, consecutive moving activities merged) that step detection has to search!
+def classifyRecording(magnitude: Sequence[float], samplingFrequency: Optional[float], model: Dict[str, object]) -> Dict[str, object]:
+    magnitude = np.asarray(magnitude, dtype=np.float64)
+    windowSize = windowSamples(model["window_s"], samplingFrequency)
+    labels = classifyWindows(model, activityFeatures(windowStats(magnitude, windowSize)))
+    segments = labelSegments(labels, windowSize, magnitude.size)
+    stationary = [model["classes"].index(label) for label in model["stationary"]]
+    if len(labels) == 0: # shorter than one window: nothing to classify, the whole recording is searched
+        moving = [(0, int(magnitude.size))] if magnitude.size else []
+    else:
+        moving = []
+        for start, stop, label in segments:
+            if label in stationary:
+                continue
+            if moving and moving[-1][1] == start: # adjacent moving segments (walking then running) are one search, so the peak gap holds across them
+                moving[-1] = (moving[-1][0], stop)
+            else:
+                moving.append((start, stop))
+    return {
+        "classes": list(model["classes"]),
+        "window_size": windowSize,
+        "labels": labels,
+        "segments": [(start, stop, model["classes"][label]) for start, stop, label in segments],
+        "stationary": list(model["stationary"]),
+        "moving_segments": moving,
+        "stationary_samples": int(magnitude.size - sum(stop - start for start, stop in moving)),
+    }
+
+# 5) Offline evaluation on labelled windows: accuracy and the confusion matrix (rows: true activity, columns: predicted)!
+def evaluateModel(model: Dict[str, object], featureSets: Dict[str, np.ndarray]) -> Dict[str, object]:
+    classes = list(model["classes"])
+    confusion = np.zeros((len(classes), len(classes)), dtype=np.int64)
+    for label, features in featureSets.items():
+        if label not in classes:
+            raise ValueError(f"Activity '{label}' is not one of the model's classes {classes}")
+        confusion[classes.index(label)] += np.bincount(classifyWindows(model, features), minlength=len(classes))
+    total = int(confusion.sum())
+    return {
+        "classes": classes,
+        "confusion": confusion.tolist(),
+        "windows": total,
+        "accuracy": float(np.trace(confusion) / total) if total else None,
+    }
+
+def saveModel(model: Dict[str, object], path: str = DEFAULT_MODEL_PATH) -> str:
+    with open(path, "w") as file:
+        json.dump(model, file, indent=2)
+        file.write("\n")
+    return path
+
+def loadModel(path: Optional[str] = None) -> Dict[str, object]:
+    with open(path or DEFAULT_MODEL_PATH) as file:
+        model = json.load(file)
+    if model.get("version") != MODEL_VERSION or list(model.get("features", ())) != list(ACTIVITY_FEATURES):
+        raise ValueError(f"{path or DEFAULT_MODEL_PATH} is not an activity model of version {MODEL_VERSION}")
+    return model
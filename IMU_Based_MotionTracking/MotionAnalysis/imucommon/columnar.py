@@ -0,0 +1,225 @@
+# columnar.py: Shared loader that parses whole Phyphox-style IMU CSV files (quoted headers, E-notation floats) into contiguous float64 columns.
+import csv
+import io
+import itertools
+import multiprocessing
+import os
+import re
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Files are parsed in line-aligned blocks of this size, large files are split across processes!
+BLOCK_BYTES = 8 * 1024 * 1024
+PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+
+# Helper function that finds the 'x', 'y', and 'z' columns in the (normalized) header row:
+def findAxisColumns(normalizedHeaders):
+    xColumnIndex = next((i for i,h in enumerate(normalizedHeaders) if 'x' in h), None)
+    yColumnIndex = next((i for i,h in enumerate(normalizedHeaders) if 'y' in h), None)
+    zColumnIndex = next((i for i,h in enumerate(normalizedHeaders) if 'z' in h), None)
+    if None in (xColumnIndex, yColumnIndex, zColumnIndex):
+        raise ValueError(f"Cannot find X/Y/Z columns. Found: {normalizedHeaders}")
+    return xColumnIndex, yColumnIndex, zColumnIndex
+
+# Helper function that splits a header like 'Acceleration x (m/s^2)' into its name and unit!
+def splitHeaderUnit(header: str) -> Tuple[str, str]:
+    match = re.match(r"^(.*?)\s*\(([^()]*)\)\s*$", header)
+    if match:
+        return match.group(1).strip(), match.group(2).strip()
+    return header.strip(), ""
+
+# Helper function that computes the vector magnitude '√(x² + y² + z²)' of three columns in one pass:
+def vectorMagnitude(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+    return np.sqrt(x * x + y * y + z * z)
+
+# Blocks with bad rows are bisected at most this deep, the failing parts are then parsed line by line in Python (a block with many scattered
+# bad rows costs a few numpy parses of it instead of one per bad row)!
+BISECT_MAX_DEPTH = 8
+
+# 1) Parsing a list of data lines, rows that cannot be converted are found by bisection and rejected. With a 'partial' list, they are kept
+# instead (NaN in the cells that do not convert) and listed in it as (row of the returned block, field count, columns that do not convert):
+def parseLines(lines: List[str], columnCount: int, usecols: Optional[Sequence[int]], depth: int = 0, partial: Optional[list] = None) -> Tuple[np.ndarray, int]:
+    width = len(usecols) if usecols is not None else columnCount
+    if not lines:
+        return np.empty((0, width), dtype=np.float64), 0
+    try:
+        return loadBlock(lines, width, usecols), 0
+    except (ValueError, IndexError):
+        if len(lines) == 1 and partial is None:
+            return np.empty((0, width), dtype=np.float64), (0 if not lines[0].strip() else 1)
+        if depth >= BISECT_MAX_DEPTH or len(lines) == 1:
+            return parseLinesSlow(lines, columnCount, usecols, partial)
+        middle = len(lines) // 2
+        secondPartial = [] if partial is not None else None
+        firstBlock, firstRejected = parseLines(lines[:middle], columnCount, usecols, depth + 1, partial)
+        secondBlock, secondRejected = parseLines(lines[middle:], columnCount, usecols, depth + 1, secondPartial)
+        if partial is not None:
+            partial.extend((row + len(firstBlock), fields, invalid) for row, fields, invalid in secondPartial)
+        return np.concatenate((firstBlock, secondBlock)), firstRejected + secondRejected
+
+# Helper function that converts one field like numpy does (it may be wrapped in double quotes), None when it does not convert!
+def parseField(field: str) -> Optional[float]:
+    if len(field) > 1 and field[0] == '"' and field[-1] == '"':
+        field = field[1:-1]
+    if "_" in field: # float() accepts digit separators, numpy does not
+        return None
+    try:
+        return float(field)
+    except ValueError:
+        return None
+
+# Helper function that parses the lines one by one with the same rules as loadBlock: '#' starts a comment, blank lines are skipped, a row
+# needs all columns (or the used ones) and every used field must convert to a float. With 'partial', every column is converted and bad rows
+# are kept as in parseLines!
+def parseLinesSlow(lines: List[str], columnCount: int, usecols: Optional[Sequence[int]], partial: Optional[list] = None) -> Tuple[np.ndarray, int]:
+    picks = list(usecols) if usecols is not None else list(range(columnCount))
+    rows, rejectedRows = [], 0
+    for line in lines:
+        text = line.split("#", 1)[0]
+        if not text.strip():
+            continue
+        fields = text.rstrip("\r\n").split(",")
+        if partial is not None:
+            values = [parseField(fields[c]) if c < len(fields) else None for c in picks]
+            invalid = [c for c, value in zip(picks, values) if value is None]
+            if invalid or len(fields) != columnCount:
+                partial.append((len(rows), len(fields), invalid))
+            rows.append([np.nan if value is None else value for value in values])
+            continue
+        if (len(fields) != columnCount) if usecols is None else (len(fields) <= max(picks, default=-1)):
+            rejectedRows += 1
+            continue
+        values = [parseField(fields[c]) for c in picks]
+        if None in values:
+            rejectedRows += 1
+            continue
+        rows.append(values)
+    return np.array(rows, dtype=np.float64).reshape(-1, len(picks)), rejectedRows
+
+# 1.1) Parsing a raw block of bytes in one call, it only falls back to the line by line bisection when the block has bad rows:
+def parseBytes(data: bytes, columnCount: int, usecols: Optional[Sequence[int]], partial: Optional[list] = None) -> Tuple[np.ndarray, int]:
+    width = len(usecols) if usecols is not None else columnCount
+    try:
+        return loadBlock(io.BytesIO(data), width, usecols), 0
+    except (ValueError, IndexError):
+        return parseLines(data.decode("utf-8", errors="replace").splitlines(), columnCount, usecols, partial=partial)
+
+# Helper function that runs numpy's C parser on the block and checks the column count!
+def loadBlock(source, width: int, usecols: Optional[Sequence[int]]) -> np.ndarray:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning) # blocks made only of empty lines are fine
+        block = np.loadtxt(source, delimiter=",", quotechar='"', usecols=usecols, dtype=np.float64, ndmin=2, encoding="utf-8")
+    if block.size and block.shape[1] != width:
+        raise ValueError(f"expected {width} columns, found {block.shape[1]}")
+    return block.reshape(-1, width)
+
+# 2) Parsing the byte range [start, end) of a file, the range must begin and end on line boundaries. Returns the rows, the rejected row count
+# and, with keepPartial, the kept bad rows (see parseLines) instead of rejecting them:
+def parseByteRange(csvPath: str, start: int, end: int, columnCount: int, usecols: Optional[Sequence[int]], keepPartial: bool = False) -> Tuple[np.ndarray, int, list]:
+    blocks, rejectedRows, partialRows, rowCount = [], 0, [], 0
+    with open(csvPath, "rb") as file:
+        file.seek(start)
+        position = start
+        while position < end:
+            data = file.read(min(BLOCK_BYTES, end - position))
+            position += len(data)
+
+            # 2.1) Completing the last line of the block!
+            if position < end and not data.endswith(b"\n"):
+                rest = file.readline()
+                position += len(rest)
+                data += rest
+            partial = [] if keepPartial else None
+            block, rejected = parseBytes(data, columnCount, usecols, partial)
+            partialRows.extend((rowCount + row, fields, invalid) for row, fields, invalid in partial or ())
+            blocks.append(block)
+            rejectedRows += rejected
+            rowCount += len(block)
+    width = len(usecols) if usecols is not None else columnCount
+    if not blocks:
+        return np.empty((0, width), dtype=np.float64), 0, []
+    return np.concatenate(blocks), rejectedRows, partialRows
+
+# Helper function that splits the data part of a file into line-aligned byte ranges, one per worker!
+def splitByteRanges(csvPath: str, dataStart: int, fileSize: int, parts: int) -> List[Tuple[int, int]]:
+    boundaries = [dataStart]
+    with open(csvPath, "rb") as file:
+        for k in range(1, parts):
+            file.seek(dataStart + (fileSize - dataStart) * k // parts)
+            file.readline()
+            boundaries.append(max(file.tell(), boundaries[-1]))
+    boundaries.append(fileSize)
+    return [(a, b) for a, b in zip(boundaries[:-1], boundaries[1:]) if b > a]
+
+# Helper function that reads the (quoted) header row, returns the headers and the byte offset where data starts!
+def readCsvHeader(csvPath: str) -> Tuple[List[str], int]:
+    with open(csvPath, "rb") as file:
+        headerLine = file.readline()
+        dataStart = file.tell()
+    rawHeaders = next(csv.reader([headerLine.decode("utf-8-sig")]), [])
+    return [h.strip() for h in rawHeaders], dataStart
+
+# Helper function that checks the requested columns exist, so a wrong file fails fast instead of rejecting every row!
+def checkColumns(csvPath: str, columnCount: int, usecols: Optional[Sequence[int]]) -> Optional[List[int]]:
+    if usecols is None:
+        return None
+    usecols = [int(c) for c in usecols]
+    if any(c < 0 or c >= columnCount for c in usecols):
+        raise ValueError(f"{csvPath} has {columnCount} columns, cannot read columns {usecols}")
+    return usecols
+
+# 3) Main function: reads the header and all data rows into columns! With keepPartial, rows that do not convert in every column are kept
+# (NaN cells) and listed in 'partial_rows' as (row, field count, bad columns), so the sidecar cache can serve any column selection
+def readCsvColumns(csvPath: str, usecols: Optional[Sequence[int]] = None, workers: Optional[int] = None, keepPartial: bool = False) -> Dict[str, object]:
+
+    # 3.1) Reading the (quoted) header row and the offset where data starts
+    headers, dataStart = readCsvHeader(csvPath)
+    names, units = zip(*[splitHeaderUnit(h) for h in headers]) if headers else ((), ())
+    columnCount = len(headers)
+    usecols = checkColumns(csvPath, columnCount, usecols)
+
+    # 3.2) Parsing the data, in parallel byte ranges for large files. Inside a worker process (batch.py, sweep.py, ...) the pool around it
+    # already uses the cores, so the default is one process there instead of cpu_count() more per worker
+    fileSize = os.path.getsize(csvPath)
+    if workers is None:
+        workers = (os.cpu_count() or 1) if fileSize >= PARALLEL_MIN_BYTES and multiprocessing.parent_process() is None else 1
+    ranges = splitByteRanges(csvPath, dataStart, fileSize, max(1, workers))
+    if len(ranges) > 1:
+        with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+            parts = list(pool.map(parseByteRange, [csvPath] * len(ranges), [a for a, _ in ranges], [b for _, b in ranges], [columnCount] * len(ranges), [usecols] * len(ranges), [keepPartial] * len(ranges)))
+    else:
+        parts = [parseByteRange(csvPath, dataStart, fileSize, columnCount, usecols, keepPartial)]
+
+    # 3.3) Storing every column as its own contiguous array
+    width = len(usecols) if usecols is not None else columnCount
+    table = np.concatenate([block for block, _, _ in parts]) if parts else np.empty((0, width))
+    selected = usecols if usecols is not None else list(range(columnCount))
+    offsets = np.cumsum([0] + [len(block) for block, _, _ in parts])
+    result = {
+        "headers": [headers[i] for i in selected],
+        "names": [names[i] for i in selected],
+        "units": [units[i] for i in selected],
+        "columns": np.ascontiguousarray(table.T),
+        "rows": int(table.shape[0]),
+        "rejected_rows": int(sum(rejected for _, rejected, _ in parts)),
+        "source": csvPath,
+    }
+    if keepPartial:
+        result["partial_rows"] = [(int(offset + row), fields, invalid) for offset, (_, _, partial) in zip(offsets, parts) for row, fields, invalid in partial]
+    return result
+
+
+# 4) Reading a file in blocks of at most rowsPerBlock lines, yielding (rows x columns block, rejected rows) so memory stays bounded!
+def iterCsvBlocks(csvPath: str, usecols: Optional[Sequence[int]] = None, rowsPerBlock: int = 65536) -> Iterator[Tuple[np.ndarray, int]]:
+    headers, _ = readCsvHeader(csvPath)
+    usecols = checkColumns(csvPath, len(headers), usecols)
+    with open(csvPath, "r", encoding="utf-8", errors="replace", newline="") as file:
+        file.readline()
+        while True:
+            lines = list(itertools.islice(file, max(1, rowsPerBlock)))
+            if not lines:
+                break
+            yield parseLines(lines, len(headers), usecols)
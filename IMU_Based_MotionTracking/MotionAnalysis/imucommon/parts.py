@@ -0,0 +1,46 @@
+# parts.py: Imports modules from the Part folders by name. Part2 and Part3 both call their package 'modules',
+# so every part gets its own private copy of that package and the two never clash inside one process.
+import importlib
+import os
+import sys
+from types import ModuleType
+from typing import Dict
+
+MOTION_ANALYSIS_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FEATURE_ANALYSIS_PART = "Part1_FeatureAnalysis"
+STEP_COUNTER_PART = "Part2_StepCounter"
+POSE_ESTIMATION_PART = "Part3_PoseEstimation"
+
+# Modules already imported for each part, keyed by their dotted name!
+loadedParts: Dict[str, Dict[str, ModuleType]] = {}
+
+# Helper function that returns the entries of sys.modules belonging to a top-level package!
+def packageEntries(packageName: str) -> Dict[str, ModuleType]:
+    return {name: module for name, module in sys.modules.items() if name == packageName or name.startswith(packageName + ".")}
+
+# Main function: imports 'moduleName' (e.g. 'modules.stepcounter') as seen from inside the part folder!
+def importPartModule(partName: str, moduleName: str) -> ModuleType:
+    partModules = loadedParts.setdefault(partName, {})
+    if moduleName in partModules:
+        return partModules[moduleName]
+
+    # 1) Hiding the currently imported package of the same name and showing this part's own modules instead
+    packageName = moduleName.split(".")[0]
+    hidden = packageEntries(packageName)
+    for name in hidden:
+        del sys.modules[name]
+    sys.modules.update({name: module for name, module in partModules.items() if name == packageName or name.startswith(packageName + ".")})
+    partDir = os.path.join(MOTION_ANALYSIS_ROOT, partName)
+    sys.path.insert(0, partDir)
+
+    # 2) Importing, then keeping everything the import pulled in for the next calls and restoring the previous state
+    try:
+        module = importlib.import_module(moduleName)
+    finally:
+        sys.path.remove(partDir)
+        imported = packageEntries(packageName)
+        partModules.update(imported)
+        for name in imported:
+            del sys.modules[name]
+        sys.modules.update(hidden)
+    return module
@@ -0,0 +1,82 @@
+# plotting.py: Shared headless rendering layer. matplotlib is only imported on the first plot (with the non-interactive Agg backend),
+# so scripts and libraries that do not plot never pay for it, and long signals are reduced to a min/max envelope per pixel column before drawing!
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+_pyplot = None
+
+# Helper function that imports matplotlib.pyplot on first use, selecting the Agg backend unless pyplot is already loaded by someone else!
+def getPyplot():
+    global _pyplot
+    if _pyplot is None:
+        import sys
+        import matplotlib
+        if "matplotlib.pyplot" not in sys.modules:
+            matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        _pyplot = plt
+    return _pyplot
+
+# Helper function that keeps, for every one of 'columns' equal index buckets, the minimum and the maximum sample (in their original order).
+# Drawn as a line this is the same envelope as the full signal at that width, with at most 2 points per pixel column!
+def decimateMinMax(y, x=None, columns: int = 1600) -> Tuple[np.ndarray, np.ndarray]:
+    y = np.asarray(y, dtype=np.float64)
+    x = np.arange(y.size, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)[:y.size]
+    if columns <= 0 or y.size <= 2 * columns:
+        return x, y
+
+    # 1) Equal buckets over the first bucketLength*columns samples, the remainder becomes one extra bucket
+    bucketLength = y.size // columns
+    body = y[:bucketLength * columns].reshape(columns, bucketLength)
+    offsets = np.arange(columns) * bucketLength
+    lows = offsets + np.argmin(body, axis=1)
+    highs = offsets + np.argmax(body, axis=1)
+    if bucketLength * columns < y.size:
+        tail = y[bucketLength * columns:]
+        lows = np.append(lows, bucketLength * columns + np.argmin(tail))
+        highs = np.append(highs, bucketLength * columns + np.argmax(tail))
+
+    # 2) Interleaving min and max of every bucket in time order, so the line path runs through both
+    indices = np.empty(2 * lows.size, dtype=np.intp)
+    indices[0::2] = np.minimum(lows, highs)
+    indices[1::2] = np.maximum(lows, highs)
+    return x[indices], y[indices]
+
+# Main function: renders one line chart into a PNG file and returns its path.
+# lines: [{"y": ..., "x": optional, "label": ..., plus plot() style keywords}], points: [{"x": ..., "y": ..., scatter() keywords}],
+# hlines: [{"y": value, axhline() keywords}]. Lines are decimated to the pixel width of the figure unless decimate=False!
+def renderLinePlot(path: str, lines: Sequence[Dict[str, object]], title: str = "", xlabel: str = "", ylabel: str = "",
+                   figsize: Tuple[float, float] = (10, 4), dpi: Optional[int] = None, points: Sequence[Dict[str, object]] = (),
+                   hlines: Sequence[Dict[str, object]] = (), legend: bool = True, grid: bool = False, tightLayout: bool = False,
+                   decimate: bool = True) -> str:
+    plt = getPyplot()
+    figure = plt.figure(figsize=figsize)
+    try:
+        axes = figure.add_subplot(1, 1, 1)
+        columns = int(figsize[0] * (dpi or figure.dpi)) if decimate else 0
+
+        # 1) Lines (min/max decimated), then horizontal lines and scatter points
+        for line in lines:
+            style = {key: value for key, value in line.items() if key not in ("x", "y")}
+            x, y = decimateMinMax(line["y"], line.get("x"), columns)
+            axes.plot(x, y, **style)
+        for hline in hlines:
+            axes.axhline(hline["y"], **{key: value for key, value in hline.items() if key != "y"})
+        for group in points:
+            axes.scatter(group["x"], group["y"], **{key: value for key, value in group.items() if key not in ("x", "y")})
+
+        # 2) Labels and saving!
+        axes.set_title(title)
+        axes.set_xlabel(xlabel)
+        axes.set_ylabel(ylabel)
+        if legend:
+            axes.legend()
+        if grid:
+            axes.grid(True)
+        if tightLayout:
+            figure.tight_layout()
+        figure.savefig(path, dpi=dpi if dpi is not None else "figure")
+    finally:
+        plt.close(figure)
+    return path
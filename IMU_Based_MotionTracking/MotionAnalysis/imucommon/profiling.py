@@ -0,0 +1,144 @@
+# profiling.py: Stage-level instrumentation for the pipelines: wall time, CPU time, sample count and allocation peak of every stage.
+# A disabled profiler hands out one shared no-op stage, so the instrumented code costs a method call per stage when profiling is off!
+import json
+import os
+import time
+import tracemalloc
+from typing import Dict, Iterable, List, Optional
+
+PROFILE_FORMATS = ("json", "chrome")
+
+# One timed stage, used as a context manager. Set .samples inside the block to record how many samples the stage handled!
+class Stage:
+    __slots__ = ("profiler", "name", "samples", "start", "cpuStart", "memoryStart", "childPeak")
+
+    def __init__(self, profiler: "StageProfiler", name: str, samples: Optional[int]):
+        self.profiler = profiler
+        self.name = name
+        self.samples = samples
+        self.childPeak = 0
+
+    def __enter__(self):
+        self.profiler.active.append(self)
+        if self.profiler.traceMemory:
+            self.memoryStart = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.cpuStart = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        end = time.perf_counter()
+        cpuEnd = time.process_time()
+        profiler = self.profiler
+        profiler.active.pop()
+        allocationPeak = None
+        if profiler.traceMemory:
+            # Nested stages reset the tracemalloc peak, so the highest peak seen by the inner stages is carried up to the outer one
+            peak = max(tracemalloc.get_traced_memory()[1], self.childPeak)
+            allocationPeak = max(0, peak - self.memoryStart)
+            if profiler.active:
+                profiler.active[-1].childPeak = max(profiler.active[-1].childPeak, peak)
+        profiler.stages.append({
+            "name": self.name,
+            "depth": len(profiler.active),
+            "start_s": self.start - profiler.origin,
+            "wall_s": end - self.start,
+            "cpu_s": cpuEnd - self.cpuStart,
+            "samples": self.samples,
+            "alloc_peak_bytes": allocationPeak,
+            "error": excType.__name__ if excType is not None else None,
+        })
+        return False
+
+# Shared stage of disabled profilers: entering, leaving and setting .samples do nothing!
+class NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+NULL_STAGE = NullStage()
+
+class StageProfiler:
+    def __init__(self, enabled: bool = True, traceMemory: bool = True, label: Optional[str] = None):
+        self.enabled = enabled
+        self.label = label
+        self.stages: List[Dict[str, object]] = []
+        self.active: List[Stage] = []
+        self.origin = time.perf_counter()
+        self.wallClockOrigin = time.time()
+
+        # tracemalloc is started here when nobody traces yet, and stopped again by close()
+        self.traceMemory = enabled and traceMemory
+        self.ownsTracing = self.traceMemory and not tracemalloc.is_tracing()
+        if self.ownsTracing:
+            tracemalloc.start()
+
+    def stage(self, name: str, samples: Optional[int] = None):
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name, samples)
+
+    def close(self):
+        if self.ownsTracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.ownsTracing = False
+        self.traceMemory = False
+
+    # Snapshot of the stages recorded so far, in the order they finished!
+    def report(self) -> Optional[Dict[str, object]]:
+        if not self.enabled:
+            return None
+        return {
+            "label": self.label,
+            "pid": os.getpid(),
+            "started_at": self.wallClockOrigin,
+            "total_wall_s": sum(stage["wall_s"] for stage in self.stages if stage["depth"] == 0),
+            "total_cpu_s": sum(stage["cpu_s"] for stage in self.stages if stage["depth"] == 0),
+            "stages": list(self.stages),
+        }
+
+# Profiler used when the caller passes none: disabled, no tracemalloc!
+NULL_PROFILER = StageProfiler(enabled=False)
+
+def profilerOrNull(profiler: Optional[StageProfiler]) -> StageProfiler:
+    return NULL_PROFILER if profiler is None else profiler
+
+# Converting reports to the Chrome trace event format (chrome://tracing, Perfetto): one complete event per stage,
+# one row (tid) per report so many files of a batch line up under each other!
+def chromeTrace(reports: Iterable[Dict[str, object]]) -> Dict[str, object]:
+    events = []
+    for index, report in enumerate(reports):
+        if not report:
+            continue
+        events.append({"name": "thread_name", "ph": "M", "pid": report["pid"], "tid": index, "args": {"name": report.get("label") or f"run {index}"}})
+        for stage in report["stages"]:
+            events.append({
+                "name": stage["name"],
+                "ph": "X",
+                "pid": report["pid"],
+                "tid": index,
+                "ts": (report["started_at"] + stage["start_s"]) * 1e6,
+                "dur": stage["wall_s"] * 1e6,
+                "args": {key: stage[key] for key in ("cpu_s", "samples", "alloc_peak_bytes", "error") if stage[key] is not None},
+            })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+# Writing one or more reports as plain JSON ({"runs": [...]}) or as a Chrome trace!
+def writeProfile(path: str, reports: List[Dict[str, object]], fmt: str = "json") -> str:
+    if fmt not in PROFILE_FORMATS:
+        raise ValueError(f"Unknown profile format '{fmt}', expected one of {PROFILE_FORMATS}")
+    payload = chromeTrace(reports) if fmt == "chrome" else {"runs": [report for report in reports if report]}
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(payload, file, indent=1)
+    return path
@@ -0,0 +1,203 @@
+# reccache.py: Binary sidecar cache for parsed recordings, so repeated runs memory-map the columns instead of parsing the CSV again.
+#
+# File layout of '<recording>.csv.imucache':
+#   8 bytes  magic 'IMUCACHE'
+#   4 bytes  header length (little-endian uint32)
+#   JSON header: channel headers/names/units, dtype, shape and the source file's size, mtime and SHA-1
+#   padding up to DATA_ALIGNMENT, then the raw column arrays one after another (columns x rows)
+import hashlib
+import json
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Local Imports:
+from imucommon.columnar import checkColumns, iterCsvBlocks, readCsvColumns, readCsvHeader
+from imucommon.recstore import isStoreUri, iterStoreBlocks, loadStoreColumns, storeHeaders
+
+CACHE_MAGIC = b"IMUCACHE"
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".imucache"
+DATA_ALIGNMENT = 64
+
+# Helper function that returns the sidecar path of a recording!
+def cachePath(csvPath: str) -> str:
+    return csvPath + CACHE_SUFFIX
+
+# Helper function that hashes the source file in 1 MB blocks!
+def fileHash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Helper function that describes the source file, the cache is only valid while this matches!
+def sourceInfo(csvPath: str, withHash: bool = True) -> Dict[str, object]:
+    stat = os.stat(csvPath)
+    info: Dict[str, object] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if withHash:
+        info["sha1"] = fileHash(csvPath)
+    return info
+
+# Helper function that packs the magic, header length and JSON header, padded so that data starts aligned!
+def packHeader(header: Dict[str, object], magic: bytes = CACHE_MAGIC) -> bytes:
+    headerBytes = json.dumps(header).encode("utf-8")
+    prefixLength = len(magic) + 4 + len(headerBytes)
+    padding = (-prefixLength) % DATA_ALIGNMENT
+    return magic + struct.pack("<I", len(headerBytes) + padding) + headerBytes + b" " * padding
+
+# Helper function that reads the header back, returns None if the file does not start with magic!
+def readHeader(path: str, magic: bytes = CACHE_MAGIC) -> Optional[Dict[str, object]]:
+    try:
+        with open(path, "rb") as file:
+            if file.read(len(magic)) != magic:
+                return None
+            (headerLength,) = struct.unpack("<I", file.read(4))
+            header = json.loads(file.read(headerLength).decode("utf-8"))
+            header["data_offset"] = len(magic) + 4 + headerLength
+            return header
+    except (OSError, ValueError, struct.error):
+        return None
+
+# 1) Writing a parsed table to a cache file (through a temporary file, so readers never see half a cache):
+def writeCache(path: str, table: Dict[str, object], source: Dict[str, object]) -> None:
+    columns = np.ascontiguousarray(table["columns"], dtype=np.float64)
+    header = {
+        "version": CACHE_VERSION,
+        "headers": list(table["headers"]),
+        "names": list(table["names"]),
+        "units": list(table["units"]),
+        "dtype": columns.dtype.str,
+        "shape": list(columns.shape),
+        "rejected_rows": table["rejected_rows"],
+        "partial_rows": table["partial_rows"],
+        "source": source,
+    }
+    temporaryPath = f"{path}.{os.getpid()}.tmp"
+    with open(temporaryPath, "wb") as file:
+        file.write(packHeader(header))
+        file.write(columns.tobytes())
+    os.replace(temporaryPath, path)
+
+# 2) Checking whether a cache still belongs to the CSV, a changed mtime alone is settled by comparing hashes:
+def validCacheHeader(csvPath: str, path: str) -> Optional[Dict[str, object]]:
+    header = readHeader(path)
+    if header is None or header.get("version") != CACHE_VERSION:
+        return None
+    cached, current = header["source"], sourceInfo(csvPath, withHash=False)
+    if cached["size"] != current["size"]:
+        return None
+    if cached["mtime_ns"] != current["mtime_ns"]:
+        if cached.get("sha1") != fileHash(csvPath):
+            return None
+
+        # 2.1) Same content with a new mtime (copied or checked out again), refreshing the stored mtime in place!
+        cached["mtime_ns"] = current["mtime_ns"]
+        refreshed = packHeader({k: v for k, v in header.items() if k != "data_offset"})
+        if len(refreshed) == header["data_offset"]:
+            try:
+                with open(path, "r+b") as file:
+                    file.write(refreshed)
+            except OSError:
+                pass
+    return header
+
+# 3) Mapping the cached columns read-only, without copying them into memory:
+def mapCache(path: str, header: Dict[str, object]) -> Dict[str, object]:
+    columnCount, rowCount = header["shape"]
+    if rowCount == 0:
+        columns = np.empty((columnCount, 0), dtype=np.dtype(header["dtype"]))
+    else:
+        columns = np.memmap(path, dtype=np.dtype(header["dtype"]), mode="r", offset=header["data_offset"], shape=(columnCount, rowCount))
+    return {
+        "headers": header["headers"],
+        "names": header["names"],
+        "units": header["units"],
+        "columns": columns,
+        "rows": rowCount,
+        "rejected_rows": header["rejected_rows"],
+        "partial_rows": header["partial_rows"],
+    }
+
+# Helper function that returns the cached rows a column selection rejects, like parsing the CSV with those usecols would: too few fields (all
+# of them without usecols) or a used column that does not convert!
+def rejectedRows(partialRows: List[list], columnCount: int, usecols: Optional[Sequence[int]]) -> np.ndarray:
+    used = set(range(columnCount) if usecols is None else usecols)
+    return np.array([row for row, fields, invalid in partialRows
+                     if ((fields != columnCount) if usecols is None else (fields <= max(used, default=-1))) or used.intersection(invalid)], dtype=np.int64)
+
+# Helper function that returns the header row of a CSV or of a 'store://' source (imucommon/recstore.py)!
+def sourceHeaders(csvPath: str) -> List[str]:
+    return storeHeaders(csvPath) if isStoreUri(csvPath) else readCsvHeader(csvPath)[0]
+
+# 4) Main function: same result as readCsvColumns, but served from (and stored to) the sidecar cache! A 'store://device/session?start=&end='
+# source is read from the recording store instead, only the chunks of that time range
+def loadColumns(csvPath: str, usecols: Optional[Sequence[int]] = None, useCache: bool = True) -> Dict[str, object]:
+    if isStoreUri(csvPath):
+        return loadStoreColumns(csvPath, usecols=usecols)
+    if not useCache:
+        return readCsvColumns(csvPath, usecols=usecols)
+
+    # 4.1) Using the existing cache, or parsing every column once and caching them
+    path = cachePath(csvPath)
+    header = validCacheHeader(csvPath, path) if os.path.exists(path) else None
+    if header is not None:
+        table = mapCache(path, header)
+    else:
+        source = sourceInfo(csvPath)
+        table = readCsvColumns(csvPath, keepPartial=True)
+        try:
+            writeCache(path, table, source)
+        except OSError:
+            pass # read-only data folders simply run without a cache
+
+    # 4.2) Selecting the requested columns, these are views into the mapped file (copies when rows of the cache are rejected for them)
+    table["source"] = csvPath
+    usecols = checkColumns(csvPath, len(table["headers"]), usecols)
+    rejected = rejectedRows(table.pop("partial_rows"), len(table["headers"]), usecols)
+    if usecols is not None:
+        for key in ("headers", "names", "units"):
+            table[key] = [table[key][i] for i in usecols]
+        if usecols and usecols == list(range(usecols[0], usecols[0] + len(usecols))):
+            table["columns"] = table["columns"][usecols[0]:usecols[0] + len(usecols)]
+        else:
+            table["columns"] = table["columns"][usecols] # non-adjacent columns are copied
+    if rejected.size:
+        table["columns"] = np.delete(table["columns"], rejected, axis=1)
+    table["rows"] = int(table["columns"].shape[1])
+    table["rejected_rows"] += int(rejected.size)
+    return table
+
+# 5) Reading the requested columns in blocks of at most rowsPerBlock rows, yielding (columns x rows block, rejected rows), so memory stays bounded.
+# A valid cache is read with plain file reads (a memory map would keep every touched page resident), otherwise the CSV is parsed block by block
+# and no cache is written (building one needs the whole table)!
+def iterColumnBlocks(csvPath: str, usecols: Sequence[int], rowsPerBlock: int = 65536, useCache: bool = True) -> Iterator[Tuple[np.ndarray, int]]:
+    rowsPerBlock = max(1, int(rowsPerBlock))
+    if isStoreUri(csvPath):
+        yield from iterStoreBlocks(csvPath, usecols, rowsPerBlock=rowsPerBlock)
+        return
+    path = cachePath(csvPath)
+    header = validCacheHeader(csvPath, path) if (useCache and os.path.exists(path)) else None
+    if header is None:
+        for block, rejected in iterCsvBlocks(csvPath, usecols=usecols, rowsPerBlock=rowsPerBlock):
+            yield np.ascontiguousarray(block.T), rejected
+        return
+
+    usecols = checkColumns(csvPath, len(header["headers"]), usecols)
+    dtype = np.dtype(header["dtype"])
+    _, rowCount = header["shape"]
+    dropped = rejectedRows(header["partial_rows"], len(header["headers"]), usecols)
+    rejected = header["rejected_rows"] + int(dropped.size)
+    with open(path, "rb") as file:
+        for start in range(0, rowCount, rowsPerBlock):
+            count = min(rowsPerBlock, rowCount - start)
+            block = np.empty((len(usecols), count), dtype=dtype)
+            for row, column in enumerate(usecols):
+                file.seek(header["data_offset"] + (column * rowCount + start) * dtype.itemsize)
+                block[row] = np.fromfile(file, dtype=dtype, count=count)
+            inside = dropped[(dropped >= start) & (dropped < start + count)]
+            yield (np.delete(block, inside - start, axis=1) if inside.size else block), rejected
+            rejected = 0
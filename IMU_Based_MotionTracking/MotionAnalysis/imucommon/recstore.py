@@ -0,0 +1,281 @@
+# recstore.py: Local recording store. IMU CSVs are ingested once into chunked binary columns, one folder per device and session, and are
+# read back by time range, so "minutes 30-35 of device X" only touches the chunks that overlap that range instead of parsing the whole CSV.
+#
+# Layout of '<root>/<device>/<session>/':
+#   index.json   headers/names/units, column count, source file info and per chunk: first row, row count, first/last time (s), rejected
+#                rows and the min, max and mean of the acceleration magnitude, so summaries are answered without reading any samples
+#   columns.bin  the chunks one after another, each chunk as (columns x rows) float64 values
+#
+# Every loader that goes through imucommon/reccache.py (processFile, estimate_pose, inspect_data, ...) accepts a source of the form
+#   store://<device>/<session>?start=<s>&end=<s>     (start included, end excluded, both optional, seconds of the time column)
+# The store root is the IMU_STORE environment variable, or MotionAnalysis/store!
+import json
+import os
+import shutil
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+# Local Imports:
+from imucommon.columnar import checkColumns, findAxisColumns, iterCsvBlocks, readCsvHeader, splitHeaderUnit, vectorMagnitude
+from imucommon.parts import MOTION_ANALYSIS_ROOT
+
+STORE_SCHEME = "store"
+STORE_VERSION = 1
+STORE_ROOT_ENV = "IMU_STORE"
+DEFAULT_STORE_ROOT = os.path.join(MOTION_ANALYSIS_ROOT, "store")
+DEFAULT_CHUNK_ROWS = 65536
+INDEX_FILE = "index.json"
+DATA_FILE = "columns.bin"
+DTYPE = np.dtype("<f8")
+
+# Helper function that returns the store root: the argument, the IMU_STORE environment variable or the default folder!
+def storeRoot(root: Optional[str] = None) -> str:
+    return root or os.environ.get(STORE_ROOT_ENV) or DEFAULT_STORE_ROOT
+
+def isStoreUri(source) -> bool:
+    return isinstance(source, str) and source.startswith(STORE_SCHEME + "://")
+
+# Helper function that splits 'store://device/session?start=&end=' into its parts (missing bounds are None)!
+def parseStoreUri(uri: str) -> Dict[str, object]:
+    parts = urlsplit(uri)
+    session = parts.path.strip("/")
+    if parts.scheme != STORE_SCHEME or not parts.netloc or not session or "/" in session:
+        raise ValueError(f"Expected a source like '{STORE_SCHEME}://device/session?start=&end=', got '{uri}'")
+    query = parse_qs(parts.query, keep_blank_values=True)
+    unknown = set(query) - {"start", "end"}
+    if unknown:
+        raise ValueError(f"Unknown store query parameters {sorted(unknown)} in '{uri}', expected start and end")
+    bounds = {}
+    for key in ("start", "end"):
+        value = query.get(key, [""])[-1]
+        try:
+            bounds[key] = float(value) if value != "" else None
+        except ValueError:
+            raise ValueError(f"Store query parameter {key}='{value}' in '{uri}' is not a number of seconds")
+    if bounds["start"] is not None and bounds["end"] is not None and bounds["end"] < bounds["start"]:
+        raise ValueError(f"Store range end {bounds['end']} is before start {bounds['start']} in '{uri}'")
+    return {"device": parts.netloc, "session": session, "start": bounds["start"], "end": bounds["end"]}
+
+def sessionDir(device: str, session: str, root: Optional[str] = None) -> str:
+    return os.path.join(storeRoot(root), device, session)
+
+# Helper function that finds the time column ('time', 'timestamp', ...) in the headers!
+def timeColumn(headers: Sequence[str]) -> Optional[int]:
+    return next((i for i, h in enumerate(headers) if "time" in h.strip().lower()), None)
+
+# Helper function that finds the acceleration x/y/z columns for the magnitude statistics (None when the recording has none)!
+def magnitudeColumns(headers: Sequence[str]) -> Optional[List[int]]:
+    try:
+        return list(findAxisColumns([h.strip().lower() for h in headers]))
+    except ValueError:
+        return None
+
+# Helper function that returns the times of a block of rows: the time column, or row number / rate (row number without a rate)!
+def blockTimes(index: Dict[str, object], block: np.ndarray, firstRow: int) -> np.ndarray:
+    if index["time_column"] is not None:
+        return block[index["time_column"]]
+    return (firstRow + np.arange(block.shape[1])) / (index["rate"] or 1.0)
+
+# 1) Ingesting a CSV as device/session: the file is parsed chunkRows rows at a time, every chunk is appended to columns.bin and described
+# in the index. The session is written to a temporary folder first and replaces an existing one only when complete!
+def ingestRecording(csvPath: str, device: str, session: str, root: Optional[str] = None, chunkRows: int = DEFAULT_CHUNK_ROWS, samplingRate: Optional[float] = None) -> Dict[str, object]:
+    if not device or not session or any(sep in name for name in (device, session) for sep in ("/", "\\", "?")):
+        raise ValueError(f"Device and session must be plain names, got '{device}' and '{session}'")
+    headers, _ = readCsvHeader(csvPath)
+    names, units = zip(*[splitHeaderUnit(h) for h in headers]) if headers else ((), ())
+    stat = os.stat(csvPath)
+    index: Dict[str, object] = {
+        "version": STORE_VERSION,
+        "kind": "imustore",
+        "device": device,
+        "session": session,
+        "headers": list(headers),
+        "names": list(names),
+        "units": list(units),
+        "dtype": DTYPE.str,
+        "columns": len(headers),
+        "time_column": timeColumn(headers),
+        "rate": samplingRate,
+        "magnitude_columns": magnitudeColumns(headers),
+        "source": {"path": os.path.abspath(csvPath), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+    }
+    chunks: Dict[str, List[float]] = {key: [] for key in ("first_row", "rows", "t0", "t1", "rejected", "min", "max", "mean")}
+
+    # 1.1) Writing the chunks and their index entries
+    finalDir = sessionDir(device, session, root)
+    os.makedirs(os.path.dirname(finalDir), exist_ok=True)
+    temporaryDir = f"{finalDir}.{os.getpid()}.tmp"
+    shutil.rmtree(temporaryDir, ignore_errors=True)
+    os.makedirs(temporaryDir)
+    rowCount, rejectedRows, pendingRejected = 0, 0, 0
+    try:
+        with open(os.path.join(temporaryDir, DATA_FILE), "wb") as file:
+            for block, rejected in iterCsvBlocks(csvPath, rowsPerBlock=max(1, int(chunkRows))):
+                rejectedRows += rejected
+                pendingRejected += rejected # rejected rows of blocks without any valid row are counted with the next chunk
+                if len(block) == 0:
+                    continue
+                columns = np.ascontiguousarray(block.T, dtype=DTYPE)
+                times = blockTimes(index, columns, rowCount)
+                chunks["first_row"].append(rowCount)
+                chunks["rows"].append(columns.shape[1])
+                chunks["t0"].append(float(times.min()))
+                chunks["t1"].append(float(times.max()))
+                chunks["rejected"].append(pendingRejected)
+                pendingRejected = 0
+                if index["magnitude_columns"] is not None:
+                    magnitude = vectorMagnitude(*(columns[i] for i in index["magnitude_columns"]))
+                    chunks["min"].append(float(magnitude.min()))
+                    chunks["max"].append(float(magnitude.max()))
+                    chunks["mean"].append(float(magnitude.mean()))
+                columns.tofile(file)
+                rowCount += columns.shape[1]
+        if chunks["rejected"]:
+            chunks["rejected"][-1] += pendingRejected
+        index.update({"rows": rowCount, "rejected_rows": rejectedRows, "chunks": chunks})
+        with open(os.path.join(temporaryDir, INDEX_FILE), "w") as file:
+            json.dump(index, file)
+        shutil.rmtree(finalDir, ignore_errors=True)
+        os.replace(temporaryDir, finalDir)
+    except BaseException:
+        shutil.rmtree(temporaryDir, ignore_errors=True)
+        raise
+    return index
+
+# 2) Reading a session's index, with the per-chunk fields as numpy arrays!
+def loadIndex(device: str, session: str, root: Optional[str] = None) -> Dict[str, object]:
+    path = os.path.join(sessionDir(device, session, root), INDEX_FILE)
+    try:
+        with open(path) as file:
+            index = json.load(file)
+    except FileNotFoundError:
+        raise ValueError(f"No session '{device}/{session}' in the store at {storeRoot(root)}")
+    if index.get("version") != STORE_VERSION or index.get("kind") != "imustore":
+        raise ValueError(f"{path} is not a recording store index of version {STORE_VERSION}")
+    index["chunks"] = {key: np.asarray(values, dtype=np.int64 if key in ("first_row", "rows", "rejected") else np.float64) for key, values in index["chunks"].items()}
+    index["path"] = os.path.dirname(path)
+    return index
+
+# Helper function that lists (device, session) pairs of the store!
+def listSessions(root: Optional[str] = None) -> List[Tuple[str, str]]:
+    base = storeRoot(root)
+    if not os.path.isdir(base):
+        return []
+    return [(device, session) for device in sorted(os.listdir(base)) if os.path.isdir(os.path.join(base, device))
+            for session in sorted(os.listdir(os.path.join(base, device))) if os.path.isfile(os.path.join(base, device, session, INDEX_FILE))]
+
+# 3) Chunks that overlap [start, end), and the ones among them that lie completely inside it (the time index only, no samples)!
+def selectChunks(index: Dict[str, object], start: Optional[float], end: Optional[float]) -> Tuple[np.ndarray, np.ndarray]:
+    t0, t1 = index["chunks"]["t0"], index["chunks"]["t1"]
+    low = -np.inf if start is None else start
+    high = np.inf if end is None else end
+    overlapping = (t1 >= low) & (t0 < high)
+    inside = overlapping & (t0 >= low) & (t1 < high)
+    return np.flatnonzero(overlapping), inside[overlapping]
+
+# Helper function that reads the requested columns of one chunk (one seek and read per column)!
+def readChunk(file, index: Dict[str, object], chunk: int, usecols: Sequence[int]) -> np.ndarray:
+    firstRow, rows = int(index["chunks"]["first_row"][chunk]), int(index["chunks"]["rows"][chunk])
+    block = np.empty((len(usecols), rows), dtype=DTYPE)
+    for row, column in enumerate(usecols):
+        file.seek((firstRow * index["columns"] + column * rows) * DTYPE.itemsize)
+        block[row] = np.fromfile(file, dtype=DTYPE, count=rows)
+    return block
+
+# 4) Reading the rows of [start, end) of the given chunks (default: all overlapping ones), yielding (columns x rows block, times of its rows,
+# rejected rows of the chunk). The edge chunks are trimmed to the rows inside the range by their times!
+def iterRange(index: Dict[str, object], usecols: Sequence[int], start: Optional[float] = None, end: Optional[float] = None, chunks: Optional[np.ndarray] = None) -> Iterator[Tuple[np.ndarray, np.ndarray, int]]:
+    if chunks is None:
+        chunks, _ = selectChunks(index, start, end)
+    timeColumnIndex = index["time_column"]
+    readColumns = list(usecols) + ([timeColumnIndex] if timeColumnIndex is not None else [])
+    low = -np.inf if start is None else start
+    high = np.inf if end is None else end
+    with open(os.path.join(index["path"], DATA_FILE), "rb") as file:
+        for chunk in chunks:
+            block = readChunk(file, index, int(chunk), readColumns)
+            times = block[-1] if timeColumnIndex is not None else blockTimes(index, block, int(index["chunks"]["first_row"][chunk]))
+            if index["chunks"]["t0"][chunk] < low or index["chunks"]["t1"][chunk] >= high:
+                keep = (times >= low) & (times < high)
+                block, times = block[:, keep], times[keep]
+            yield block[:len(usecols)], times, int(index["chunks"]["rejected"][chunk])
+
+# 5) Main function for the loaders: same result as reccache.loadColumns for a 'store://' source!
+def loadStoreColumns(uri: str, usecols: Optional[Sequence[int]] = None, root: Optional[str] = None) -> Dict[str, object]:
+    query = parseStoreUri(uri)
+    index = loadIndex(query["device"], query["session"], root)
+    usecols = checkColumns(uri, index["columns"], usecols)
+    selected = usecols if usecols is not None else list(range(index["columns"]))
+    blocks, rejectedRows = [], 0
+    for block, _, rejected in iterRange(index, selected, query["start"], query["end"]):
+        blocks.append(block)
+        rejectedRows += rejected
+    columns = np.concatenate(blocks, axis=1) if blocks else np.empty((len(selected), 0), dtype=DTYPE)
+    return {
+        "headers": [index["headers"][i] for i in selected],
+        "names": [index["names"][i] for i in selected],
+        "units": [index["units"][i] for i in selected],
+        "columns": columns,
+        "rows": columns.shape[1],
+        "rejected_rows": rejectedRows,
+        "source": uri,
+    }
+
+# Same as reccache.iterColumnBlocks for a 'store://' source: the range in blocks of at most rowsPerBlock rows!
+def iterStoreBlocks(uri: str, usecols: Sequence[int], rowsPerBlock: int = 65536, root: Optional[str] = None) -> Iterator[Tuple[np.ndarray, int]]:
+    query = parseStoreUri(uri)
+    index = loadIndex(query["device"], query["session"], root)
+    usecols = checkColumns(uri, index["columns"], usecols)
+    rowsPerBlock = max(1, int(rowsPerBlock))
+    for block, _, rejected in iterRange(index, usecols, query["start"], query["end"]):
+        for start in range(0, block.shape[1], rowsPerBlock):
+            yield block[:, start:start + rowsPerBlock], rejected
+            rejected = 0
+
+def storeHeaders(uri: str, root: Optional[str] = None) -> List[str]:
+    query = parseStoreUri(uri)
+    return list(loadIndex(query["device"], query["session"], root)["headers"])
+
+# 6) Summary of [start, end) from the index alone: rows, time span and the min/max/mean magnitude over the overlapping chunks (so the span
+# is widened to chunk boundaries). With exact=True the edge chunks that are only partly inside are read and trimmed, at most two chunks!
+def summarize(uri: str, exact: bool = False, root: Optional[str] = None) -> Dict[str, object]:
+    query = parseStoreUri(uri)
+    index = loadIndex(query["device"], query["session"], root)
+    overlapping, inside = selectChunks(index, query["start"], query["end"])
+    chunks = overlapping[inside] if exact else overlapping
+    table = index["chunks"]
+    rows = table["rows"][chunks]
+    parts = {"rows": [rows], "t0": [table["t0"][chunks]], "t1": [table["t1"][chunks]]}
+    hasMagnitude = index["magnitude_columns"] is not None
+    if hasMagnitude:
+        parts.update({"min": [table["min"][chunks]], "max": [table["max"][chunks]], "sum": [table["mean"][chunks] * rows]})
+
+    # 6.1) Partly covered edge chunks (exact mode), from their samples
+    edgeChunks = overlapping[~inside] if exact else overlapping[:0]
+    for block, times, _ in iterRange(index, index["magnitude_columns"] or [], query["start"], query["end"], edgeChunks):
+        if times.size == 0:
+            continue
+        parts["rows"].append(np.array([times.size]))
+        parts["t0"].append(np.array([times.min()]))
+        parts["t1"].append(np.array([times.max()]))
+        if hasMagnitude:
+            magnitude = vectorMagnitude(block[0], block[1], block[2])
+            parts["min"].append(np.array([magnitude.min()]))
+            parts["max"].append(np.array([magnitude.max()]))
+            parts["sum"].append(np.array([magnitude.sum()]))
+    merged = {key: np.concatenate(values) for key, values in parts.items()}
+    rowCount = int(merged["rows"].sum())
+    return {
+        "source": uri,
+        "rows": rowCount,
+        "chunks": int(len(overlapping)),
+        "chunks_read": int(len(edgeChunks)),
+        "exact": exact,
+        "start_s": float(merged["t0"].min()) if rowCount else None,
+        "end_s": float(merged["t1"].max()) if rowCount else None,
+        "magnitude_min": float(merged["min"].min()) if hasMagnitude and rowCount else None,
+        "magnitude_max": float(merged["max"].max()) if hasMagnitude and rowCount else None,
+        "magnitude_mean": float(merged["sum"].sum() / rowCount) if hasMagnitude and rowCount else None,
+    }
@@ -0,0 +1,206 @@
+# resultfiles.py: Writers and a reader for the result tables of the pipelines (orientation angles, detected steps) in three formats:
+#   csv  the text tables as before, but formatted in blocks of rows and written in bulk instead of one csv.writer call per row
+#   npz  numpy archive with one full-precision array per channel, plus the header as JSON
+#   bin  magic 'IMURSULT', header length and JSON header (channels, dtypes, metadata) like the .imucache files, then the rows as packed
+#        records, so a chunked run can append to it and readers can memory-map it
+# A layout is a sequence of (channel name, CSV number format, dtype) triples, e.g. ("time_s", ".6f", "<f8"). The CSV format 'r' writes repr(value),
+# the shortest text that reads back to the same float!
+import json
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Local Imports:
+from imucommon.columnar import readCsvColumns
+from imucommon.reccache import packHeader, readHeader
+
+OUTPUT_FORMATS = ("csv", "npz", "bin")
+OUTPUT_EXTENSIONS = {"csv": ".csv", "npz": ".npz", "bin": ".bin"}
+RESULT_MAGIC = b"IMURSULT"
+RESULT_VERSION = 1
+CSV_BLOCK_ROWS = 65536
+
+# Fixed-point columns ('.<n>f' and 'd') are formatted with array operations up to this many units of the last decimal, larger, non-finite
+# and half-way values (where the rounding of value * 10**n could differ from Python's) are formatted by Python!
+FIXED_MAX_SCALED = 1e12
+
+Layout = Sequence[Tuple[str, str, str]]
+
+# Helper function that rejects unknown output formats!
+def checkOutputFormat(fmt: str) -> str:
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{fmt}', expected one of {OUTPUT_FORMATS}")
+    return fmt
+
+# Helper function that returns '<directory>/<stem>.<extension of fmt>'!
+def outputPath(directory: str, stem: str, fmt: str = "csv") -> str:
+    return os.path.join(directory, stem + OUTPUT_EXTENSIONS[checkOutputFormat(fmt)])
+
+# Helper function that builds the self-describing header of the binary formats!
+def tableHeader(layout: Layout, meta: Optional[Dict[str, object]]) -> Dict[str, object]:
+    return {
+        "version": RESULT_VERSION,
+        "channels": [name for name, _, _ in layout],
+        "dtypes": [np.dtype(dtype).str for _, _, dtype in layout],
+        "meta": meta or {},
+    }
+
+# Base class of the table writers: write(columns) appends the rows of one chunk (columns in layout order), close() finishes the file!
+class TableWriter:
+    file = None
+
+    def write(self, columns: Sequence[Sequence[float]]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+# Helper function that returns the decimals of a fixed-point format ('.3f' -> 3, 'd' -> 0), None for any other format!
+def fixedDecimals(fmt: str) -> Optional[int]:
+    if fmt == "d":
+        return 0
+    match = re.fullmatch(r"\.(\d+)f", fmt)
+    return int(match.group(1)) if match else None
+
+# Helper function that formats one fixed-point column into characters (rows x width bytes, NUL where a shorter value leaves room), None
+# when the column does not fit the format ('d' with float values)!
+def fixedColumnChars(column: Sequence[float], fmt: str, decimals: int) -> Optional[np.ndarray]:
+    values = np.asarray(column)
+    if fmt == "d":
+        if values.dtype.kind not in "iub":
+            return None
+        digits = np.abs(values.astype(np.int64))
+        negative = values < 0
+        special = np.zeros(values.size, dtype=bool)
+    else:
+        values = values.astype(np.float64)
+        negative = np.signbit(values) # Python keeps the sign of values that round to zero ('-0.000')
+        with np.errstate(invalid="ignore", over="ignore"):
+            scaled = np.abs(values) * 10.0 ** decimals
+            special = ~np.isfinite(scaled) | (scaled >= FIXED_MAX_SCALED) | (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-3)
+        digits = np.rint(np.where(special, 0.0, scaled)) # below FIXED_MAX_SCALED every digit below is exact in float64
+
+    # 1.1) All digits at once (most significant first), leading zeros of the integer part become NUL, then sign, integer part, point, decimals
+    digitCount = max(decimals + 1, len(str(int(digits.max(initial=0)))))
+    powers = 10 ** np.arange(digitCount - 1, -1, -1, dtype=np.int64)
+    if fmt == "d":
+        chars = (digits[:, None] // powers % 10).astype(np.uint8)
+    else:
+        quotient = np.empty((values.size, digitCount))
+        np.floor(np.divide(digits[:, None], powers.astype(np.float64), out=quotient), out=quotient)
+        tens = np.floor(quotient * 0.1)
+        tens *= 10.0
+        quotient -= tens
+        chars = quotient.astype(np.uint8)
+    chars += ord("0")
+    leading = digitCount - decimals - 1 # integer digits before the units digit
+    chars[:, :leading] *= digits[:, None] >= (powers[:leading] if fmt == "d" else powers[:leading].astype(np.float64))
+    pieces = [np.where(negative, ord("-"), 0).astype(np.uint8)[:, None], chars[:, :digitCount - decimals]]
+    if decimals > 0:
+        pieces += [np.full((values.size, 1), ord("."), dtype=np.uint8), chars[:, digitCount - decimals:]]
+
+    # 1.2) Special values as Python formats them, NUL-padded to the width
+    texts = {int(i): format(values[i].item(), fmt).encode("ascii") for i in np.flatnonzero(special)}
+    padding = max([len(text) for text in texts.values()] + [0]) - (1 + digitCount + (decimals > 0))
+    if padding > 0:
+        pieces.append(np.zeros((values.size, padding), dtype=np.uint8))
+    chars = np.concatenate(pieces, axis=1)
+    for i, text in texts.items():
+        chars[i] = 0
+        chars[i, :len(text)] = np.frombuffer(text, dtype=np.uint8)
+    return chars
+
+# Helper function that formats a block of fixed-point columns into CSV lines with array operations (same text as str.format), None when a
+# column does not fit its format!
+def formatFixedBlock(block: Sequence[Sequence[float]], formats: Sequence[str], decimals: Sequence[int]) -> Optional[str]:
+    rowCount = len(block[0])
+    parts = []
+    for k, (column, fmt, places) in enumerate(zip(block, formats, decimals)):
+        chars = fixedColumnChars(column, fmt, places)
+        if chars is None:
+            return None
+        separator = b"," if k < len(formats) - 1 else b"\r\n"
+        parts += [chars, np.broadcast_to(np.frombuffer(separator, dtype=np.uint8), (rowCount, len(separator)))]
+    lines = np.concatenate(parts, axis=1)
+    return lines[lines != 0].tobytes().decode("ascii")
+
+# 1) CSV: the header line, then every block of rows formatted at once and written in one call (same bytes as csv.writer). Tables of fixed-point
+# columns only are formatted with array operations, any other layout with one format string per row!
+class CsvTableWriter(TableWriter):
+    def __init__(self, path: str, layout: Layout):
+        self.file = open(path, "w", newline="")
+        self.file.write(",".join(name for name, _, _ in layout) + "\r\n")
+        self.lineFormat = ",".join("{!r}" if fmt == "r" else "{:%s}" % fmt for _, fmt, _ in layout) + "\r\n"
+        self.formats = [fmt for _, fmt, _ in layout]
+        self.decimals = [fixedDecimals(fmt) for fmt in self.formats]
+
+    def write(self, columns: Sequence[Sequence[float]]) -> None:
+        rowCount = min(len(column) for column in columns)
+        for start in range(0, rowCount, CSV_BLOCK_ROWS):
+            stop = min(rowCount, start + CSV_BLOCK_ROWS)
+            block = [column[start:stop] for column in columns]
+            text = formatFixedBlock(block, self.formats, self.decimals) if None not in self.decimals else None
+            if text is None:
+                text = "".join(map(self.lineFormat.format, *[column.tolist() if isinstance(column, np.ndarray) else column for column in block]))
+            self.file.write(text)
+
+# 2) Binary: header, then the rows as packed records, one bulk write per call!
+class BinaryTableWriter(TableWriter):
+    def __init__(self, path: str, layout: Layout, meta: Optional[Dict[str, object]] = None):
+        self.recordType = np.dtype([(name, dtype) for name, _, dtype in layout])
+        self.file = open(path, "wb")
+        self.file.write(packHeader(tableHeader(layout, meta), RESULT_MAGIC))
+
+    def write(self, columns: Sequence[Sequence[float]]) -> None:
+        rowCount = min(len(column) for column in columns)
+        records = np.empty(rowCount, dtype=self.recordType)
+        for name, column in zip(self.recordType.names, columns):
+            records[name] = np.asarray(column)[:rowCount]
+        records.tofile(self.file)
+
+# Main function for chunked writers: a CSV or binary writer whose write(columns) appends rows (npz needs the whole arrays at once)!
+def openTableWriter(path: str, fmt: str, layout: Layout, meta: Optional[Dict[str, object]] = None) -> TableWriter:
+    if checkOutputFormat(fmt) == "npz":
+        raise ValueError("The npz format holds whole arrays and cannot be written chunk by chunk, use 'bin' or 'csv'")
+    return BinaryTableWriter(path, layout, meta) if fmt == "bin" else CsvTableWriter(path, layout)
+
+# Main function: writing whole columns as one table in the given format, returns the path!
+def writeTable(path: str, fmt: str, layout: Layout, columns: Sequence[Sequence[float]], meta: Optional[Dict[str, object]] = None) -> str:
+    if checkOutputFormat(fmt) == "npz":
+        arrays = {name: np.asarray(column, dtype=dtype) for (name, _, dtype), column in zip(layout, columns)}
+        with open(path, "wb") as file: # through a file object, so numpy does not append a second '.npz'
+            np.savez(file, __header__=np.array(json.dumps(tableHeader(layout, meta))), **arrays)
+        return path
+    with openTableWriter(path, fmt, layout, meta) as writer:
+        writer.write(columns)
+    return path
+
+# 3) Reading any of the three formats back: {"format", "channels", "columns" (name -> array), "meta"}. Binary files are memory-mapped,
+# CSV tables carry no metadata and come back as float64 columns!
+def readTable(path: str) -> Dict[str, object]:
+    header = readHeader(path, RESULT_MAGIC)
+    if header is not None:
+        recordType = np.dtype([(name, dtype) for name, dtype in zip(header["channels"], header["dtypes"])])
+        rowCount = (os.path.getsize(path) - header["data_offset"]) // recordType.itemsize
+        records = np.memmap(path, dtype=recordType, mode="r", offset=header["data_offset"], shape=(rowCount,)) if rowCount else np.empty(0, dtype=recordType)
+        return {"format": "bin", "channels": header["channels"], "columns": {name: records[name] for name in header["channels"]}, "meta": header["meta"]}
+
+    with open(path, "rb") as file:
+        isArchive = file.read(4) == b"PK\x03\x04"
+    if isArchive:
+        with np.load(path) as archive:
+            header = json.loads(str(archive["__header__"]))
+            return {"format": "npz", "channels": header["channels"], "columns": {name: archive[name] for name in header["channels"]}, "meta": header["meta"]}
+
+    table = readCsvColumns(path)
+    channels: List[str] = [name.strip() for name in table["headers"]]
+    return {"format": "csv", "channels": channels, "columns": dict(zip(channels, table["columns"])), "meta": {}}
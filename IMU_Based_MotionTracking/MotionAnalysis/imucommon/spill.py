@@ -0,0 +1,99 @@
+# spill.py: Temporary on-disk float64 arrays for the out-of-core (chunked) pipelines, for the statistics that need the whole recording:
+# values are appended chunk by chunk, read back in blocks as often as needed, and order statistics (the median) are found without sorting in memory!
+import tempfile
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+# Candidates of an order statistic are collected in memory once at most this many are left!
+SELECT_MEMORY_VALUES = 1 << 20
+SELECT_BINS = 4096
+
+class SpillFile:
+    def __init__(self, directory: Optional[str] = None):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.size = 0
+
+    def append(self, values) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        self.file.seek(0, 2)
+        values.tofile(self.file)
+        self.size += values.size
+
+    # Reading the values back in blocks of blockSize (the last one may be shorter)!
+    def blocks(self, blockSize: int = 65536) -> Iterator[np.ndarray]:
+        self.file.seek(0)
+        for _ in range(0, self.size, blockSize):
+            yield np.fromfile(self.file, dtype=np.float64, count=blockSize)
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+# Helper function that counts the values inside [low, high] (high excluded unless highInclusive) and their minimum and maximum in one pass!
+def rangeStats(spill: SpillFile, low: float, high: float, highInclusive: bool) -> Tuple[int, float, float]:
+    count, smallest, largest = 0, np.inf, -np.inf
+    for block in spill.blocks():
+        inside = block[(block >= low) & ((block <= high) if highInclusive else (block < high))]
+        if inside.size:
+            count += inside.size
+            smallest, largest = min(smallest, float(inside.min())), max(largest, float(inside.max()))
+    return count, smallest, largest
+
+# Helper function that returns the distinct values inside [low, high] (high excluded unless highInclusive) with how often each occurs!
+def distinctCounts(spill: SpillFile, low: float, high: float, highInclusive: bool) -> Tuple[np.ndarray, np.ndarray]:
+    values, counts = np.empty(0), np.empty(0, dtype=np.int64)
+    for block in spill.blocks():
+        blockValues, blockCounts = np.unique(block[(block >= low) & ((block <= high) if highInclusive else (block < high))], return_counts=True)
+        values, inverse = np.unique(np.concatenate((values, blockValues)), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate((counts, blockCounts)), minlength=values.size).astype(np.int64)
+    return values, counts
+
+# Main function: the k-th smallest spilled value (0-based), the same value np.partition would put at k.
+# Every round counts the candidates in a histogram and keeps only the bin holding rank k, until the candidates fit in memory!
+def selectRank(spill: SpillFile, k: int) -> float:
+    if not 0 <= k < spill.size:
+        raise ValueError(f"Rank {k} is outside of the {spill.size} spilled values")
+    low, high, highInclusive, below = -np.inf, np.inf, True, 0
+    while True:
+        count, smallest, largest = rangeStats(spill, low, high, highInclusive)
+        if smallest == largest:
+            return smallest
+
+        # 1) Few candidates left: collecting and partitioning them
+        if count <= SELECT_MEMORY_VALUES:
+            candidates = np.concatenate([block[(block >= low) & ((block <= high) if highInclusive else (block < high))] for block in spill.blocks()])
+            return float(np.partition(candidates, k - below)[k - below])
+
+        # 2) Range too narrow for SELECT_BINS distinct bin edges (values a few ULPs apart): counting every distinct value instead, there are
+        # at most about as many as the range holds floats
+        if largest - smallest <= SELECT_BINS * 4 * np.spacing(max(abs(smallest), abs(largest))):
+            values, counts = distinctCounts(spill, low, high, highInclusive)
+            return float(values[np.searchsorted(np.cumsum(counts), k - below, side="right")])
+
+        # 3) Histogram over [smallest, largest], then narrowing to the bin of rank k (np.histogram puts v in bin i when edges[i] <= v < edges[i+1],
+        # the last bin is closed, so the same comparisons select the bin's values in the next round)
+        counts = np.zeros(SELECT_BINS, dtype=np.int64)
+        edges = np.histogram_bin_edges([smallest, largest], bins=SELECT_BINS, range=(smallest, largest))
+        for block in spill.blocks():
+            inside = block[(block >= low) & ((block <= high) if highInclusive else (block < high))]
+            counts += np.histogram(inside, bins=edges)[0]
+        cumulative = np.cumsum(counts)
+        binIndex = int(np.searchsorted(cumulative, k - below, side="right"))
+        below += int(cumulative[binIndex - 1]) if binIndex > 0 else 0
+        low, high, highInclusive = float(edges[binIndex]), float(edges[binIndex + 1]), binIndex == SELECT_BINS - 1
+
+# Median of the spilled values, equal to np.median of the same values held in memory!
+def spilledMedian(spill: SpillFile) -> float:
+    if spill.size == 0:
+        raise ValueError("No spilled values to take the median of")
+    middle = spill.size // 2
+    if spill.size % 2:
+        return selectRank(spill, middle)
+    return float(np.mean([selectRank(spill, middle - 1), selectRank(spill, middle)]))
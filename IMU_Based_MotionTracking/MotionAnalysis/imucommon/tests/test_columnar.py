@@ -0,0 +1,24 @@
+# test_columnar.py: Process count of the columnar CSV loader.
+import os
+
+import numpy as np
+
+from imucommon import columnar
+from imucommon.parts import MOTION_ANALYSIS_ROOT, STEP_COUNTER_PART
+
+WALKING_CSV = os.path.join(MOTION_ANALYSIS_ROOT, STEP_COUNTER_PART, "data", "walking.csv")
+
+# Helper class that fails the test when the loader opens its own process pool!
+class NoPool:
+    def __init__(self, *args, **kwargs):
+        raise AssertionError("readCsvColumns opened a process pool inside a worker process")
+
+# Inside a worker process of another pool, even a 'large' file is parsed in that one process, with the same result
+def test_singleProcessInsideWorker(monkeypatch):
+    expected = columnar.readCsvColumns(WALKING_CSV, workers=1)
+    monkeypatch.setattr(columnar, "PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr(columnar, "ProcessPoolExecutor", NoPool)
+    monkeypatch.setattr(columnar.multiprocessing, "parent_process", lambda: object())
+    table = columnar.readCsvColumns(WALKING_CSV)
+    assert table["rows"] == expected["rows"] == 4415
+    assert np.array_equal(table["columns"], expected["columns"])
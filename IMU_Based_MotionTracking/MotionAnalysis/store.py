@@ -0,0 +1,68 @@
+# store.py: Command line of the local recording store (imucommon/recstore.py). Recordings are ingested once per device and session, then any
+# loader reads a time range of them as 'store://device/session?start=&end=' without parsing the CSV again, and summaries come from the index.
+# python store.py ingest Part2_StepCounter/data/walking.csv --device phone1 --session walk1
+# python store.py list
+# python store.py summary "store://phone1/walk1?start=10&end=20" --exact
+# python Part2_StepCounter/main.py --file "store://phone1/walk1?start=10&end=20" --fs 100
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+import numpy as np
+
+# Local Imports:
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from imucommon.recstore import DEFAULT_CHUNK_ROWS, STORE_ROOT_ENV, ingestRecording, listSessions, loadIndex, storeRoot, summarize
+
+# Helper function that formats an optional number for the tables below!
+def formatValue(value: Optional[float], digits: int = 3) -> str:
+    return "-" if value is None else f"{value:.{digits}f}"
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Local recording store: ingest IMU CSVs into chunked binary columns and query them by time range")
+    ap.add_argument("--root", default=None, help=f"Store folder (default: ${STORE_ROOT_ENV} or MotionAnalysis/store)")
+    commands = ap.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Ingest CSV recordings as sessions of a device")
+    ingest.add_argument("files", nargs="+", help="CSV recordings")
+    ingest.add_argument("--device", required=True, help="Device name")
+    ingest.add_argument("--session", default=None, help="Session name (default: the file name, one session per file)")
+    ingest.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help=f"Rows per chunk (default={DEFAULT_CHUNK_ROWS})")
+    ingest.add_argument("--fs", type=float, default=None, help="Sampling rate in Hz, only used for recordings without a time column")
+    commands.add_parser("list", help="List the sessions of the store")
+    summary = commands.add_parser("summary", help="Rows, time span and magnitude min/max/mean of store://device/session?start=&end= from the index")
+    summary.add_argument("sources", nargs="+", help="store:// sources")
+    summary.add_argument("--exact", action="store_true", help="Trim the edge chunks to the range (reads at most two chunks), otherwise whole chunks are summarized")
+    args = ap.parse_args(argv)
+
+    # 1) Ingesting every file as its own session (or the one --session for a single file)!
+    if args.command == "ingest":
+        if args.session and len(args.files) > 1:
+            ap.error("--session names one session, ingest several files without it (their file names are used)")
+        for path in args.files:
+            session = args.session or os.path.splitext(os.path.basename(path))[0]
+            index = ingestRecording(path, args.device, session, root=args.root, chunkRows=args.chunk_rows, samplingRate=args.fs)
+            chunks = index["chunks"]
+            span = f"{chunks['t0'][0]:.3f}-{chunks['t1'][-1]:.3f} s" if index["rows"] else "empty"
+            print(f" Ingested: {path} -> store://{args.device}/{session} ({index['rows']} rows, {len(chunks['rows'])} chunks, {span}, {index['rejected_rows']} rejected)")
+
+    # 2) Listing the sessions with their size and time span, from the indexes!
+    elif args.command == "list":
+        sessions = listSessions(args.root)
+        if not sessions:
+            print(f"No sessions in {storeRoot(args.root)}")
+        for device, session in sessions:
+            index = loadIndex(device, session, args.root)
+            chunks = index["chunks"]
+            span = f"{np.min(chunks['t0']):.3f}-{np.max(chunks['t1']):.3f} s" if index["rows"] else "empty"
+            print(f"store://{device}/{session}: {index['rows']} rows, {len(chunks['rows'])} chunks, {span}, columns {', '.join(index['headers'])}")
+
+    # 3) Summaries of time ranges!
+    else:
+        for source in args.sources:
+            result = summarize(source, exact=args.exact, root=args.root)
+            print(f"{source}: {result['rows']} rows, {formatValue(result['start_s'])}-{formatValue(result['end_s'])} s, magnitude min {formatValue(result['magnitude_min'])} "
+                  f"max {formatValue(result['magnitude_max'])} mean {formatValue(result['magnitude_mean'])} ({result['chunks']} chunks, {result['chunks_read']} read)")
+
+if __name__ == "__main__":
+    main()
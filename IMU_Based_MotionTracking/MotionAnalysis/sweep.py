@@ -0,0 +1,272 @@
+# sweep.py: Parameter sweeps of the step counter (Part 2) and pose estimation (Part 3) that run every pipeline stage once per distinct input.
+# The stages are memoized along their dependencies, so a grid point only pays for the stages its changed parameters reach:
+#   steps  load (file) -> filter (fs, engine) -> threshold (threshold mode, k-auto) -> peaks (threshold, min gap, peak mode)
+#   pose   load (file) -> timing (fs) -> accelerometer tilt (independent of alpha) -> complementary filter (alpha)
+# The shared stages run once in this process, the last stage of every grid point runs in a process pool. With reference step counts the
+# results are scored per grid point.
+# python sweep.py --steps "Part2_StepCounter/data/*.csv" --fs 100 --k-auto 0.4:1.6:0.1 --min-gap-ms 250:500:25 --reference Part2_StepCounter/data/walking.csv=70
+import argparse
+import csv
+import glob
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Local Imports:
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from imucommon.parts import POSE_ESTIMATION_PART, STEP_COUNTER_PART, importPartModule
+
+STEP_GRID_KEYS = ("threshold", "k_auto", "min_gap_ms", "peak_mode")
+STEP_SWEEP_FIELDS = ["file", "threshold", "k_auto", "min_gap_ms", "peak_mode", "steps", "cadence_spm", "reference_steps", "error", "abs_error"]
+SCORE_FIELDS = ["threshold", "k_auto", "min_gap_ms", "peak_mode", "files", "scored_files", "mae", "max_abs_error", "total_steps"]
+POSE_SWEEP_FIELDS = ["file", "alpha", "roll_std_deg", "pitch_std_deg", "accel_rmse_deg"]
+
+# Grid points are handed to a worker in batches of this size!
+POINTS_PER_TASK = 32
+
+# Signals and memoized stages of the recording being swept, set once per worker process by initWorker!
+workerState: Dict[str, object] = {}
+
+def initWorker(state: Dict[str, object]) -> None:
+    workerState.clear()
+    workerState.update(state)
+
+# Helper function that runs task(batch) for every batch of points, in a pool whose workers receive the shared state once!
+def mapPoints(task: Callable[[List[Tuple]], List[Tuple]], points: List[Tuple], state: Dict[str, object], workers: int) -> List[Tuple]:
+    batches = [points[i:i + POINTS_PER_TASK] for i in range(0, len(points), POINTS_PER_TASK)]
+    if workers <= 1 or len(batches) <= 1:
+        initWorker(state)
+        return [result for batch in batches for result in task(batch)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches)), initializer=initWorker, initargs=(state,)) as pool:
+        return [result for results in pool.map(task, batches) for result in results]
+
+# Helper function that parses grid values: every item may be a comma list, numeric items may be inclusive 'start:stop:step' ranges!
+def parseGrid(items: Sequence[str], convert: Callable[[str], object] = str, ranges: bool = True) -> List[object]:
+    values: List[object] = []
+    for item in items:
+        for part in str(item).split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if ranges and part.count(":") == 2:
+                start, stop, step = (float(v) for v in part.split(":"))
+                if step <= 0 or stop < start:
+                    raise ValueError(f"Invalid range '{part}', expected start:stop:step with step > 0 and stop >= start")
+                values.extend(convert(str(round(v, 10))) for v in np.arange(start, stop + step / 2, step))
+            else:
+                values.append(convert(part))
+    return list(dict.fromkeys(values)) # duplicates removed, order kept
+
+# 1) Step counter sweep
+
+# 1.1) Peaks of a batch of (thresholdKey, minPeakDistance, peakMode) points on the filtered signal of the worker state
+def stepPeaksTask(batch: List[Tuple]) -> List[Tuple]:
+    findPeaks = importPartModule(STEP_COUNTER_PART, "modules.peaks").findPeaks
+    signal, thresholds = workerState["signal"], workerState["thresholds"]
+    return [(point, len(findPeaks(signal, thresholds[point[0]], point[1], mode=point[2]))) for point in batch]
+
+# 1.2) Helper function that returns the memo key of a threshold stage: fixed thresholds do not depend on k-auto
+def thresholdKey(parseThresholdMode, threshold: str, kAuto: float, samplingFrequency: Optional[int]) -> Tuple:
+    modeName, modeValue = parseThresholdMode(threshold)
+    if modeName == "auto":
+        return ("auto", kAuto)
+    if modeName == "window":
+        return ("window", int(modeValue * samplingFrequency) if (samplingFrequency and samplingFrequency > 0) else int(modeValue * 50), kAuto)
+    return ("fixed", modeValue)
+
+# Main function: step counts of every (file, grid point), with the same results as processFile for each point. grid maps the keys of
+# STEP_GRID_KEYS to lists of values (missing keys use the CLI defaults); references maps files to their true step count!
+def sweepSteps(files: Sequence[str], grid: Dict[str, Sequence[object]], samplingFrequency: Optional[int] = None, engine: str = "numpy", workers: int = 1,
+               references: Optional[Dict[str, int]] = None, useCache: bool = True) -> Dict[str, object]:
+    dataloader = importPartModule(STEP_COUNTER_PART, "modules.dataloader")
+    filters = importPartModule(STEP_COUNTER_PART, "modules.filters")
+    peaks = importPartModule(STEP_COUNTER_PART, "modules.peaks")
+    stepcounter = importPartModule(STEP_COUNTER_PART, "modules.stepcounter")
+    defaults = {"threshold": ["auto"], "k_auto": [0.8], "min_gap_ms": [350], "peak_mode": ["refractory"]}
+    unknown = set(grid) - set(STEP_GRID_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown step grid keys {sorted(unknown)}, expected {STEP_GRID_KEYS}")
+    for mode in grid.get("peak_mode", ()):
+        if mode not in peaks.PEAK_MODES:
+            raise ValueError(f"Unknown peak mode '{mode}', expected one of {peaks.PEAK_MODES}")
+    points = list(itertools.product(*[list(grid.get(key) or defaults[key]) for key in STEP_GRID_KEYS]))
+    references = {os.path.abspath(path): steps for path, steps in (references or {}).items()}
+    minDistances = {ms: stepcounter.peakDistance(samplingFrequency, ms) for ms in dict.fromkeys(point[2] for point in points)}
+    evaluations = {"load": 0, "filter": 0, "threshold": 0, "peaks": 0}
+    rows: List[Dict[str, object]] = []
+
+    for csvPath in files:
+        # 1) Load and filter, once per file
+        magnitude = dataloader.loadAccelColumns(csvPath, useCache=useCache)["magnitude"]
+        signal = filters.preprocessSteps(magnitude if engine == "numpy" else magnitude.tolist(), samplingFrequency=samplingFrequency, engine=engine)
+        evaluations["load"] += 1
+        evaluations["filter"] += 1
+
+        # 2) One threshold per distinct (mode, k-auto), fixed thresholds once per value
+        keys = {point: thresholdKey(peaks.parseThresholdMode, point[0], point[1], samplingFrequency) for point in points}
+        thresholds: Dict[Tuple, object] = {}
+        for key in dict.fromkeys(keys.values()):
+            if key[0] == "auto":
+                thresholds[key] = float(peaks.dynamicTreshold(signal, tresholdSensitivity=key[1]))
+            elif key[0] == "window":
+                thresholds[key] = peaks.windowedThresholds(signal, key[1], tresholdSensitivity=key[2])
+            else:
+                thresholds[key] = key[1]
+        evaluations["threshold"] += len(thresholds)
+
+        # 3) Peaks once per distinct (threshold, gap in samples, peak mode), in parallel
+        peakPoints = list(dict.fromkeys((keys[point], minDistances[point[2]], point[3]) for point in points))
+        counts = dict(mapPoints(stepPeaksTask, peakPoints, {"signal": signal, "thresholds": thresholds}, workers))
+        evaluations["peaks"] += len(peakPoints)
+
+        reference = references.get(os.path.abspath(csvPath))
+        for point in points:
+            stepCount = counts[(keys[point], minDistances[point[2]], point[3])]
+            _, cadenceSPM = stepcounter.walkingRate(len(signal), stepCount, samplingFrequency)
+            row: Dict[str, object] = dict(zip(STEP_GRID_KEYS, point), file=csvPath, steps=stepCount, cadence_spm=cadenceSPM)
+            if reference is not None:
+                row.update(reference_steps=reference, error=stepCount - reference, abs_error=abs(stepCount - reference))
+            rows.append(row)
+
+    return {"rows": rows, "scores": scorePoints(rows), "points": len(points), "evaluations": evaluations}
+
+# Helper function that scores every grid point over the files with a reference count: mean and largest absolute error, best first!
+def scorePoints(rows: List[Dict[str, object]]) -> List[Dict[str, object]]:
+    grouped: Dict[Tuple, List[Dict[str, object]]] = {}
+    for row in rows:
+        grouped.setdefault(tuple(row[key] for key in STEP_GRID_KEYS), []).append(row)
+    scores = []
+    for point, pointRows in grouped.items():
+        errors = [row["abs_error"] for row in pointRows if row.get("abs_error") is not None]
+        scores.append(dict(zip(STEP_GRID_KEYS, point), files=len(pointRows), scored_files=len(errors), mae=float(np.mean(errors)) if errors else None,
+                           max_abs_error=max(errors) if errors else None, total_steps=sum(row["steps"] for row in pointRows)))
+    if any(score["mae"] is not None for score in scores):
+        scores.sort(key=lambda score: (score["mae"] is None, score["mae"] or 0.0, score["max_abs_error"] or 0))
+    return scores
+
+# 2) Pose sweep
+
+# 2.1) Roll/pitch of a batch of alphas, summarized: spread of the angles and RMS distance from the accelerometer tilt
+def poseAlphaTask(batch: List[Tuple]) -> List[Tuple]:
+    combineIMUDataBatch = importPartModule(POSE_ESTIMATION_PART, "modules.filter").combineIMUDataBatch
+    channels, tilt = workerState["channels"], workerState["tilt"]
+    results = []
+    for (alpha,) in batch:
+        rollDegree, pitchDegree = combineIMUDataBatch(*channels, samplingRate=workerState["fs"], alpha=alpha, gyroUnit=workerState["gyro_unit"], steps=workerState["steps"], accelTilt=tilt)
+        deviation = np.concatenate((rollDegree - tilt[0], pitchDegree - tilt[1]))
+        results.append(((alpha,), {"roll_std_deg": float(np.std(rollDegree)), "pitch_std_deg": float(np.std(pitchDegree)), "accel_rmse_deg": float(np.sqrt(np.mean(deviation * deviation)))}))
+    return results
+
+# Main function: complementary filter roll/pitch statistics of every (file, alpha). Loading, timing and the accelerometer tilt run once per file!
+def sweepPose(files: Sequence[str], alphas: Sequence[float], sampleRate: Optional[float] = None, gyroUnit: str = "rad", gapFactor: float = 5.0, gapMode: str = "reset",
+              workers: int = 1, useCache: bool = True) -> Dict[str, object]:
+    dataloader = importPartModule(POSE_ESTIMATION_PART, "modules.dataloader")
+    poseFilter = importPartModule(POSE_ESTIMATION_PART, "modules.filter")
+    evaluations = {"load": 0, "timing": 0, "tilt": 0, "filter": 0}
+    rows: List[Dict[str, object]] = []
+    alphas = list(dict.fromkeys(alphas))
+    for csvPath in files:
+        loaded = dataloader.load_imu_columns(csvPath, useCache=useCache)
+        channels = [np.array(loaded[name]) for name in dataloader.IMU_CHANNELS[1:]]
+        evaluations["load"] += 1
+        steps = None
+        if not sampleRate:
+            steps = poseFilter.timestampSteps(loaded["timestamp"], gapFactor, gapMode)
+            evaluations["timing"] += 1
+        tilt = poseFilter.computeAccelTiltBatch(*channels[:3])
+        evaluations["tilt"] += 1
+        state = {"channels": channels, "tilt": tilt, "fs": sampleRate, "steps": steps, "gyro_unit": gyroUnit}
+        for (alpha,), stats in mapPoints(poseAlphaTask, [(alpha,) for alpha in alphas], state, workers):
+            rows.append(dict(file=csvPath, alpha=alpha, **stats))
+        evaluations["filter"] += len(alphas)
+    return {"rows": rows, "points": len(alphas), "evaluations": evaluations}
+
+# 3) Writing a result table as CSV!
+def writeRows(path: str, fields: List[str], rows: List[Dict[str, object]]) -> str:
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+# Helper function that reads reference step counts from 'path=steps' items and an optional CSV with 'path' and 'steps' columns!
+def collectReferences(items: Optional[List[str]], manifest: Optional[str]) -> Dict[str, int]:
+    references: Dict[str, int] = {}
+    for item in items or []:
+        path, _, steps = item.rpartition("=")
+        if not path:
+            raise ValueError(f"Invalid reference '{item}', expected <file>=<steps>")
+        references[path] = int(steps)
+    if manifest:
+        with open(manifest, "r", newline="") as file:
+            for record in csv.DictReader(file):
+                references[record["path"].strip()] = int(record["steps"])
+    return references
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Parameter sweeps for the step counter and pose estimation, every stage is computed once per distinct input")
+    ap.add_argument("--steps", action="append", help="Glob of recordings for the step counter sweep (repeatable)")
+    ap.add_argument("--pose", action="append", help="Glob of merged IMU recordings for the alpha sweep (repeatable)")
+    ap.add_argument("--out", default="sweep_outputs", help="Output folder of sweep_steps.csv, sweep_scores.csv and sweep_pose.csv (default: sweep_outputs)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes for the grid points (default: all cores)")
+    ap.add_argument("--fs", type=int, default=50, help="Step counter sampling rate (Hz)")
+    ap.add_argument("--engine", choices=("list", "numpy"), default="numpy", help="Step filter engine: 'list' or 'numpy' (default: numpy)")
+    ap.add_argument("--threshold", nargs="+", default=["auto"], help="Threshold values: 'auto', 'window:<seconds>' or numbers (comma lists allowed)")
+    ap.add_argument("--k-auto", nargs="+", default=["0.8"], help="Auto/windowed threshold multipliers, e.g. 0.5 0.8 or 0.4:1.6:0.1")
+    ap.add_argument("--min-gap-ms", nargs="+", default=["350"], help="Minimum gaps between peaks in ms, e.g. 300,350 or 250:500:25")
+    ap.add_argument("--peak-mode", nargs="+", default=["refractory"], help="Close peaks: refractory and/or merge")
+    ap.add_argument("--reference", action="append", metavar="FILE=STEPS", help="True step count of a recording, the results are scored against it (repeatable)")
+    ap.add_argument("--references", metavar="CSV", help="CSV with 'path' and 'steps' columns of true step counts")
+    ap.add_argument("--pose-fs", type=float, default=None, help="Pose estimation sampling rate (Hz). If omitted, dt is taken from each recording's timestamps")
+    ap.add_argument("--gyro-unit", default="rad", help="Gyro unit: 'rad' or 'deg' (default: rad)")
+    ap.add_argument("--alpha", nargs="+", default=["0.98"], help="Complementary filter alphas, e.g. 0.9:0.99:0.01")
+    ap.add_argument("--no-cache", action="store_true", help="Always parse the CSVs instead of using their binary .imucache sidecars")
+    args = ap.parse_args(argv)
+
+    stepFiles = [path for pattern in args.steps or [] for path in sorted(glob.glob(pattern, recursive=True)) if not path.endswith(".imucache")]
+    poseFiles = [path for pattern in args.pose or [] for path in sorted(glob.glob(pattern, recursive=True)) if not path.endswith(".imucache")]
+    if not stepFiles and not poseFiles:
+        ap.error("no recordings matched --steps/--pose")
+    try:
+        grid = {"threshold": parseGrid(args.threshold, ranges=False), "k_auto": parseGrid(args.k_auto, float), "min_gap_ms": parseGrid(args.min_gap_ms, lambda v: int(float(v))), "peak_mode": parseGrid(args.peak_mode, ranges=False)}
+        alphas = parseGrid(args.alpha, float)
+        references = collectReferences(args.reference, args.references)
+    except ValueError as error:
+        ap.error(str(error))
+    os.makedirs(args.out, exist_ok=True)
+    workers = max(1, args.workers or 1)
+
+    if stepFiles:
+        start = time.perf_counter()
+        result = sweepSteps(stepFiles, grid, samplingFrequency=args.fs, engine=args.engine, workers=workers, references=references, useCache=not args.no_cache)
+        print("\n********** Step Sweep **********")
+        print(f"Recordings  : {len(stepFiles)}")
+        print(f"Grid points : {result['points']}")
+        print(f"Evaluations : " + ", ".join(f"{stage} {count}" for stage, count in result["evaluations"].items()))
+        print(f"Wall time   : {time.perf_counter() - start:.2f} s")
+        print(f"Results     : {writeRows(os.path.join(args.out, 'sweep_steps.csv'), STEP_SWEEP_FIELDS, result['rows'])}")
+        print(f"Scores      : {writeRows(os.path.join(args.out, 'sweep_scores.csv'), SCORE_FIELDS, result['scores'])}")
+        if result["scores"] and result["scores"][0]["mae"] is not None:
+            print("\nBest grid points (mean absolute step error):")
+            for score in result["scores"][:5]:
+                print(f"  threshold={score['threshold']:<10} k_auto={score['k_auto']:<5} min_gap_ms={score['min_gap_ms']:<5} peak_mode={score['peak_mode']:<10} mae={score['mae']:.2f} max={score['max_abs_error']}")
+        print("================================\n")
+
+    if poseFiles:
+        start = time.perf_counter()
+        result = sweepPose(poseFiles, alphas, sampleRate=args.pose_fs, gyroUnit=args.gyro_unit, workers=workers, useCache=not args.no_cache)
+        print("\n********** Pose Sweep **********")
+        print(f"Recordings  : {len(poseFiles)}")
+        print(f"Alphas      : {result['points']}")
+        print(f"Evaluations : " + ", ".join(f"{stage} {count}" for stage, count in result["evaluations"].items()))
+        print(f"Wall time   : {time.perf_counter() - start:.2f} s")
+        print(f"Results     : {writeRows(os.path.join(args.out, 'sweep_pose.csv'), POSE_SWEEP_FIELDS, result['rows'])}")
+        print("================================\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+# test_fused.py: The fused steps + pose pipeline against the Part 2 and Part 3 pipelines run on their own.
+import os
+
+import numpy as np
+import pytest
+
+from fused import runFused
+from imucommon.parts import MOTION_ANALYSIS_ROOT, POSE_ESTIMATION_PART, STEP_COUNTER_PART, importPartModule
+
+stepcounter = importPartModule(STEP_COUNTER_PART, "modules.stepcounter")
+poseEstimator = importPartModule(POSE_ESTIMATION_PART, "modules.poseEstimator")
+
+MERGED_CSV = os.path.join(MOTION_ANALYSIS_ROOT, POSE_ESTIMATION_PART, "data", "mergedWalk.csv")
+
+# The Part 2 loader finds the 'ax', 'ay', 'az' columns of the merged recording, so both parts can run on the same file
+@pytest.mark.parametrize("peakMode", ["refractory", "merge"])
+@pytest.mark.parametrize("filterName", ["complementary", "mahony"])
+def test_fusedMatchesSeparatePipelines(tmp_path, peakMode, filterName):
+    fused = runFused(MERGED_CSV, sampleRate=100.0, peakMode=peakMode, filterName=filterName, includeYaw=True, outputDir=str(tmp_path / "fused"), useCache=False)
+    steps = stepcounter.processFile(MERGED_CSV, samplingFrequency=100, filterEngine="numpy", peakMode=peakMode, useCache=False)
+    pose = poseEstimator.estimate_pose(MERGED_CSV, sampleRate=100.0, engine="numpy", filterName=filterName, includeYaw=True, outputDir=str(tmp_path / "pose"), plot=False, useCache=False)
+    assert steps["steps"] > 0
+    assert fused["peaks"] == steps["peaks"]
+    assert fused["cadence_spm"] == steps["cadence_spm"]
+    peaks = np.asarray(steps["peaks"])
+    np.testing.assert_array_equal(fused["step_time_s"], pose["time_s"][peaks])
+    for name in ("roll_deg", "pitch_deg", "yaw_deg"):
+        np.testing.assert_array_equal(fused["step_" + name], np.asarray(pose[name])[peaks], err_msg=name)